@@ -0,0 +1,74 @@
+"""Sales figures for the admin and seller dashboards.
+
+Each figure is the live aggregate over the hot order tables plus the daily rollups of archived
+orders (see archive.py). Both parts are small: the hot tables only hold recent orders and the
+rollups hold one row per day.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from sqlalchemy import func, desc, union_all
+from app import db
+from models import Order, OrderItem, Payment, Product, DailySales, DailyProductSales, DailySellerSales
+from order_history import seller_order_ids
+
+def _as_date(value):
+    # func.date() returns a date on Postgres and an ISO string on SQLite
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+def order_totals():
+    """(number of orders, sum of order totals) over all time"""
+    hot_count, hot_total = db.session.execute(
+        db.select(func.count(Order.id), func.coalesce(func.sum(Order.total_amount), 0))
+    ).one()
+    cold_count, cold_total = db.session.execute(
+        db.select(func.coalesce(func.sum(DailySales.orders_count), 0), func.coalesce(func.sum(DailySales.orders_total), 0))
+    ).one()
+    return hot_count + cold_count, Decimal(hot_total) + Decimal(cold_total)
+
+def paid_revenue_by_day(start, end):
+    """{date: paid revenue} for start..end inclusive; days without payments are omitted"""
+    revenue = defaultdict(Decimal)
+    day = func.date(Payment.created_at)
+    # Bound the raw column, not date(created_at), so the planner can prune payments partitions
+    since, until = datetime.combine(start, time.min), datetime.combine(end + timedelta(days=1), time.min)
+    for payment_day, amount in db.session.execute(
+            db.select(day, func.sum(Payment.amount))
+            .where(Payment.payment_status == 'paid', Payment.created_at >= since, Payment.created_at < until)
+            .group_by(day)):
+        revenue[_as_date(payment_day)] += Decimal(amount)
+    for rollup_day, amount in db.session.execute(
+            db.select(DailySales.day, DailySales.paid_revenue)
+            .where(DailySales.day >= start, DailySales.day <= end, DailySales.paid_revenue != 0)):
+        revenue[rollup_day] += Decimal(amount)
+    return revenue
+
+def top_products(limit=5):
+    """[{'name', 'total_sold'}] for the best-selling products over all time"""
+    sold = union_all(
+        db.select(OrderItem.product_id.label('product_id'), OrderItem.quantity.label('quantity')),
+        db.select(DailyProductSales.product_id, DailyProductSales.quantity),
+    ).subquery()
+    total_sold = func.sum(sold.c.quantity).label('total_sold')
+    rows = db.session.execute(
+        db.select(Product.name, total_sold)
+        .join(sold, sold.c.product_id == Product.id)
+        .group_by(Product.id, Product.name)
+        .order_by(desc(total_sold))
+        .limit(limit)
+    ).all()
+    return [{'name': name, 'total_sold': total} for name, total in rows]
+
+def seller_totals(super_admin_id):
+    """(orders containing the seller's products, revenue from those products) over all time"""
+    hot_orders = db.session.scalar(db.select(func.count()).select_from(Order).where(Order.id.in_(seller_order_ids(super_admin_id))))
+    hot_revenue = db.session.scalar(
+        db.select(func.coalesce(func.sum(OrderItem.price * OrderItem.quantity), 0))
+        .join(Product, OrderItem.product_id == Product.id)
+        .where(Product.super_admin_id == super_admin_id)
+    )
+    cold_orders, cold_revenue = db.session.execute(
+        db.select(func.coalesce(func.sum(DailySellerSales.orders_count), 0), func.coalesce(func.sum(DailySellerSales.revenue), 0))
+        .where(DailySellerSales.super_admin_id == super_admin_id)
+    ).one()
+    return hot_orders + cold_orders, Decimal(hot_revenue) + Decimal(cold_revenue)
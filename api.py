@@ -0,0 +1,218 @@
+from functools import wraps
+from flask import Blueprint, jsonify, request
+from flask_login import current_user
+from sqlalchemy import desc
+from app import db
+from models import Product, Category, Cart, Wishlist
+from catalog import card_query, load_cards, get_product_detail
+from replicas import read_replica, stick_to_primary
+from cart_pricing import cart_snapshot, guest_snapshot, bump_cart_versions
+from cart_store import MAX_QUANTITY, add_items, move_wishlist_to_cart as move_wishlist_items
+import guest_cart
+
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+MAX_PAGE_SIZE = 100
+
+def api_login_required(f):
+    """Like login_required, but answers 401 JSON instead of redirecting to the login page"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return jsonify(error='authentication required'), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+def api_error(message, status=400):
+    return jsonify(error=message), status
+
+def conditional(payload, etag=None):
+    """JSON response with a weak ETag that answers If-None-Match with 304"""
+    response = jsonify(payload)
+    if etag:
+        response.set_etag(etag, weak=True)
+    else:
+        response.add_etag(weak=True) # Hash of the body
+    response.headers['Cache-Control'] = 'no-cache' # Cacheable, but always revalidate
+    return response.make_conditional(request)
+
+def card_to_dict(card):
+    return {
+        'id': card.id,
+        'name': card.name,
+        'price': float(card.price),
+        'original_price': float(card.original_price) if card.original_price else None,
+        'image_url': card.image_url,
+        'ratings': float(card.ratings or 0),
+        'sales_count': card.sales_count or 0,
+        'stock': card.stock,
+        'category': card.category_name,
+    }
+
+def cart_payload():
+    """The logged-in user's cart, or the guest cart of an anonymous visitor"""
+    if current_user.is_authenticated:
+        cart = cart_snapshot(current_user.id)
+    else:
+        cart = guest_snapshot(guest_cart.quantities())
+    items = [{
+        'id': line.id,
+        'product_id': line.product_id,
+        'name': line.name,
+        'price': float(line.price),
+        'quantity': line.quantity,
+        'line_total': float(line.line_total),
+    } for line in cart.lines]
+    return {
+        'items': items,
+        'count': cart.count,
+        'subtotal': float(cart.subtotal),
+        'discount': float(cart.discount),
+        'total': float(cart.total),
+        'version': cart.version,
+    }
+
+@api_bp.route('/categories')
+@read_replica
+def categories():
+    rows = db.session.execute(db.select(Category.id, Category.name).order_by(Category.name)).all()
+    return conditional([{'id': row.id, 'name': row.name} for row in rows])
+
+@api_bp.route('/products')
+@read_replica
+def products():
+    category_id = request.args.get('category', type=int)
+    search = request.args.get('search')
+    sort_by = request.args.get('sort_by')
+    limit = min(request.args.get('limit', 20, type=int), MAX_PAGE_SIZE)
+
+    query = card_query().where(Product.is_active == True)
+    if category_id:
+        query = query.where(Product.category_id == category_id)
+    if search:
+        query = query.where(Product.name.contains(search))
+
+    ordering = {
+        'price_asc': Product.price.asc(),
+        'price_desc': Product.price.desc(),
+        'name_asc': Product.name.asc(),
+        'name_desc': Product.name.desc(),
+        'newest': desc(Product.created_at),
+        'trending': desc(Product.sales_7d), # Units sold in the last 7 days; indexed per category
+    }
+    # Unlike the HTML page there is no random default, so identical requests can revalidate
+    query = query.order_by(ordering.get(sort_by, Product.id.asc())).limit(limit)
+    return conditional([card_to_dict(card) for card in load_cards(query)])
+
+@api_bp.route('/products/<int:product_id>')
+@read_replica
+def product(product_id):
+    detail = get_product_detail(product_id)
+    return conditional({
+        'id': detail.id,
+        'name': detail.name,
+        'description': detail.description,
+        'price': float(detail.price),
+        'original_price': float(detail.original_price) if detail.original_price else None,
+        'stock': detail.stock,
+        'brand': detail.brand,
+        'category': detail.category_name,
+        'images': [image.image_url for image in detail.product_images],
+    }, etag=f'product-{detail.id}-v{detail.version}')
+
+def add_to_current_cart(quantities):
+    """Add {product id: units} to the user's cart, or to the guest cart without a write. Returns what was added."""
+    if not current_user.is_authenticated:
+        return guest_cart.add(quantities)
+    added = add_items(current_user.id, quantities)
+    db.session.commit()
+    return added
+
+@api_bp.route('/cart')
+def cart():
+    return jsonify(cart_payload())
+
+@api_bp.route('/cart', methods=['POST'])
+def add_to_cart():
+    data = request.get_json(silent=True) or {}
+    product_id = data.get('product_id')
+    quantity = data.get('quantity', 1)
+    if not isinstance(product_id, int) or not isinstance(quantity, int) or quantity < 1:
+        return api_error('product_id and a positive integer quantity are required')
+    if not add_to_current_cart({product_id: quantity}):
+        if not current_user.is_authenticated and len(guest_cart.quantities()) >= guest_cart.MAX_LINES:
+            return api_error('the guest cart is full; log in to add more products', 409)
+        return api_error('product not found', 404)
+    return jsonify(cart_payload())
+
+@api_bp.route('/cart/items', methods=['POST'])
+def add_cart_items():
+    """Add several products at once: {"items": [{"product_id": 3, "quantity": 2}, ...]}.
+
+    Products that are not for sale are skipped and listed in "skipped".
+    """
+    data = request.get_json(silent=True) or {}
+    quantities = {}
+    for entry in data.get('items') or []:
+        if (not isinstance(entry, dict) or not isinstance(entry.get('product_id'), int)
+                or not isinstance(entry.get('quantity', 1), int) or entry.get('quantity', 1) < 1):
+            return api_error('each item needs an integer product_id and a positive integer quantity')
+        quantities[entry['product_id']] = quantities.get(entry['product_id'], 0) + entry.get('quantity', 1)
+    if not quantities:
+        return api_error('no items to add')
+    added = add_to_current_cart(quantities)
+    return jsonify({**cart_payload(), 'skipped': sorted(set(quantities) - set(added))})
+
+@api_bp.route('/cart', methods=['PATCH'])
+def update_cart():
+    """Set quantities for several cart lines at once: {"items": [{"id": 3, "quantity": 2}, ...]}.
+
+    A quantity of 0 or less removes the line and larger ones are capped at MAX_QUANTITY. Guest cart
+    lines are identified by product id.
+    """
+    data = request.get_json(silent=True) or {}
+    updates = {}
+    for entry in data.get('items') or []:
+        if not isinstance(entry, dict) or not isinstance(entry.get('id'), int) or not isinstance(entry.get('quantity'), int):
+            return api_error('each item needs an integer id and quantity')
+        updates[entry['id']] = entry['quantity'] # Last write for a line wins
+    if not updates:
+        return api_error('no items to update')
+    if not current_user.is_authenticated:
+        guest_cart.set_quantities(updates)
+        return jsonify(cart_payload())
+
+    cart_items = Cart.query.filter(Cart.user_id == current_user.id, Cart.id.in_(updates)).all()
+    for cart_item in cart_items:
+        quantity = updates[cart_item.id]
+        if quantity > 0:
+            cart_item.quantity = min(quantity, MAX_QUANTITY)
+        else:
+            db.session.delete(cart_item)
+    if cart_items:
+        bump_cart_versions([current_user.id])
+    db.session.commit()
+    return jsonify(cart_payload())
+
+@api_bp.route('/wishlist/move-to-cart', methods=['POST'])
+@api_login_required
+def move_wishlist_to_cart():
+    moved = move_wishlist_items(current_user.id)
+    db.session.commit()
+    return jsonify({**cart_payload(), 'moved': moved})
+
+@api_bp.route('/wishlist/<int:product_id>/toggle', methods=['POST'])
+@api_login_required
+def toggle_wishlist(product_id):
+    existing = Wishlist.query.filter_by(user_id=current_user.id, product_id=product_id).first()
+    if existing:
+        db.session.delete(existing)
+        wishlisted = False
+    else:
+        if not db.session.scalar(db.select(Product.id).where(Product.id == product_id, Product.is_active == True)):
+            return api_error('product not found', 404)
+        db.session.add(Wishlist(user_id=current_user.id, product_id=product_id))
+        wishlisted = True
+    db.session.commit()
+    stick_to_primary()
+    return jsonify(product_id=product_id, wishlisted=wishlisted)
@@ -6,9 +6,14 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
-from supabase import create_client, Client
+from werkzeug.local import LocalProxy
+import threading
+import click
 import uuid # Import the uuid module
+from datetime import datetime
 from flask_mail import Mail # Import Flask-Mail
+from replicas import RoutingSession, replica_binds
+from dbpool import engine_options
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
@@ -20,14 +25,24 @@ class Base(DeclarativeBase):
     pass
 
 # Initialize extensions
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 mail = Mail() # Initialize Flask-Mail
 
-# Initialize Supabase client
-supabase_url = os.environ.get("SUPABASE_URL")
-supabase_key = os.environ.get("SUPABASE_KEY")
-supabase_client: Client = create_client(supabase_url, supabase_key)
+# Supabase client, built on first use so importing the app needs neither the network nor the env vars
+_supabase_client = None
+_supabase_client_lock = threading.Lock()
+
+def get_supabase_client():
+    global _supabase_client
+    if _supabase_client is None:
+        with _supabase_client_lock:
+            if _supabase_client is None:
+                from supabase import create_client # Importing supabase is slow too, so defer it as well
+                _supabase_client = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+    return _supabase_client
+
+supabase_client = LocalProxy(get_supabase_client)
 
 def create_app():
     # Create the app
@@ -37,17 +52,69 @@ def create_app():
     
     # Configure the database
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "pool_recycle": 300,
-        "pool_pre_ping": True,
-    }
+    # Pool size, overflow, timeout, LIFO and pre-ping come from the environment; see dbpool.py
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"], os.environ)
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Read replicas for analytics and catalog pages; see replicas.py
+    app.config["SQLALCHEMY_BINDS"] = replica_binds(os.environ.get("DATABASE_REPLICA_URLS"), os.environ)
+    app.config["REPLICA_MAX_LAG"] = float(os.environ.get("REPLICA_MAX_LAG", 5)) # Seconds behind before reads fall back to the primary
+    app.config["REPLICA_CHECK_INTERVAL"] = float(os.environ.get("REPLICA_CHECK_INTERVAL", 5)) # Seconds between lag/health probes
+    app.config["REPLICA_STICKY_SECONDS"] = int(os.environ.get("REPLICA_STICKY_SECONDS", 15)) # Primary-only reads after a checkout
     
     # Configure Supabase credentials
     app.config["SUPABASE_URL"] = os.environ.get("SUPABASE_URL")
     app.config["SUPABASE_KEY"] = os.environ.get("SUPABASE_KEY")
     app.config["SUPABASE_PRODUCTS_BUCKET"] = os.environ.get("SUPABASE_PRODUCTS_BUCKET", "product-images") # Default to 'product-images'
     app.config["SUPABASE_SERVICE_ROLE_KEY"] = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    # 'sync' signs super admins in (and new accounts up) with Supabase inline. 'background' takes it off the request path, but the
+    # tokens stay in the worker that signed in, so only use it with a single worker process (WEB_CONCURRENCY=1)
+    app.config["SUPABASE_LOGIN_MODE"] = os.environ.get("SUPABASE_LOGIN_MODE", "sync")
+
+    # Configure password hashing and login throttling
+    # Werkzeug's default ('scrypt' = 'scrypt:32768:8:1'). A cheaper cost such as 'scrypt:16384:8:1' halves login CPU for new
+    # hashes; stored hashes that are already stronger are kept as they are
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config['LOGIN_RATE_LIMIT'] = int(os.environ.get('LOGIN_RATE_LIMIT', 10)) # Attempts allowed in a burst
+    app.config['LOGIN_RATE_PERIOD'] = int(os.environ.get('LOGIN_RATE_PERIOD', 300)) # Seconds to refill a full burst
+
+    # Configure HTTP caching of public catalog pages
+    app.config['PUBLIC_PAGE_MAX_AGE'] = int(os.environ.get('PUBLIC_PAGE_MAX_AGE', 0)) # Browsers revalidate every time
+    app.config['PUBLIC_PAGE_S_MAXAGE'] = int(os.environ.get('PUBLIC_PAGE_S_MAXAGE', 30)) # Shared caches (CDN) may reuse for this long
+    app.config['CATALOG_ETAG_TTL'] = int(os.environ.get('CATALOG_ETAG_TTL', 5))
+    app.config['RELEASE_VERSION'] = os.environ.get('RELEASE_VERSION', 'dev') # Part of every page ETag, so a deploy invalidates them
+
+    # Serve fingerprinted assets from static/dist when `flask build-assets` has produced a manifest
+    app.config['USE_ASSET_MANIFEST'] = os.environ.get('USE_ASSET_MANIFEST', 'true').lower() in ['true', 'on', '1']
+
+    # Configure response compression and streaming of long pages
+    app.config['COMPRESS_ENABLED'] = os.environ.get('COMPRESS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 500)) # Bytes; smaller bodies are sent as-is
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+    app.config['STREAM_LONG_PAGES'] = os.environ.get('STREAM_LONG_PAGES', 'true').lower() in ['true', 'on', '1']
+    app.config['STREAM_CHUNK_SIZE'] = int(os.environ.get('STREAM_CHUNK_SIZE', 16384))
+
+    # Configure order history pages
+    app.config['ORDER_PAGE_SIZE'] = int(os.environ.get('ORDER_PAGE_SIZE', 20))
+    app.config['ORDER_COUNT_TTL'] = int(os.environ.get('ORDER_COUNT_TTL', 60)) # Seconds a cached per-status count may lag
+    app.config['ARCHIVE_AFTER_MONTHS'] = int(os.environ.get('ARCHIVE_AFTER_MONTHS', 24)) # Default age for `flask archive-orders`
+    app.config['PARTITION_MONTHS_AHEAD'] = int(os.environ.get('PARTITION_MONTHS_AHEAD', 3)) # Monthly partitions kept ready on Postgres
+    app.config['ORDER_BULK_LIMIT'] = int(os.environ.get('ORDER_BULK_LIMIT', 1000)) # Orders one bulk status update may move
+
+    # Configure trending lists
+    app.config['TRENDING_TTL'] = int(os.environ.get('TRENDING_TTL', 60)) # Seconds a cached top-N list may lag checkouts
+
+    # Configure checkout
+    app.config['CART_SNAPSHOT_TTL'] = int(os.environ.get('CART_SNAPSHOT_TTL', 600)) # Seconds the prices on a checkout page are honoured
+
+    # Configure "customers also bought" recommendations
+    app.config['RECOMMENDATIONS_K'] = int(os.environ.get('RECOMMENDATIONS_K', 10)) # Recommendations stored per product
+    app.config['RECOMMENDATION_MIN_SUPPORT'] = int(os.environ.get('RECOMMENDATION_MIN_SUPPORT', 2)) # Orders two products must share
+
+    # Configure the admin's super admin list
+    app.config['SELLER_PAGE_SIZE'] = int(os.environ.get('SELLER_PAGE_SIZE', 50))
+
+    # Configure bulk product import/export
+    app.config['IMPORT_CHUNK_SIZE'] = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000)) # Rows validated and inserted per transaction
 
     # Configure Flask-Mail
     app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER')
@@ -56,11 +123,29 @@ def create_app():
     app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
     app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
     app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER')
+    app.config['OUTBOX_BATCH_SIZE'] = int(os.environ.get('OUTBOX_BATCH_SIZE', 100)) # Queued emails sent per SMTP connection
+    app.config['OUTBOX_MAX_ATTEMPTS'] = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5)) # Tries before a queued email is given up on
     
     # Initialize extensions with app
     db.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app) # Initialize Flask-Mail with the app
+    import assets
+    assets.init_app(app)
+    import compression
+    compression.init_app(app)
+    import archive
+    archive.init_app(app)
+    import partitions
+    partitions.init_app(app)
+    import sales_counters
+    sales_counters.init_app(app)
+    import category_counts
+    category_counts.init_app(app)
+    import recommender
+    recommender.init_app(app)
+    import outbox
+    outbox.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     login_manager.login_message_category = 'info'
@@ -68,12 +153,12 @@ def create_app():
     # Import and register blueprints
     from routes import main_bp
     from auth import auth_bp
-    # from api import api_bp # Commented out as api.py not found or not in use
+    from api import api_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
-    # from api import api_bp # Commented out as api.py not found or not in use
-    # app.register_blueprint(api_bp) # Commented out as api.py not found or not in use
+    app.register_blueprint(api_bp)
+    app.json.compact = True # No pretty-printing of API responses, even in debug
 
     @login_manager.user_loader
     def load_user(user_id):
@@ -85,9 +170,33 @@ def create_app():
         from models import Category
         all_categories = Category.query.all()
         return dict(all_categories=all_categories)
+
+    @app.cli.command('bootstrap')
+    def bootstrap_command():
+        """Create tables, default categories and the admin user. Run once per deploy, not per worker."""
+        init_db_and_admin(app)
+        click.echo('Database bootstrapped.')
     
     return app # Return the app instance for Gunicorn
 
+def seed_categories(names):
+    """Insert any missing categories in one statement, leaving existing ones untouched"""
+    from models import Category
+    rows = [{'name': name, 'description': f'{name} products', 'created_at': datetime.utcnow()} for name in names]
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        db.session.execute(insert(Category.__table__).on_conflict_do_nothing(index_elements=['name']), rows)
+    else:
+        existing = set(db.session.scalars(db.select(Category.name).where(Category.name.in_(names))))
+        missing = [row for row in rows if row['name'] not in existing]
+        if missing:
+            db.session.execute(db.insert(Category.__table__), missing)
+    db.session.commit()
+
 def init_db_and_admin(app):
     with app.app_context():
         # Import models to ensure they are registered
@@ -97,18 +206,13 @@ def init_db_and_admin(app):
         db.create_all()
         
         # Add default categories if they don't exist
-        from models import Category
         default_categories = [
             "Electronics", "Books", "Clothing", "Home & Kitchen", "Beauty & Personal Care",
             "Sports & Outdoors", "Toys & Games", "Automotive", "Pet Supplies", "Health & Household",
             "Movies & TV", "Music", "Video Games", "Garden & Outdoor", "Baby Products",
             "Office Products", "Industrial & Scientific", "Handmade", "Collectibles & Fine Art"
         ]
-        for cat_name in default_categories:
-            if not Category.query.filter_by(name=cat_name).first():
-                category = Category(name=cat_name, description=f'{cat_name} products')
-                db.session.add(category)
-        db.session.commit()
+        seed_categories(default_categories)
         
         # Create default admin user if it doesn't exist
         from models import User
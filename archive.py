@@ -0,0 +1,127 @@
+"""Archival of cold orders.
+
+`flask --app main archive-orders --months 24` moves delivered and cancelled orders older than that,
+with their items and payments, into the *_archive tables. Each batch is folded into the daily rollups
+(daily_sales, daily_product_sales, daily_seller_sales) in the same transaction that deletes it from
+the hot tables, so analytics.py (hot tables + rollups) reports the same totals before and after.
+"""
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+import click
+from app import db
+from models import (Order, OrderItem, Payment, Product, OrderArchive, OrderItemArchive, PaymentArchive,
+                    DailySales, DailyProductSales, DailySellerSales)
+
+# Orders that can no longer change; anything still in flight stays in the hot tables however old it is
+ARCHIVABLE_STATUSES = ('delivered', 'cancelled')
+
+def months_ago(months, now=None):
+    """Midnight on the first day of the month `months` before now, so archived days are always complete"""
+    now = now or datetime.utcnow()
+    month_index = now.year * 12 + now.month - 1 - months
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+def archivable_orders(cutoff):
+    return db.select(Order.id).where(Order.created_at < cutoff, Order.status.in_(ARCHIVABLE_STATUSES))
+
+def _copy(source, target, ids_column, ids):
+    columns = [column.name for column in source.__table__.columns]
+    db.session.execute(
+        db.insert(target.__table__).from_select(columns, db.select(*source.__table__.columns).where(ids_column.in_(ids)))
+    )
+
+def accumulate(model, keys, rows):
+    """Add each row's counters onto the rollup row with the same keys, creating it if missing"""
+    if not rows:
+        return
+    table = model.__table__
+    counters = [name for name in rows[0] if name not in keys]
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=keys,
+                                          set_={name: table.c[name] + stmt.excluded[name] for name in counters})
+        db.session.execute(stmt, rows)
+    else:
+        for row in rows:
+            updated = db.session.execute(
+                db.update(table).where(*[table.c[key] == row[key] for key in keys])
+                .values({name: table.c[name] + row[name] for name in counters})
+            ).rowcount
+            if not updated:
+                db.session.execute(db.insert(table), [row])
+
+def _roll_up(order_ids):
+    daily = defaultdict(lambda: {'orders_count': 0, 'orders_total': Decimal('0'), 'paid_revenue': Decimal('0')})
+    for created_at, total_amount in db.session.execute(
+            db.select(Order.created_at, Order.total_amount).where(Order.id.in_(order_ids))):
+        day = daily[created_at.date()]
+        day['orders_count'] += 1
+        day['orders_total'] += total_amount
+    for created_at, amount in db.session.execute(
+            db.select(Payment.created_at, Payment.amount)
+            .where(Payment.order_id.in_(order_ids), Payment.payment_status == 'paid')):
+        daily[created_at.date()]['paid_revenue'] += amount
+
+    products = defaultdict(lambda: {'quantity': 0, 'revenue': Decimal('0')})
+    sellers = defaultdict(lambda: {'orders': set(), 'revenue': Decimal('0')})
+    for order_id, created_at, product_id, super_admin_id, quantity, price in db.session.execute(
+            db.select(Order.id, Order.created_at, OrderItem.product_id, Product.super_admin_id, OrderItem.quantity, OrderItem.price)
+            .join(OrderItem, OrderItem.order_id == Order.id)
+            .outerjoin(Product, OrderItem.product_id == Product.id)
+            .where(Order.id.in_(order_ids))):
+        day = created_at.date()
+        products[(day, product_id)]['quantity'] += quantity
+        products[(day, product_id)]['revenue'] += price * quantity
+        if super_admin_id:
+            sellers[(day, super_admin_id)]['orders'].add(order_id)
+            sellers[(day, super_admin_id)]['revenue'] += price * quantity
+
+    accumulate(DailySales, ['day'], [dict(day=day, **totals) for day, totals in daily.items()])
+    accumulate(DailyProductSales, ['day', 'product_id'],
+               [dict(day=day, product_id=product_id, **totals) for (day, product_id), totals in products.items()])
+    accumulate(DailySellerSales, ['day', 'super_admin_id'],
+               [{'day': day, 'super_admin_id': seller_id, 'orders_count': len(totals['orders']), 'revenue': totals['revenue']}
+                for (day, seller_id), totals in sellers.items()])
+
+def archive_batch(order_ids):
+    """Copy, roll up and delete one batch of orders. Part of the caller's transaction."""
+    _roll_up(order_ids)
+    _copy(Order, OrderArchive, Order.id, order_ids)
+    _copy(OrderItem, OrderItemArchive, OrderItem.order_id, order_ids)
+    _copy(Payment, PaymentArchive, Payment.order_id, order_ids)
+    for model, column in ((Payment, Payment.order_id), (OrderItem, OrderItem.order_id), (Order, Order.id)):
+        db.session.execute(db.delete(model).where(column.in_(order_ids)).execution_options(synchronize_session=False))
+
+def archive_orders(cutoff, batch_size=500, log=print):
+    """Archive every archivable order created before cutoff, committing after each batch. Returns the count."""
+    archived = 0
+    while True:
+        order_ids = db.session.scalars(archivable_orders(cutoff).order_by(Order.id).limit(batch_size)).all()
+        if not order_ids:
+            return archived
+        archive_batch(order_ids)
+        db.session.commit()
+        archived += len(order_ids)
+        log(f"Archived {archived} orders (up to #{order_ids[-1]})")
+
+def init_app(app):
+    @app.cli.command('archive-orders')
+    @click.option('--months', default=lambda: app.config['ARCHIVE_AFTER_MONTHS'], type=int,
+                  help='Archive delivered/cancelled orders placed before the start of the month this many months ago.')
+    @click.option('--batch-size', default=500, help='Orders moved per transaction.')
+    @click.option('--dry-run', is_flag=True, help='Only count what would be archived.')
+    def archive_orders_command(months, batch_size, dry_run):
+        """Move cold orders to the archive tables and fold them into the daily rollups."""
+        cutoff = months_ago(months)
+        if dry_run:
+            count = db.session.scalar(db.select(db.func.count()).select_from(archivable_orders(cutoff).subquery()))
+            click.echo(f'{count} orders placed before {cutoff:%Y-%m-%d} would be archived.')
+            return
+        archived = archive_orders(cutoff, batch_size=batch_size, log=click.echo)
+        click.echo(f'Archived {archived} orders placed before {cutoff:%Y-%m-%d}.')
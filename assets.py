@@ -0,0 +1,163 @@
+"""Static asset pipeline.
+
+`flask --app main build-assets` copies everything under static/ into static/dist/ with a content
+hash in the filename. It also minifies CSS, writes .gz/.br siblings for text assets and WebP
+versions of raster images, and records the mapping in static/dist/manifest.json.
+
+At runtime, when the manifest exists, url_for('static', filename=...) resolves to the fingerprinted
+file. Those are served with a one-year immutable Cache-Control and the best precompressed encoding
+the client accepts. Without a manifest everything behaves as before.
+
+Pillow (WebP) and brotli (.br) are optional; the build skips those outputs when they are missing.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import click
+from flask import current_app, request, send_from_directory, url_for, abort
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+RASTER = {'.png', '.jpg', '.jpeg'}
+ONE_YEAR = 365 * 24 * 3600
+
+_STRING_OR_COMMENT = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+_STRING = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+
+def minify_css(css):
+    """Drop comments and redundant whitespace, leaving string literals (e.g. data URIs) untouched"""
+    css = _STRING_OR_COMMENT.sub(lambda m: m.group(1) or '', css)
+    parts = _STRING.split(css)
+    for i in range(0, len(parts), 2): # Even indices are outside strings
+        segment = re.sub(r'\s+', ' ', parts[i])
+        segment = re.sub(r'\s*([{};,>])\s*', r'\1', segment)
+        parts[i] = segment.replace(';}', '}')
+    return ''.join(parts).strip()
+
+def _fingerprinted(relative_path, digest, ext=None):
+    stem, original_ext = os.path.splitext(relative_path)
+    return f"{stem}.{digest}{ext or original_ext}"
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def _precompress(path, data):
+    written = []
+    _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    written.append('gzip')
+    try:
+        import brotli
+    except ImportError:
+        return written
+    _write(path + '.br', brotli.compress(data, quality=11))
+    written.append('br')
+    return written
+
+def _to_webp(source_path, target_path, max_size, quality):
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+    with Image.open(source_path) as image:
+        image.thumbnail((max_size, max_size))
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        image.save(target_path, 'WEBP', quality=quality, method=6)
+    return True
+
+def build(static_folder, max_image_size=1920, webp_quality=80, log=print):
+    """Fingerprint, minify and precompress everything under static_folder into static_folder/dist"""
+    dist = os.path.join(static_folder, DIST_DIR)
+    manifest = {'files': {}, 'webp': {}}
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root) == os.path.abspath(static_folder):
+            dirs[:] = [d for d in dirs if d != DIST_DIR]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            ext = os.path.splitext(name)[1].lower()
+            with open(source, 'rb') as f:
+                data = f.read()
+            if ext == '.css':
+                data = minify_css(data.decode('utf-8')).encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            target = _fingerprinted(relative, digest)
+            _write(os.path.join(dist, target), data)
+            manifest['files'][relative] = target
+            notes = []
+            if ext in COMPRESSIBLE:
+                notes += _precompress(os.path.join(dist, target), data)
+            if ext in RASTER:
+                webp_target = _fingerprinted(relative, digest, '.webp')
+                if _to_webp(source, os.path.join(dist, webp_target), max_image_size, webp_quality):
+                    manifest['webp'][relative] = webp_target
+                    notes.append(f"webp {os.path.getsize(os.path.join(dist, webp_target)) // 1024} KB")
+            log(f"{relative} -> {target} ({len(data) // 1024} KB{', ' + ', '.join(notes) if notes else ''})")
+    _write(os.path.join(dist, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _rewrite_static_url(endpoint, values):
+    if endpoint != 'static':
+        return
+    manifest = current_app.extensions.get('asset_manifest')
+    filename = values.get('filename')
+    if manifest and filename in manifest['files']:
+        values['filename'] = f"{DIST_DIR}/{manifest['files'][filename]}"
+
+def webp_url(filename):
+    """URL of the WebP version of a static raster image, or None if the build did not make one"""
+    manifest = current_app.extensions.get('asset_manifest')
+    if manifest and filename in manifest['webp']:
+        return url_for('static', filename=f"{DIST_DIR}/{manifest['webp'][filename]}")
+    return None
+
+def send_asset(filename):
+    """Serve a fingerprinted file, preferring a precompressed variant the client accepts"""
+    dist = os.path.join(current_app.static_folder, DIST_DIR)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    candidates = [('br', '.br'), ('gzip', '.gz')] if os.path.splitext(filename)[1].lower() in COMPRESSIBLE else []
+    encoding, served = None, filename
+    for name, suffix in candidates:
+        if request.accept_encodings[name] and os.path.isfile(os.path.join(dist, filename + suffix)):
+            encoding, served = name, filename + suffix
+            break
+    if not os.path.isfile(os.path.join(dist, served)):
+        abort(404)
+    response = send_from_directory(dist, served, mimetype=mimetype, max_age=ONE_YEAR)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if candidates:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def init_app(app):
+    manifest = load_manifest(app.static_folder) if app.config['USE_ASSET_MANIFEST'] else None
+    if manifest:
+        app.extensions['asset_manifest'] = manifest
+        app.add_url_rule(f"{app.static_url_path}/{DIST_DIR}/<path:filename>", endpoint='dist_static', view_func=send_asset)
+    app.url_defaults(_rewrite_static_url)
+    app.jinja_env.globals['webp_url'] = webp_url
+
+    @app.cli.command('build-assets')
+    @click.option('--max-image-size', default=1920, help='Longest side of generated WebP images, in pixels.')
+    @click.option('--webp-quality', default=80)
+    def build_assets_command(max_image_size, webp_quality):
+        """Fingerprint, minify, precompress and convert static assets into static/dist."""
+        build(app.static_folder, max_image_size=max_image_size, webp_quality=webp_quality, log=click.echo)
+        click.echo('Asset manifest written. Restart workers to pick it up.')
@@ -1,13 +1,87 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import check_password_hash
 from app import db, supabase_client # Import supabase_client
 from models import User
+from ratelimit import TokenBucketLimiter
+from utils import hash_password, password_needs_rehash
+from cart_store import merge_guest_cart
+import guest_cart
+import tasks
+import threading
+import time
 import secrets
 import string
 
 auth_bp = Blueprint('auth', __name__)
 
+# Supabase sign-ins running in the background: user id -> (expires_at, future). Only this worker
+# process can claim them, see claim_supabase_session(). Entries are dropped on logout and, if never
+# claimed, once they are SUPABASE_PENDING_TTL seconds old.
+SUPABASE_PENDING_TTL = 600
+_pending_supabase_logins = {}
+_pending_supabase_lock = threading.Lock()
+
+def _remember_supabase_login(user_id, future):
+    now = time.monotonic()
+    with _pending_supabase_lock:
+        for stale in [key for key, (expires_at, _) in _pending_supabase_logins.items() if expires_at <= now]:
+            del _pending_supabase_logins[stale]
+        _pending_supabase_logins[user_id] = (now + SUPABASE_PENDING_TTL, future)
+
+def get_login_limiter():
+    limiter = current_app.extensions.get('login_limiter')
+    if limiter is None:
+        limiter = TokenBucketLimiter(current_app.config['LOGIN_RATE_LIMIT'], current_app.config['LOGIN_RATE_PERIOD'])
+        current_app.extensions['login_limiter'] = limiter
+    return limiter
+
+def _rehash_password(user_id, password):
+    # Runs on the background pool so the login response does not pay for a second hash
+    User.query.filter_by(id=user_id).update({'password_hash': hash_password(password)})
+    db.session.commit()
+
+def _supabase_sign_in(email, password):
+    supabase_response = supabase_client.auth.sign_in_with_password({
+        "email": email,
+        "password": password,
+    })
+    if supabase_response.user and supabase_response.session:
+        return supabase_response.session.access_token, supabase_response.session.refresh_token
+    return None
+
+def _supabase_sign_up(email, password, name, role):
+    supabase_response = supabase_client.auth.sign_up({
+        "email": email,
+        "password": password,
+        "options": {
+            "data": {"name": name, "role": role}
+        }
+    })
+    if supabase_response.user and supabase_response.session:
+        return supabase_response.session.access_token, supabase_response.session.refresh_token
+    current_app.logger.warning(f"Supabase registration for {email} returned no session")
+    return None
+
+def claim_supabase_session(user_id, timeout=10):
+    """Move tokens from a background Supabase sign-in into the Flask session.
+
+    Returns True if tokens were stored. Called lazily on first storage use.
+    """
+    with _pending_supabase_lock:
+        expires_at, future = _pending_supabase_logins.pop(user_id, (0, None))
+    if future is None or expires_at <= time.monotonic():
+        return False
+    try:
+        tokens = future.result(timeout=timeout)
+    except Exception as e:
+        current_app.logger.error(f"Supabase login error: {e}")
+        return False
+    if not tokens:
+        return False
+    session['supabase_jwt'], session['supabase_refresh_token'] = tokens
+    return True
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -18,36 +92,60 @@ def login():
             flash('Please enter both email and password.', 'error')
             return render_template('login.html')
         
+        # Throttle before touching the database or hashing anything. Every attempt costs the IP a token,
+        # only failed ones cost the account one, so logging in and out does not lock a user out
+        limiter = get_login_limiter()
+        email_key = f"email:{email.strip().lower()}"
+        ip_allowed = limiter.consume(f"ip:{request.remote_addr}")
+        if not (ip_allowed and limiter.peek(email_key)):
+            flash('Too many login attempts. Please wait a few minutes and try again.', 'error')
+            return render_template('login.html'), 429
+
         user = User.query.filter_by(email=email, is_active=True).first()
         
         if user and check_password_hash(user.password_hash, password):
             # Sign in with Flask-Login
             login_user(user)
 
-            # Sign in with Supabase Auth
-            try:
-                supabase_response = supabase_client.auth.sign_in_with_password({
-                    "email": email,
-                    "password": password,
-                })
-                if supabase_response.user and supabase_response.session:
-                    session['supabase_jwt'] = supabase_response.session.access_token
-                    session['supabase_refresh_token'] = supabase_response.session.refresh_token
-                    flash(f'Welcome back, {user.name}! Supabase session established.', 'success')
+            # Products added before logging in join the customer's cart, in one upsert
+            merged = guest_cart.take()
+            if merged and user.role == 'customer':
+                merged = merge_guest_cart(user.id, merged)
+                db.session.commit()
+
+            if password_needs_rehash(user.password_hash):
+                tasks.submit(_rehash_password, user.id, password)
+
+            # Only super admins use Supabase Storage, so nobody else needs a Supabase session
+            if user.role == 'super_admin':
+                session.pop('supabase_jwt', None)
+                session.pop('supabase_refresh_token', None)
+                if current_app.config['SUPABASE_LOGIN_MODE'] == 'sync':
+                    try:
+                        tokens = _supabase_sign_in(email, password)
+                        if tokens:
+                            session['supabase_jwt'], session['supabase_refresh_token'] = tokens
+                        else:
+                            flash('Supabase login failed, but local login successful.', 'warning')
+                    except Exception as e:
+                        current_app.logger.error(f"Supabase login error: {e}")
+                        flash(f'Supabase login failed: {str(e)}', 'warning')
                 else:
-                    flash('Supabase login failed, but local login successful.', 'warning')
-            except Exception as e:
-                current_app.logger.error(f"Supabase login error: {e}")
-                flash(f'Supabase login failed: {str(e)}', 'warning')
+                    _remember_supabase_login(user.id, tasks.submit(_supabase_sign_in, email, password))
+
+            flash(f'Welcome back, {user.name}!', 'success')
 
             # Redirect based on user role
             if user.role == 'admin':
                 return redirect(url_for('main.admin_dashboard'))
             elif user.role == 'super_admin':
                 return redirect(url_for('main.super_admin_dashboard'))
+            elif merged:
+                return redirect(url_for('main.cart'))
             else:
                 return redirect(url_for('main.index'))
         else:
+            limiter.consume(email_key)
             flash('Invalid email or password.', 'error')
     
     return render_template('login.html')
@@ -104,7 +202,7 @@ def register():
         
         # Set password for the user, whether new or pre-existing super admin
         if user_to_register:
-            user_to_register.password_hash = generate_password_hash(password)
+            user_to_register.password_hash = hash_password(password)
         else:
             # This case should ideally not be reached if validation is correct
             flash('Registration failed due to an unexpected error.', 'error')
@@ -116,23 +214,20 @@ def register():
             flash('Registration successful! Please log in.', 'success')
             
             # Register user with Supabase Auth as well
-            try:
-                supabase_response = supabase_client.auth.sign_up({
-                    "email": user_to_register.email,
-                    "password": password,
-                    "options": {
-                        "data": {"name": name, "role": user_to_register.role}
-                    }
-                })
-                if supabase_response.user and supabase_response.session:
-                    session['supabase_jwt'] = supabase_response.session.access_token
-                    session['supabase_refresh_token'] = supabase_response.session.refresh_token
-                    flash('Registration successful with Supabase! Please log in.', 'success')
-                else:
-                    flash('Local registration successful, but Supabase registration failed.', 'warning')
-            except Exception as e:
-                current_app.logger.error(f"Supabase registration error: {e}")
-                flash(f'Local registration successful, but Supabase registration failed: {str(e)}', 'warning')
+            if current_app.config['SUPABASE_LOGIN_MODE'] == 'sync':
+                try:
+                    tokens = _supabase_sign_up(user_to_register.email, password, name, user_to_register.role)
+                    if tokens:
+                        session['supabase_jwt'], session['supabase_refresh_token'] = tokens
+                        flash('Registration successful with Supabase! Please log in.', 'success')
+                    else:
+                        flash('Local registration successful, but Supabase registration failed.', 'warning')
+                except Exception as e:
+                    current_app.logger.error(f"Supabase registration error: {e}")
+                    flash(f'Local registration successful, but Supabase registration failed: {str(e)}', 'warning')
+            else:
+                # Login signs super admins in again anyway, so nothing here needs the tokens
+                tasks.submit(_supabase_sign_up, user_to_register.email, password, name, user_to_register.role)
 
             return redirect(url_for('auth.login'))
         except Exception as e:
@@ -145,6 +240,8 @@ def register():
 @auth_bp.route('/logout')
 @login_required
 def logout():
+    with _pending_supabase_lock:
+        _pending_supabase_logins.pop(current_user.id, None)
     logout_user()
     flash('You have been logged out successfully.', 'info')
     return redirect(url_for('main.index'))
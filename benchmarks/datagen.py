@@ -0,0 +1,196 @@
+"""Synthetic data for benchmarking.
+
+Rows are written with bulk INSERTs in chunks, so a 1M-row dataset takes minutes rather than hours.
+Every generated account uses stubs.BENCH_PASSWORD. The derived data that checkout and the nightly jobs
+keep up in production (category product counts, sales buckets and counters, recommendations) is built
+at the end, so benchmarks read the same tables the app does.
+"""
+import random
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+from app import db
+from models import (User, Category, Product, ProductImage, Order, OrderItem, Payment, ProductSalesBucket,
+                    super_admin_categories)
+from category_counts import reconcile_category_counts
+from sales_counters import WINDOW_DAYS, roll_windows
+import recommender
+from benchmarks.stubs import BENCH_PASSWORD
+
+CHUNK_SIZE = 5000
+
+WORDS = ['Wireless', 'Classic', 'Ultra', 'Smart', 'Organic', 'Portable', 'Deluxe', 'Compact', 'Premium',
+         'Vintage', 'Eco', 'Pro', 'Mini', 'Max', 'Cotton', 'Steel', 'Bamboo', 'Leather', 'Glass', 'Digital']
+NOUNS = ['Headphones', 'Novel', 'T-Shirt', 'Blender', 'Lipstick', 'Tent', 'Puzzle', 'Wiper', 'Leash', 'Vitamins',
+         'Blu-ray', 'Vinyl', 'Controller', 'Hose', 'Stroller', 'Stapler', 'Multimeter', 'Painting', 'Lamp', 'Backpack']
+STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+
+
+class Scale:
+    """Row counts derived from a single `orders` figure unless overridden."""
+
+    def __init__(self, orders=10000, users=None, products=None, super_admins=None, items_per_order=3):
+        self.orders = orders
+        self.users = users if users is not None else max(10, orders // 10)
+        self.products = products if products is not None else max(20, orders // 5)
+        self.super_admins = super_admins if super_admins is not None else max(1, self.products // 500)
+        self.items_per_order = items_per_order
+
+    def __repr__(self):
+        return (f"Scale(users={self.users}, super_admins={self.super_admins}, products={self.products}, "
+                f"orders={self.orders}, order_items~={self.orders * self.items_per_order})")
+
+
+def _chunks(rows, size=CHUNK_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _bulk_insert(model_or_table, rows):
+    table = getattr(model_or_table, '__table__', model_or_table)
+    total = 0
+    for batch in _chunks(rows):
+        db.session.execute(insert(table), batch)
+        total += len(batch)
+    db.session.commit()
+    return total
+
+
+def generate(scale, seed=42, log=print):
+    """Populate an empty database (categories and admin must already exist). Returns fixture_ids()."""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    password_hash = generate_password_hash(BENCH_PASSWORD)  # Hashed once and shared by every account
+
+    category_ids = list(db.session.scalars(select(Category.id)))
+
+    customer_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(scale.users)]
+    _bulk_insert(User, ({
+        'id': user_id, 'name': f'Customer {i}', 'email': f'customer{i}@bench.local',
+        'password_hash': password_hash, 'role': 'customer', 'is_active': True,
+        'created_at': now - timedelta(days=rng.randint(0, 730))
+    } for i, user_id in enumerate(customer_ids)))
+    log(f"users: {len(customer_ids)}")
+
+    seller_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(scale.super_admins)]
+    _bulk_insert(User, ({
+        'id': user_id, 'name': f'Seller {i}', 'email': f'seller{i}@bench.local',
+        'password_hash': password_hash, 'role': 'super_admin', 'is_active': True,
+        'unique_code': f'BENCH{i:06d}', 'created_at': now - timedelta(days=730)
+    } for i, user_id in enumerate(seller_ids)))
+    seller_categories = {user_id: rng.sample(category_ids, k=min(4, len(category_ids))) for user_id in seller_ids}
+    _bulk_insert(super_admin_categories, ({'user_id': user_id, 'category_id': category_id}
+                                          for user_id, cats in seller_categories.items() for category_id in cats))
+    log(f"super admins: {len(seller_ids)}")
+
+    def product_rows():
+        for i in range(scale.products):
+            seller_id = seller_ids[i % len(seller_ids)]
+            price = Decimal(rng.randint(99, 99999)) / 100
+            yield {
+                'name': f'{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(NOUNS)} {i}',
+                'description': ' '.join(rng.choice(WORDS + NOUNS) for _ in range(60)),
+                'price': price,
+                'original_price': (price * Decimal('1.25')).quantize(Decimal('0.01')) if i % 3 == 0 else None,
+                'stock': rng.randint(0, 500),
+                'category_id': rng.choice(seller_categories[seller_id]),
+                'super_admin_id': seller_id,
+                'image_url': f'https://example.invalid/products/{i}.jpg',
+                'brand': rng.choice(WORDS),
+                'ratings': Decimal(rng.randint(0, 50)) / 10,
+                'num_ratings': rng.randint(0, 5000),
+                'is_active': i % 50 != 0,
+                'created_at': now - timedelta(minutes=scale.products - i),
+            }
+    _bulk_insert(Product, product_rows())
+    product_rows_by_id = db.session.execute(select(Product.id, Product.price)).all()
+    product_ids = [row.id for row in product_rows_by_id]
+    prices = {row.id: row.price for row in product_rows_by_id}
+    _bulk_insert(ProductImage, ({
+        'product_id': product_id, 'image_url': f'https://example.invalid/products/{product_id}_{n}.jpg',
+        'is_primary': n == 0
+    } for product_id in product_ids for n in range(3)))
+    log(f"products: {len(product_ids)} (+{len(product_ids) * 3} images)")
+
+    # Orders, their items and payments are generated together so totals add up
+    first_order_id = (db.session.scalar(select(db.func.max(Order.id))) or 0) + 1
+    orders, items, payments = [], [], []
+    written = 0
+    sold = Counter() # (day, product id) -> units, for the sales windows
+    counted_since = now - timedelta(days=max(WINDOW_DAYS.values()))
+
+    def flush():
+        nonlocal written
+        db.session.execute(insert(Order.__table__), orders)
+        db.session.execute(insert(OrderItem.__table__), items)
+        db.session.execute(insert(Payment.__table__), payments)
+        db.session.commit()
+        written += len(orders)
+        orders.clear(), items.clear(), payments.clear()
+
+    for n in range(scale.orders):
+        order_id = first_order_id + n
+        created_at = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+        status = rng.choice(STATUSES)
+        total = Decimal(0)
+        for product_id in rng.sample(product_ids, k=min(rng.randint(1, scale.items_per_order * 2 - 1), len(product_ids))):
+            quantity = rng.randint(1, 3)
+            total += prices[product_id] * quantity
+            items.append({'order_id': order_id, 'product_id': product_id, 'quantity': quantity, 'price': prices[product_id]})
+            if status != 'cancelled' and created_at >= counted_since:
+                sold[created_at.date(), product_id] += quantity
+        payment_method = rng.choice(['cod', 'online'])
+        paid = payment_method == 'online' or rng.random() < 0.6
+        orders.append({
+            'id': order_id, 'customer_id': rng.choice(customer_ids), 'total_amount': total,
+            'status': status, 'payment_method': payment_method,
+            'payment_status': 'paid' if paid else 'pending',
+            'shipping_address': f'Bench User\n{n} Main Street\nCity, State 00000', 'phone': '0000000000',
+            'created_at': created_at, 'expected_delivery_date': created_at + timedelta(days=5),
+        })
+        payments.append({
+            'order_id': order_id, 'payment_method': payment_method, 'amount': total,
+            'payment_status': 'paid' if paid else 'pending',
+            'transaction_id': f'TXN{order_id}' if payment_method == 'online' else None, 'created_at': created_at,
+        })
+        if len(orders) >= CHUNK_SIZE:
+            flush()
+    if orders:
+        flush()
+    log(f"orders: {written} (+payments, order items)")
+
+    # What checkout, product edits and the nightly jobs maintain as the data changes
+    reconcile_category_counts()
+    _bulk_insert(ProductSalesBucket, ({'day': day, 'product_id': product_id, 'quantity': units}
+                                      for (day, product_id), units in sold.items()))
+    roll_windows(now.date())
+    db.session.commit()
+    log(f"sales buckets: {len(sold)} (+category counts, 7/30 day sales counters)")
+    build = recommender.build(k=current_app.config['RECOMMENDATIONS_K'],
+                              min_support=current_app.config['RECOMMENDATION_MIN_SUPPORT'])
+    db.session.commit()
+    log(f"recommendations: {build.products} products in {build.duration:.1f}s")
+
+    return fixture_ids()
+
+
+def fixture_ids():
+    """Ids and logins the scenarios pick from; works for a freshly generated or a reused database."""
+    return {
+        'customer_emails': list(db.session.scalars(select(User.email).filter_by(role='customer', is_active=True)
+                                                   .filter(User.email.like('%@bench.local')).limit(10000))),
+        'seller_emails': list(db.session.scalars(select(User.email).filter_by(role='super_admin', is_active=True)
+                                                 .filter(User.email.like('%@bench.local')).limit(1000))),
+        'product_ids': list(db.session.scalars(select(Product.id).filter_by(is_active=True).limit(100000))),
+        'category_ids': list(db.session.scalars(select(Category.id))),
+    }
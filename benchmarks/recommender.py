@@ -0,0 +1,83 @@
+"""Recommendation build time on synthetic order baskets, without a database.
+
+    python -m benchmarks.recommender --lines 1000000 --products 50000
+    python -m benchmarks.recommender --lines 100000 --compare
+
+Baskets mix a few "themes" of products that sell together with popularity-skewed picks, so the
+pair counts look like real order history. --compare also runs the pure Python fallback and checks
+that both give the same lists.
+"""
+import argparse
+import random
+import time
+from array import array
+from collections import Counter
+
+import recommender
+
+
+def baskets(lines, products, items_per_order=3, seed=1):
+    """Parallel (order ids, product ids) arrays of about `lines` order lines"""
+    rng = random.Random(seed)
+    themes = [rng.sample(range(1, products + 1), 8) for _ in range(max(1, products // 20))]
+    weights = [1 / rank ** 0.8 for rank in range(1, products + 1)]
+    picks = rng.choices(range(1, products + 1), weights=weights, k=lines)
+    orders, items = array('q'), array('q')
+    order_id = 0
+    while len(items) < lines:
+        order_id += 1
+        size = max(1, min(int(rng.expovariate(1 / items_per_order)) + 1, 12))
+        theme = rng.choice(themes)
+        chosen = {rng.choice(theme) if rng.random() < 0.5 else picks[(len(items) + i) % lines] for i in range(size)}
+        for product_id in chosen:
+            orders.append(order_id)
+            items.append(product_id)
+    return orders, items
+
+
+def timed(label, function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    print(f"{label:<28} {time.perf_counter() - start:8.2f} s   {len(result)} products with recommendations")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=1000000)
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--min-support', type=int, default=2)
+    parser.add_argument('--compare', action='store_true', help='Also time the pure Python fallback')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    orders, items = baskets(args.lines, args.products)
+    print(f"generated {len(items)} lines in {orders[-1]} orders in {time.perf_counter() - start:.2f} s")
+
+    if recommender.np is None:
+        print("numpy/scipy not installed; timing the pure Python build only")
+        timed('pure Python', recommender.neighbours, orders, items, args.k, args.min_support)
+        return
+    vectorized = timed('numpy/scipy', recommender.neighbours, orders, items, args.k, args.min_support)
+
+    # Incremental: the products of the last 1% of orders, recomputed from just the orders containing them
+    first_new = int(orders[-1] * 0.99)
+    targets = {product_id for order_id, product_id in zip(orders, items) if order_id > first_new}
+    frequencies = Counter(product_id for _, product_id in set(zip(orders, items)))
+    affected = {order_id for order_id, product_id in zip(orders, items) if product_id in targets}
+    lines = [(order_id, product_id) for order_id, product_id in zip(orders, items) if order_id in affected]
+    incremental = timed(f'incremental ({len(targets)} products)', recommender.neighbours,
+                        [order_id for order_id, _ in lines], [product_id for _, product_id in lines],
+                        args.k, args.min_support, targets=targets, frequencies=frequencies)
+    assert all(incremental[product_id] == vectorized[product_id] for product_id in incremental)
+
+    if args.compare:
+        python = timed('pure Python', recommender._neighbours_python, orders, items, args.k, args.min_support, None, None)
+        mismatched = sum(1 for product_id in python if [other for other, _ in python[product_id]]
+                         != [other for other, _ in vectorized.get(product_id, [])])
+        print(f"lists that differ: {mismatched}")
+
+
+if __name__ == '__main__':
+    main()
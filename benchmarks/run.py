@@ -0,0 +1,241 @@
+"""Load test runner.
+
+In-process, through the Flask test client against a local SQLite file:
+
+    python -m benchmarks.run --orders 10000 --users 4 --iterations 200
+
+Against a real server (prepare the database first, then point gunicorn at the same DATABASE_URL):
+
+    python -m benchmarks.run --orders 100000 --prepare-only
+    gunicorn -w 4 -b 127.0.0.1:8000 benchmarks.wsgi:app
+    python -m benchmarks.run --target http://127.0.0.1:8000 --users 32 --iterations 100
+
+Reports requests/second and p50/p95/p99 latency per endpoint.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from benchmarks import stubs
+from benchmarks.scenarios import SCENARIOS, DEFAULT_WEIGHTS, credentials
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    """Just enough of the Flask test client interface, over real HTTP."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data):
+        body = urllib.parse.urlencode(data).encode()
+        return self._open(urllib.request.Request(self.base_url + path, data=body, method='POST'))
+
+
+class TestClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data=data).status_code
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, label, seconds, ok):
+        with self.lock:
+            self.latencies[label].append(seconds)
+            if not ok:
+                self.errors[label] += 1
+
+    def summary(self, wall_time):
+        rows = []
+        for label, samples in sorted(self.latencies.items()):
+            ordered = sorted(samples)
+            rows.append({
+                'endpoint': label,
+                'requests': len(ordered),
+                'errors': self.errors[label],
+                'rps': len(ordered) / wall_time if wall_time else 0.0,
+                'p50_ms': percentile(ordered, 50) * 1000,
+                'p95_ms': percentile(ordered, 95) * 1000,
+                'p99_ms': percentile(ordered, 99) * 1000,
+                'max_ms': ordered[-1] * 1000,
+            })
+        return rows
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class VirtualUser:
+    def __init__(self, client, fixtures, stats, seed):
+        self.client = client
+        self.fixtures = fixtures
+        self.stats = stats
+        self.rng = random.Random(seed)
+        self.role = None
+
+    def _timed(self, label, call, expect):
+        start = time.perf_counter()
+        try:
+            status = call()
+        except Exception:
+            status = None
+        self.stats.record(label, time.perf_counter() - start, status in expect)
+        return status
+
+    def get(self, label, path, expect=(200,)):
+        return self._timed(label, lambda: self.client.get(path), expect)
+
+    def post(self, label, path, data, expect=(200,)):
+        return self._timed(label, lambda: self.client.post(path, data), expect)
+
+    def login(self, role):
+        if self.role == role:
+            return
+        if self.role is not None:
+            self.get('logout', '/logout', expect=(302,))
+        email, password = credentials(self.fixtures, role, self.rng)
+        if self.post('login', '/login', {'email': email, 'password': password}, expect=(302,)) == 302:
+            self.role = role
+
+
+def prepare(app, args):
+    from app import db, init_db_and_admin
+    from models import User
+    from benchmarks import datagen
+
+    with app.app_context():
+        if args.fresh:
+            db.drop_all()
+        init_db_and_admin(app)
+        if not User.query.filter(User.email.like('%@bench.local')).first():
+            scale = datagen.Scale(orders=args.orders, users=args.customers, products=args.products)
+            print(f"Generating {scale}", file=sys.stderr)
+            started = time.perf_counter()
+            datagen.generate(scale, seed=args.seed, log=lambda msg: print(f"  {msg}", file=sys.stderr))
+            print(f"Generated in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        return datagen.fixture_ids()
+
+
+def parse_weights(spec):
+    if not spec:
+        return DEFAULT_WEIGHTS
+    weights = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+def run(make_client, fixtures, weights, users, iterations, seed):
+    stats = Stats()
+    names, cumulative = list(weights), list(weights.values())
+
+    def worker(n):
+        user = VirtualUser(make_client(), fixtures, stats, seed + n)
+        for _ in range(iterations):
+            scenario = user.rng.choices(names, weights=cumulative)[0]
+            SCENARIOS[scenario](user)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats.summary(time.perf_counter() - started), time.perf_counter() - started
+
+
+def print_report(rows, wall_time):
+    header = f"{'endpoint':<24}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(f"{row['endpoint']:<24}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10.1f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}")
+    total = sum(row['requests'] for row in rows)
+    print('-' * len(header))
+    print(f"{total} requests in {wall_time:.1f}s ({total / wall_time if wall_time else 0:.1f} req/s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', default='testclient', help="'testclient' or a base URL such as http://127.0.0.1:8000")
+    parser.add_argument('--database-url', help='defaults to $DATABASE_URL, else a SQLite file in the temp directory')
+    parser.add_argument('--orders', type=int, default=10000, help='scale of the generated dataset')
+    parser.add_argument('--customers', type=int, help='override the number of customers')
+    parser.add_argument('--products', type=int, help='override the number of products')
+    parser.add_argument('--fresh', action='store_true', help='drop and regenerate the dataset')
+    parser.add_argument('--prepare-only', action='store_true', help='generate data and exit')
+    parser.add_argument('--scenarios', help="weighted mix, e.g. 'browse=5,checkout=1' (default: production-like mix)")
+    parser.add_argument('--users', type=int, default=1, help='concurrent virtual users')
+    parser.add_argument('--iterations', type=int, default=100, help='scenarios run by each virtual user')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    stubs.configure_environment(args.database_url)
+    from app import create_app
+    app = stubs.install(create_app())
+    fixtures = prepare(app, args)
+    if args.prepare_only:
+        print(f"Database ready at {os.environ['DATABASE_URL']}", file=sys.stderr)
+        return
+
+    if args.target == 'testclient':
+        make_client = lambda: TestClient(app)
+    else:
+        make_client = lambda: HttpClient(args.target)
+
+    rows, wall_time = run(make_client, fixtures, parse_weights(args.scenarios), args.users, args.iterations, args.seed)
+    print_report(rows, wall_time)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'target': args.target, 'wall_time': wall_time, 'endpoints': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
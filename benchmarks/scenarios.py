@@ -0,0 +1,72 @@
+"""Scripted user journeys. Each scenario is a function taking a VirtualUser; every request it makes is timed."""
+from benchmarks.stubs import BENCH_PASSWORD
+
+SEARCH_TERMS = ['Wireless', 'Lamp', 'Pro', 'Organic Tent', 'Vinyl', 'Steel', 'Max', 'zzz-no-match']
+SORTS = [None, 'price_asc', 'price_desc', 'name_asc', 'name_desc']
+CHECKOUT_FORM = {
+    'payment_method': 'cod', 'full_name': 'Bench User', 'phone': '0000000000',
+    'address': '1 Main Street', 'city': 'City', 'state': 'State', 'zip_code': '00000',
+}
+
+
+def browse(user):
+    user.get('index', '/')
+    category_id = user.rng.choice(user.fixtures['category_ids'])
+    sort_by = user.rng.choice(SORTS)
+    query = f'?category={category_id}' + (f'&sort_by={sort_by}' if sort_by else '')
+    user.get('products', '/products' + query)
+    user.get('product_detail', f"/product/{user.rng.choice(user.fixtures['product_ids'])}")
+
+
+def search(user):
+    user.get('products_search', f"/products?search={user.rng.choice(SEARCH_TERMS)}")
+
+
+def add_to_cart(user):
+    user.login('customer')
+    user.get('add_to_cart', f"/add-to-cart/{user.rng.choice(user.fixtures['product_ids'])}", expect=(302,))
+    user.get('cart', '/cart')
+
+
+def checkout(user):
+    user.login('customer')
+    for product_id in user.rng.sample(user.fixtures['product_ids'], k=2):
+        user.get('add_to_cart', f'/add-to-cart/{product_id}', expect=(302,))
+    user.get('checkout', '/checkout')
+    user.post('razorpay_payment', '/payment/razorpay', dict(CHECKOUT_FORM, payment_method='online'))
+    user.post('place_order', '/place-order', CHECKOUT_FORM, expect=(302,))
+    user.get('orders', '/orders')
+
+
+def admin_dashboards(user):
+    user.login('admin')
+    user.get('admin_dashboard', f"/admin/dashboard?time_period={user.rng.choice(['week', 'month', 'year'])}")
+    user.get('admin_revenue', '/admin/revenue?time_period=year')
+    user.get('admin_super_admins', '/admin/super_admins')
+
+
+def seller_dashboards(user):
+    user.login('super_admin')
+    user.get('super_admin_dashboard', '/super-admin/dashboard')
+    user.get('super_admin_orders', '/super-admin/orders')
+    user.get('super_admin_products', '/super-admin/products')
+
+
+SCENARIOS = {
+    'browse': browse,
+    'search': search,
+    'add_to_cart': add_to_cart,
+    'checkout': checkout,
+    'admin': admin_dashboards,
+    'seller': seller_dashboards,
+}
+
+# Rough shape of production traffic: mostly anonymous browsing
+DEFAULT_WEIGHTS = {'browse': 50, 'search': 20, 'add_to_cart': 15, 'checkout': 5, 'admin': 5, 'seller': 5}
+
+
+def credentials(fixtures, role, rng):
+    if role == 'admin':
+        return 'admin@msrshop.com', 'admin123'
+    emails = fixtures['seller_emails'] if role == 'super_admin' else fixtures['customer_emails']
+    return rng.choice(emails), BENCH_PASSWORD
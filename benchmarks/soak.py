@@ -0,0 +1,103 @@
+"""Connection soak test: many slow requests held open at once against a single gunicorn worker.
+
+    python -m benchmarks.soak --worker-class gevent --concurrency 500 --delay-ms 1000
+    python -m benchmarks.soak --worker-class sync --concurrency 20 --delay-ms 1000
+
+Each request to /_bench/slow waits --delay-ms, as if on SMTP or Supabase, then runs one query. If
+the worker interleaves requests, the whole batch finishes in about one delay. A sync worker takes
+about concurrency x delay.
+"""
+import argparse
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks import stubs
+
+
+def wait_until_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/_bench/slow?ms=0')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'gunicorn did not start listening on port {port}')
+
+
+def soak(port, concurrency, delay_ms, timeout):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    start_gate = threading.Barrier(concurrency)
+
+    def one_request():
+        start_gate.wait() # Open every connection at the same moment
+        started = time.perf_counter()
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+            connection.request('GET', f'/_bench/slow?ms={delay_ms}')
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f'HTTP {response.status}')
+            with lock:
+                latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+
+    threads = [threading.Thread(target=one_request) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--worker-class', default='gevent', choices=['gevent', 'gthread', 'sync'])
+    parser.add_argument('--threads', type=int, default=8, help='Threads per worker for gthread.')
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--delay-ms', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--timeout', type=int, default=120, help='Client timeout per request, in seconds.')
+    args = parser.parse_args(argv)
+
+    stubs.configure_environment()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    threads = args.threads if args.worker_class == 'gthread' else 1 # Gunicorn turns sync into gthread when threads > 1
+    env = dict(os.environ, WORKER_CLASS=args.worker_class, WEB_CONCURRENCY='1', GUNICORN_THREADS=str(threads),
+               GUNICORN_TIMEOUT=str(args.timeout))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(root, 'gunicorn.conf.py'),
+         '-b', f'127.0.0.1:{args.port}', '--log-level', 'warning', 'benchmarks.wsgi:app'],
+        cwd=root, env=env)
+    try:
+        wait_until_ready(args.port)
+        wall, latencies, errors = soak(args.port, args.concurrency, args.delay_ms, args.timeout)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{args.worker_class} worker x1, {args.concurrency} concurrent requests of {args.delay_ms} ms")
+    print(f"completed {len(latencies)}   errors {len(errors)}   wall {wall:.2f} s")
+    if latencies:
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"latency p50 {statistics.median(latencies) * 1000:.0f} ms   p99 {p99 * 1000:.0f} ms   max {latencies[-1] * 1000:.0f} ms")
+        print(f"requests in flight on average: {sum(latencies) / wall:.0f}")
+    for error in sorted(set(errors))[:5]:
+        print(f"  {error}")
+
+
+if __name__ == '__main__':
+    main()
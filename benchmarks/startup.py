@@ -0,0 +1,52 @@
+"""Worker spawn time: how long a fresh interpreter takes to import the app and build it, as a gunicorn worker would.
+
+    python -m benchmarks.startup --runs 10
+
+Each run is a new process so nothing is cached in sys.modules.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks import stubs
+
+PROBE = r"""
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+import main
+built = time.perf_counter()
+print(json.dumps({'import_app': imported - start, 'import_main': built - start, 'modules': len(sys.modules)}))
+"""
+
+
+def measure(runs):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE], cwd=root, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    stubs.configure_environment()
+    results = measure(args.runs)
+    for key in ('import_app', 'import_main'):
+        samples = sorted(result[key] * 1000 for result in results)
+        print(f"{key:<12} median {statistics.median(samples):8.1f} ms   min {samples[0]:8.1f} ms   max {samples[-1]:8.1f} ms")
+    print(f"modules loaded: {results[-1]['modules']}")
+
+
+if __name__ == '__main__':
+    main()
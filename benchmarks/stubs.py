@@ -0,0 +1,58 @@
+"""In-process stand-ins for Supabase and SMTP so benchmarks measure our code, not the network."""
+import os
+import tempfile
+from types import SimpleNamespace
+
+BENCH_PASSWORD = 'benchpass'
+
+
+class StubStorageBucket:
+    def __init__(self, name):
+        self.name = name
+
+    def upload(self, path, data, file_options=None):
+        return {'Key': f'{self.name}/{path}'}
+
+    def get_public_url(self, path):
+        return f'https://example.invalid/storage/{self.name}/{path}'
+
+
+class StubSupabaseClient:
+    """Answers the handful of Supabase calls the app makes with canned successes."""
+
+    def __init__(self):
+        session = SimpleNamespace(access_token='bench-access-token', refresh_token='bench-refresh-token')
+        ok = SimpleNamespace(user=SimpleNamespace(id='bench'), session=session, raw_response=None)
+        self.auth = SimpleNamespace(
+            sign_in_with_password=lambda credentials: ok,
+            sign_up=lambda credentials: ok,
+            refresh_session=lambda refresh_token: ok,
+        )
+        self.storage = SimpleNamespace(from_=StubStorageBucket)
+
+
+def configure_environment(database_url=None):
+    """Set the env vars create_app() reads, without overriding anything already exported."""
+    os.environ.setdefault('DATABASE_URL', database_url or f"sqlite:///{os.path.join(tempfile.gettempdir(), 'msr_bench.db')}")
+    os.environ.setdefault('SESSION_SECRET', 'bench-secret')
+    os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+    os.environ.setdefault('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiJ9.e30.bench')
+    os.environ.setdefault('MAIL_PORT', '587')
+    os.environ.setdefault('MAIL_DEFAULT_SENDER', 'bench@bench.local')
+    # Every virtual user logs in from the same address
+    os.environ.setdefault('LOGIN_RATE_LIMIT', '1000000')
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'scrypt:16384:8:1')
+
+
+def install(app):
+    """Swap the Supabase client and mailer of an app created by create_app() for stubs."""
+    import auth
+    import routes
+    stub = StubSupabaseClient()
+    auth.supabase_client = stub
+    routes.supabase_client = stub
+    routes.get_authenticated_supabase_client = lambda: stub
+    # Flask-Mail skips the SMTP connection entirely when sending is suppressed
+    app.config['MAIL_SUPPRESS_SEND'] = True
+    app.extensions['mail'].suppress = True
+    return app
@@ -0,0 +1,25 @@
+"""WSGI entry point for benchmarking under gunicorn with Supabase and mail stubbed out.
+
+    gunicorn -w 4 -b 127.0.0.1:8000 benchmarks.wsgi:app
+
+Also serves /_bench/slow?ms=N for benchmarks.soak: it waits N ms, standing in for an upstream
+call such as SMTP or Supabase, then runs one query.
+"""
+import time
+
+from benchmarks import stubs
+
+stubs.configure_environment()
+
+from flask import request  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from app import create_app, db  # noqa: E402 - the environment must be configured first
+
+app = stubs.install(create_app())
+
+
+@app.route('/_bench/slow')
+def slow():
+    time.sleep(request.args.get('ms', 500, type=int) / 1000) # Cooperative under gevent's monkey patching
+    db.session.execute(text('SELECT 1'))
+    return 'ok'
@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+
+
+class SingleFlightCache:
+    """Bounded in-process LRU cache where a miss is built by exactly one thread.
+
+    Concurrent requests for the same missing key wait on a per-key lock and then read
+    the value the first thread stored, so a cold popular key costs one rebuild rather
+    than one per request.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_build(self, key, build):
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another thread may have built it while we waited
+            value = self.get(key, missing)
+            if value is missing:
+                value = build()
+                self.set(key, value)
+        with self._lock:
+            if self._key_locks.get(key) is key_lock and not key_lock.locked():
+                del self._key_locks[key]
+        return value
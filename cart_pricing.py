@@ -0,0 +1,154 @@
+"""Cart totals.
+
+A cart is priced from one query that joins every line to its product, category and seller, into a
+CartSnapshot holding the lines and the subtotal (at list prices), discount and total, all Decimal.
+The snapshot is memoized for the rest of the request, so a page that shows the cart and then uses
+its total does not price it twice. Guest carts, kept in the session cookie (guest_cart.py), are priced
+the same way by guest_snapshot.
+
+users.cart_version is bumped by every change to a user's cart. The checkout and payment pages put
+it in their forms and keep their snapshot in cart_snapshots for CART_SNAPSHOT_TTL seconds, so
+place_order can take the lines and total from the page the customer confirmed, without another cart
+query, and can tell when the cart changed in between. Changing a product's price bumps the version
+of every cart holding it, so a customer is never charged a total other than the one they confirmed;
+the cached snapshot only saves repricing, and a worker without it prices the unchanged cart again.
+"""
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Optional, Tuple
+from flask import current_app, g
+from sqlalchemy import func
+from app import db
+from cache import SingleFlightCache
+from models import User, Cart, Product, Category
+
+ZERO = Decimal('0.00')
+
+@dataclass(frozen=True, slots=True)
+class CartLine:
+    id: int
+    product_id: int
+    quantity: int
+    name: str
+    price: Decimal
+    original_price: Optional[Decimal]
+    image_url: Optional[str]
+    stock: int
+    category_name: Optional[str]
+    owner_name: Optional[str]
+
+    @property
+    def list_price(self):
+        """original_price when the product is marked down from it, else the price"""
+        return self.original_price if self.original_price and self.original_price > self.price else self.price
+
+    @property
+    def line_total(self):
+        return self.price * self.quantity
+
+@dataclass(frozen=True, slots=True)
+class CartSnapshot:
+    user_id: str
+    version: int # users.cart_version the lines were read at
+    lines: Tuple[CartLine, ...]
+    subtotal: Decimal # At list prices
+    discount: Decimal
+    total: Decimal # What the customer pays
+
+    @property
+    def count(self):
+        return len(self.lines)
+
+    @property
+    def product_ids(self):
+        return [line.product_id for line in self.lines]
+
+# (user id, cart version) -> (expires_at, CartSnapshot), for the checkout -> place_order handoff
+cart_snapshots = SingleFlightCache(max_entries=4096)
+
+def price_lines(user_id, version, lines):
+    """CartSnapshot of the lines; every figure is an exact Decimal sum rounded once to paise"""
+    lines = tuple(lines)
+    total = sum((line.line_total for line in lines), ZERO)
+    subtotal = sum((line.list_price * line.quantity for line in lines), ZERO)
+    return CartSnapshot(user_id=user_id, version=version, lines=lines, subtotal=subtotal.quantize(ZERO),
+                        discount=(subtotal - total).quantize(ZERO), total=total.quantize(ZERO))
+
+def _line_query(lines, *columns):
+    """SELECT columns plus the product columns a CartLine needs after its id, product id and quantity,
+    from `lines` (anything joined to products)"""
+    owner = db.aliased(User)
+    return (db.select(*columns, Product.name, Product.price, Product.original_price, Product.image_url, Product.stock,
+                      Category.name, owner.name)
+            .select_from(lines)
+            .outerjoin(Category, Product.category_id == Category.id)
+            .outerjoin(owner, Product.super_admin_id == owner.id))
+
+def _load(user_id):
+    version = db.select(User.cart_version).where(User.id == user_id).scalar_subquery()
+    rows = db.session.execute(
+        _line_query(db.join(Cart, Product, Cart.product_id == Product.id),
+                    version.label('cart_version'), Cart.id, Cart.product_id, Cart.quantity)
+        .where(Cart.user_id == user_id, Product.is_active == True)
+        .order_by(Cart.id)
+    ).all()
+    if rows:
+        cart_version = rows[0].cart_version
+    else:
+        cart_version = db.session.scalar(db.select(User.cart_version).where(User.id == user_id))
+    return price_lines(user_id, cart_version or 0, (CartLine(*row[1:]) for row in rows))
+
+def guest_snapshot(quantities):
+    """A guest cart ({product id: units}) priced like a customer's, in one query. Lines are
+    identified by product id; products no longer for sale are left out."""
+    if not quantities:
+        return price_lines(None, 0, ())
+    rows = db.session.execute(
+        _line_query(Product, Product.id)
+        .where(Product.id.in_(quantities), Product.is_active == True)
+        .order_by(Product.id)
+    ).all()
+    return price_lines(None, 0, (CartLine(row[0], row[0], quantities[row[0]], *row[1:]) for row in rows))
+
+def cart_snapshot(user_id):
+    """The user's priced cart, loaded at most once per request"""
+    snapshots = g.setdefault('cart_snapshots', {})
+    if user_id not in snapshots:
+        snapshots[user_id] = _load(user_id)
+    return snapshots[user_id]
+
+def remember(snapshot):
+    """Keep snapshot for place_order; returns it"""
+    expires_at = time.monotonic() + current_app.config['CART_SNAPSHOT_TTL']
+    cart_snapshots.set((snapshot.user_id, snapshot.version), (expires_at, snapshot))
+    return snapshot
+
+def confirmed_snapshot(user, version):
+    """The cart a checkout or payment page showed at cart version `version`, or None if the cart has
+    changed since, in which case the customer should review it again. Without a version (a form from
+    before versioning) the current cart is used."""
+    if version is None:
+        return cart_snapshot(user.id)
+    if version != user.cart_version:
+        return None
+    cached = cart_snapshots.get((user.id, version))
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    snapshot = cart_snapshot(user.id)
+    return snapshot if snapshot.version == version else None
+
+def bump_cart_versions(user_ids=None, product_id=None):
+    """Mark carts as changed: the given users', or every cart holding product_id. Part of the
+    caller's transaction."""
+    if product_id is not None:
+        user_ids = db.select(Cart.user_id).where(Cart.product_id == product_id)
+    elif not user_ids:
+        return
+    else:
+        user_ids = list(set(user_ids))
+    db.session.execute(
+        db.update(User).where(User.id.in_(user_ids)).values(cart_version=func.coalesce(User.cart_version, 0) + 1)
+        .execution_options(synchronize_session=False)
+    )
+    g.pop('cart_snapshots', None)
@@ -0,0 +1,55 @@
+"""Writes to customers' carts.
+
+The cart holds one row per (user, product), enforced by uq_cart_user_product. Adding products is a
+single INSERT ... ON CONFLICT DO UPDATE SET quantity = quantity + n for all of them (see
+archive.accumulate), so concurrent clicks add up on one row instead of racing a SELECT to create
+duplicates. Adding one product, a whole wishlist or a guest cart at login all go through add_items.
+"""
+from collections import Counter
+from app import db
+from models import Cart, Product, Wishlist
+from archive import accumulate
+from cart_pricing import bump_cart_versions
+
+MAX_QUANTITY = 99 # Units of one product a single request may add
+
+def active_quantities(quantities):
+    """{product id: units} for the active products among quantities, units summed per product and
+    capped at MAX_QUANTITY; checked with one IN query"""
+    wanted = Counter()
+    for product_id, units in dict(quantities).items():
+        try:
+            product_id, units = int(product_id), int(units)
+        except (TypeError, ValueError):
+            continue
+        if units > 0:
+            wanted[product_id] += units
+    if not wanted:
+        return {}
+    active = db.session.scalars(db.select(Product.id).where(Product.id.in_(wanted), Product.is_active == True))
+    return {product_id: min(wanted[product_id], MAX_QUANTITY) for product_id in active}
+
+def add_items(user_id, quantities):
+    """Add {product id: units} to the user's cart in one statement; inactive or unknown products are
+    skipped. Returns what was added. Part of the caller's transaction."""
+    added = active_quantities(quantities)
+    if added:
+        accumulate(Cart, ['user_id', 'product_id'],
+                   [{'user_id': user_id, 'product_id': product_id, 'quantity': units}
+                    for product_id, units in added.items()])
+        bump_cart_versions([user_id])
+    return added
+
+def move_wishlist_to_cart(user_id):
+    """Add one of every wishlisted active product to the cart and take them off the wishlist.
+    Returns the number of products moved. Part of the caller's transaction."""
+    product_ids = db.session.scalars(db.select(Wishlist.product_id).where(Wishlist.user_id == user_id)).all()
+    added = add_items(user_id, {product_id: 1 for product_id in product_ids})
+    if added:
+        db.session.execute(db.delete(Wishlist).where(Wishlist.user_id == user_id, Wishlist.product_id.in_(added)))
+    return len(added)
+
+def merge_guest_cart(user_id, guest_quantities):
+    """Fold a cart built before logging in into the user's cart: quantities of products already in
+    it are added together. Part of the caller's transaction."""
+    return add_items(user_id, guest_quantities or {})
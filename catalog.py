@@ -0,0 +1,151 @@
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional, Tuple
+from flask import abort
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
+from app import db
+from cache import SingleFlightCache
+from http_cache import invalidate_catalog_fingerprint
+from models import Product, Category, Wishlist
+
+# Enough of the description for a card teaser; one extra character tells the template to add "..."
+CARD_SUMMARY_LENGTH = 80
+
+@dataclass(frozen=True, slots=True)
+class ProductCard:
+    """What a listing page needs to render one product, without loading the ORM entity"""
+    id: int
+    name: str
+    brand: Optional[str]
+    price: Decimal
+    original_price: Optional[Decimal]
+    image_url: Optional[str]
+    ratings: Optional[Decimal]
+    num_ratings: Optional[int]
+    sales_count: Optional[int]
+    stock: int
+    category_name: Optional[str]
+    summary: Optional[str]
+
+@dataclass(frozen=True, slots=True)
+class WishlistCard:
+    id: int
+    created_at: datetime
+    product: ProductCard
+
+# Column order must match ProductCard's fields
+CARD_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.brand,
+    Product.price,
+    Product.original_price,
+    Product.image_url,
+    Product.ratings,
+    Product.num_ratings,
+    Product.sales_count,
+    Product.stock,
+    Category.name.label('category_name'),
+    func.substr(Product.description, 1, CARD_SUMMARY_LENGTH + 1).label('summary'),
+)
+
+def card_query():
+    """SELECT of the card columns; add filters, ordering and limits as with any select()"""
+    return db.select(*CARD_COLUMNS).select_from(Product).outerjoin(Category, Product.category_id == Category.id)
+
+def load_cards(stmt):
+    return [ProductCard(*row) for row in db.session.execute(stmt)]
+
+def wishlist_cards(user_id):
+    stmt = (
+        db.select(Wishlist.id, Wishlist.created_at, *CARD_COLUMNS)
+        .select_from(Wishlist)
+        .join(Product, Wishlist.product_id == Product.id)
+        .outerjoin(Category, Product.category_id == Category.id)
+        .where(Wishlist.user_id == user_id)
+        .order_by(Wishlist.id)
+    )
+    return [WishlistCard(row[0], row[1], ProductCard(*row[2:])) for row in db.session.execute(stmt)]
+
+@dataclass(frozen=True, slots=True)
+class ProductImageView:
+    image_url: str
+    is_primary: bool
+
+@dataclass(frozen=True, slots=True)
+class ProductDetail:
+    """Everything product_detail.html shows, detached from the session so it can be cached"""
+    id: int
+    version: int
+    name: str
+    description: Optional[str]
+    price: Decimal
+    original_price: Optional[Decimal]
+    stock: int
+    image_url: Optional[str]
+    brand: Optional[str]
+    dimensions: Optional[str]
+    ratings: Optional[Decimal]
+    num_ratings: Optional[int]
+    sales_count: Optional[int]
+    category_id: int
+    category_name: Optional[str]
+    owner_name: Optional[str]
+    product_images: Tuple[ProductImageView, ...]
+
+# Keyed by (product_id, version), so a bumped version simply stops matching the old entry
+product_detail_cache = SingleFlightCache(max_entries=2048)
+
+def _build_product_detail(product_id):
+    product = (Product.query
+               .options(selectinload(Product.product_images), joinedload(Product.category), joinedload(Product.owner))
+               .filter_by(id=product_id, is_active=True)
+               .first_or_404()) # Raising keeps a miss out of the cache
+    return ProductDetail(
+        id=product.id,
+        version=product.version,
+        name=product.name,
+        description=product.description,
+        price=product.price,
+        original_price=product.original_price,
+        stock=product.stock,
+        image_url=product.image_url,
+        brand=product.brand,
+        dimensions=product.dimensions,
+        ratings=product.ratings,
+        num_ratings=product.num_ratings,
+        sales_count=product.sales_count,
+        category_id=product.category_id,
+        category_name=product.category.name if product.category else None,
+        owner_name=product.owner.name if product.owner else None,
+        product_images=tuple(ProductImageView(image.image_url, image.is_primary) for image in product.product_images),
+    )
+
+def product_version(product_id):
+    """Current version of an active product, or 404"""
+    version = db.session.execute(
+        db.select(Product.version).where(Product.id == product_id, Product.is_active == True)
+    ).scalar()
+    if version is None:
+        abort(404)
+    return version
+
+def get_product_detail(product_id):
+    """Cached ProductDetail for an active product, or 404. Costs one primary-key lookup on a hit."""
+    version = product_version(product_id)
+    return product_detail_cache.get_or_build((product_id, version), lambda: _build_product_detail(product_id))
+
+def bump_product_versions(product_ids):
+    """Invalidate cached views of these products. Part of the caller's transaction."""
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return
+    db.session.execute(
+        db.update(Product).where(Product.id.in_(product_ids)).values(version=Product.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    ids = set(product_ids)
+    product_detail_cache.delete_where(lambda key: key[0] in ids)
+    invalidate_catalog_fingerprint()
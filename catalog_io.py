@@ -0,0 +1,219 @@
+"""Bulk import and export of a super admin's products as CSV or JSON Lines.
+
+Uploads are read row by row from the request stream and handled in chunks of IMPORT_CHUNK_SIZE rows:
+each chunk is validated against the seller's categories (loaded once per import) and written with
+one multi-row INSERT for products and one for their images, then committed. A bad row is reported
+with its line number and skipped; it does not stop the rest of the file. The export writes the same
+columns, so an export can be edited and imported back.
+"""
+import csv
+from collections import Counter
+import io
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from app import db
+from models import Product, ProductImage, Category, super_admin_categories
+from http_cache import invalidate_catalog_fingerprint
+from category_counts import adjust_category_counts
+
+COLUMNS = ('name', 'description', 'category', 'price', 'original_price', 'stock', 'brand', 'dimensions',
+           'ratings', 'num_ratings', 'image_urls')
+FORMATS = ('csv', 'jsonl')
+MAX_REPORTED_ERRORS = 200 # Further bad rows are counted but not listed
+MAX_PRICE = Decimal('99999999.99') # Numeric(10, 2)
+MAX_INTEGER = 2**31 - 1 # Integer columns on Postgres
+
+@dataclass
+class ImportResult:
+    dry_run: bool
+    rows: int = 0
+    imported: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list) # [(line number, message)]
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+def format_for(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    return {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}.get(extension, default)
+
+def assigned_categories(super_admin_id):
+    """{name (lowercased) or str(id): category id} for the categories the seller may list under"""
+    rows = db.session.execute(
+        db.select(Category.id, Category.name)
+        .join(super_admin_categories, super_admin_categories.c.category_id == Category.id)
+        .where(super_admin_categories.c.user_id == super_admin_id)
+    ).all()
+    lookup = {name.lower(): category_id for category_id, name in rows}
+    lookup.update({str(category_id): category_id for category_id, _ in rows})
+    return lookup
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict or error message) without loading the whole upload"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, f'Invalid JSON: {e}'
+            continue
+        yield line_number, row if isinstance(row, dict) else 'Each line must be a JSON object'
+
+def _text(row, name, max_length, required=False):
+    value = row.get(name)
+    value = str(value).strip() if value is not None else ''
+    if not value:
+        if required:
+            raise ValueError(f'{name} is required')
+        return None
+    if len(value) > max_length:
+        raise ValueError(f'{name} is longer than {max_length} characters')
+    return value
+
+def _number(row, name, kind, required=False, minimum=0, maximum=None):
+    value = row.get(name)
+    if value is None or str(value).strip() == '':
+        if required:
+            raise ValueError(f'{name} is required')
+        return None
+    try:
+        number = kind(str(value).strip())
+    except (ValueError, InvalidOperation):
+        raise ValueError(f'{name} must be a number, got {value!r}')
+    if isinstance(number, Decimal) and not number.is_finite():
+        raise ValueError(f'{name} must be a number, got {value!r}')
+    if number < minimum or (maximum is not None and number > maximum):
+        raise ValueError(f'{name} must be between {minimum} and {maximum}' if maximum is not None
+                         else f'{name} must be at least {minimum}')
+    return number
+
+def _image_urls(row):
+    value = row.get('image_urls') or []
+    urls = value.split('|') if isinstance(value, str) else value
+    if not isinstance(urls, list):
+        raise ValueError('image_urls must be a list or a |-separated string')
+    urls = [str(url).strip() for url in urls if str(url).strip()]
+    for url in urls:
+        if len(url) > 200:
+            raise ValueError('image URLs must be at most 200 characters')
+    return urls
+
+def parse_row(row, categories, super_admin_id):
+    """(product values, image URLs) for one row; ValueError describes the first problem"""
+    category = _text(row, 'category', 100) or _text(row, 'category_id', 20, required=True)
+    category_id = categories.get(category.lower())
+    if category_id is None:
+        raise ValueError(f'category {category!r} is not assigned to you')
+    image_urls = _image_urls(row)
+    original_price = _number(row, 'original_price', Decimal, maximum=MAX_PRICE)
+    return {
+        'name': _text(row, 'name', 200, required=True),
+        'description': _text(row, 'description', 100000),
+        'price': _number(row, 'price', Decimal, required=True, maximum=MAX_PRICE),
+        'original_price': original_price,
+        'stock': _number(row, 'stock', int, required=True, maximum=MAX_INTEGER),
+        'category_id': category_id,
+        'super_admin_id': super_admin_id,
+        'brand': _text(row, 'brand', 100),
+        'dimensions': _text(row, 'dimensions', 200),
+        'ratings': _number(row, 'ratings', Decimal, maximum=5) or Decimal('0'),
+        'num_ratings': _number(row, 'num_ratings', int, maximum=MAX_INTEGER) or 0,
+        'image_url': image_urls[0] if image_urls else None,
+        'is_active': True,
+    }, image_urls
+
+def _insert_chunk(products):
+    """Insert [(values, image URLs)] with one statement per table. Part of the caller's transaction."""
+    ids = db.session.scalars(
+        db.insert(Product).returning(Product.id, sort_by_parameter_order=True),
+        [values for values, _ in products]
+    ).all()
+    images = [{'product_id': product_id, 'image_url': url, 'is_primary': i == 0}
+              for product_id, (_, urls) in zip(ids, products) for i, url in enumerate(urls)]
+    if images:
+        db.session.execute(db.insert(ProductImage), images)
+    adjust_category_counts(Counter(values['category_id'] for values, _ in products))
+
+def import_products(stream, fmt, super_admin_id, chunk_size=1000, dry_run=False):
+    """Validate and (unless dry_run) insert every row of the upload. Commits after each chunk."""
+    result = ImportResult(dry_run=dry_run)
+    categories = assigned_categories(super_admin_id)
+    chunk = []
+
+    def flush():
+        if chunk and not dry_run:
+            _insert_chunk(chunk)
+            db.session.commit()
+        result.imported += len(chunk)
+        chunk.clear()
+
+    for line, row in read_rows(stream, fmt):
+        result.rows += 1
+        if isinstance(row, str):
+            result.add_error(line, row)
+            continue
+        try:
+            chunk.append(parse_row(row, categories, super_admin_id))
+        except ValueError as e:
+            result.add_error(line, str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+    if result.imported and not dry_run:
+        invalidate_catalog_fingerprint()
+    return result
+
+def export_products(super_admin_id, fmt, chunk_size=1000):
+    """Yield the seller's active products as CSV or JSONL text, chunk_size products per query"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(COLUMNS)
+        yield buffer.getvalue()
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(Product.id, Product.name, Product.description, Category.name.label('category'),
+                      Product.price, Product.original_price, Product.stock, Product.brand, Product.dimensions,
+                      Product.ratings, Product.num_ratings, Product.image_url)
+            .join(Category, Product.category_id == Category.id)
+            .where(Product.super_admin_id == super_admin_id, Product.is_active == True, Product.id > last_id)
+            .order_by(Product.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        images = {}
+        for product_id, url in db.session.execute(
+                db.select(ProductImage.product_id, ProductImage.image_url)
+                .where(ProductImage.product_id.in_([row.id for row in rows]))
+                .order_by(ProductImage.product_id, ProductImage.is_primary.desc(), ProductImage.id)):
+            images.setdefault(product_id, []).append(url)
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            values = {
+                'name': row.name, 'description': row.description or '', 'category': row.category,
+                'price': str(row.price), 'original_price': str(row.original_price or ''), 'stock': row.stock,
+                'brand': row.brand or '', 'dimensions': row.dimensions or '', 'ratings': str(row.ratings or 0),
+                'num_ratings': row.num_ratings or 0,
+                'image_urls': images.get(row.id) or ([row.image_url] if row.image_url else []),
+            }
+            if fmt == 'csv':
+                writer.writerow([values[column] if column != 'image_urls' else '|'.join(values[column])
+                                 for column in COLUMNS])
+            else:
+                buffer.write(json.dumps(values, ensure_ascii=False) + '\n')
+        yield buffer.getvalue()
@@ -0,0 +1,57 @@
+"""Which categories each super admin may list products under (the super_admin_categories table).
+
+Changes are computed as a diff against the current rows and applied with one bulk INSERT and one
+bulk DELETE, instead of clearing a seller's categories and re-adding them one query at a time.
+"""
+from collections import defaultdict
+from sqlalchemy import tuple_
+from app import db
+from models import Category, super_admin_categories
+
+MODES = ('add', 'remove', 'replace')
+
+def resolve_category_ids(raw_ids):
+    """The ids in raw_ids (form values) that are real categories, checked with one IN query"""
+    ids = set()
+    for raw_id in raw_ids:
+        try:
+            ids.add(int(raw_id))
+        except (TypeError, ValueError):
+            continue
+    if not ids:
+        return set()
+    return set(db.session.scalars(db.select(Category.id).where(Category.id.in_(ids))))
+
+def assigned_category_ids(user_ids):
+    """{user id: set of category ids} for every given user, in one query"""
+    assigned = defaultdict(set)
+    user_ids = list(user_ids)
+    if user_ids:
+        for user_id, category_id in db.session.execute(
+                db.select(super_admin_categories.c.user_id, super_admin_categories.c.category_id)
+                .where(super_admin_categories.c.user_id.in_(user_ids))):
+            assigned[user_id].add(category_id)
+    return {user_id: assigned[user_id] for user_id in user_ids}
+
+def apply_assignments(user_ids, category_ids, mode='replace'):
+    """Add, remove or replace category_ids for every user; only changed rows are written.
+    Returns (rows inserted, rows deleted). Part of the caller's transaction."""
+    if mode not in MODES:
+        raise ValueError(f'Unknown assignment mode {mode!r}')
+    category_ids = set(category_ids)
+    current = assigned_category_ids(user_ids)
+    inserts, deletes = [], []
+    for user_id, assigned in current.items():
+        wanted = {'add': assigned | category_ids, 'remove': assigned - category_ids, 'replace': category_ids}[mode]
+        inserts += [{'user_id': user_id, 'category_id': category_id} for category_id in wanted - assigned]
+        deletes += [(user_id, category_id) for category_id in assigned - wanted]
+    if inserts:
+        db.session.execute(db.insert(super_admin_categories), inserts)
+    if deletes:
+        db.session.execute(db.delete(super_admin_categories).where(
+            tuple_(super_admin_categories.c.user_id, super_admin_categories.c.category_id).in_(deletes)))
+    return len(inserts), len(deletes)
+
+def set_categories(user_id, category_ids):
+    """Make user_id's categories exactly category_ids. Part of the caller's transaction."""
+    return apply_assignments([user_id], category_ids, mode='replace')
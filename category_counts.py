@@ -0,0 +1,49 @@
+"""Active-product counts per category (Category.product_count).
+
+Every code path that adds a product, soft-deletes one or moves one to another category adjusts the
+counters in the same transaction, so the homepage and the admin pie chart read a column instead of
+grouping all products. `flask --app main reconcile-category-counts` recomputes them from the products
+table, for any drift from writes made outside the app.
+"""
+from collections import Counter
+import click
+from sqlalchemy import bindparam, func
+from app import db
+from models import Category, Product
+
+def adjust_category_counts(deltas):
+    """Add {category_id: change in active products} to the counters. Part of the caller's transaction."""
+    deltas = {category_id: delta for category_id, delta in Counter(deltas).items() if delta}
+    if not deltas:
+        return
+    table = Category.__table__
+    db.session.execute(
+        db.update(table).where(table.c.id == bindparam('category_id'))
+        .values(product_count=func.coalesce(table.c.product_count, 0) + bindparam('delta')),
+        [{'category_id': category_id, 'delta': delta} for category_id, delta in deltas.items()]
+    )
+
+def reconcile_category_counts():
+    """Set every counter to the real number of active products. Returns {category name: (old, new)} for
+    the counters that were wrong. Part of the caller's transaction."""
+    actual = dict(db.session.execute(
+        db.select(Product.category_id, func.count(Product.id)).where(Product.is_active == True)
+        .group_by(Product.category_id)
+    ).all())
+    fixed = {}
+    for category in Category.query.all():
+        count = actual.get(category.id, 0)
+        if category.product_count != count:
+            fixed[category.name] = (category.product_count, count)
+            category.product_count = count
+    return fixed
+
+def init_app(app):
+    @app.cli.command('reconcile-category-counts')
+    def reconcile_category_counts_command():
+        """Recompute the per-category active product counts."""
+        fixed = reconcile_category_counts()
+        db.session.commit()
+        for name, (old, new) in fixed.items():
+            click.echo(f'{name}: {old} -> {new}')
+        click.echo(f'{len(fixed)} category counts corrected.')
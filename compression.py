@@ -0,0 +1,86 @@
+import zlib
+from flask import request, stream_template, get_flashed_messages, current_app, render_template
+from replicas import keep_routing
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'application/x-ndjson', 'image/svg+xml',
+}
+
+def _close(chunks):
+    # The WSGI server only closes the outermost iterable; stream_with_context pops its request context on close
+    close = getattr(chunks, 'close', None)
+    if close is not None:
+        close()
+
+def coalesce(chunks, size):
+    """Regroup a stream of tiny chunks (Jinja yields one per template fragment) into ~size byte writes"""
+    buffer, buffered = [], 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= size:
+                yield b''.join(buffer)
+                buffer, buffered = [], 0
+        if buffer:
+            yield b''.join(buffer)
+    finally:
+        _close(chunks)
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # 16+ selects the gzip container
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            # Sync flush so each chunk reaches the client now rather than at the end
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        _close(chunks)
+
+def render_long_page(template_name, **context):
+    """Stream a long list page if STREAM_LONG_PAGES is on, otherwise render it normally.
+
+    Streamed output is sent while the template is still iterating, so time to first byte does not
+    grow with the list. Flashes are consumed up front because the session cookie is written before
+    the body. A view routed by read_replica keeps reading from the same replica while the body renders.
+    """
+    if not current_app.config['STREAM_LONG_PAGES']:
+        return render_template(template_name, **context)
+    get_flashed_messages()
+    chunks = keep_routing(stream_template(template_name, **context)) # Lazy loads in the template stay on the replica
+    return current_app.response_class(coalesce(chunks, current_app.config['STREAM_CHUNK_SIZE']), mimetype='text/html')
+
+def compress_response(response):
+    config = current_app.config
+    if not config['COMPRESS_ENABLED']:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough # send_file responses; precompressed assets handle themselves
+            or 'Content-Encoding' in response.headers
+            or not request.accept_encodings['gzip']):
+        return response
+
+    if response.is_streamed:
+        response.response = _gzip_stream(response.response, config['COMPRESS_LEVEL'])
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        compressor = zlib.compressobj(config['COMPRESS_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        response.set_data(compressor.compress(data) + compressor.flush())
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def init_app(app):
+    app.after_request(compress_response)
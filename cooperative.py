@@ -0,0 +1,21 @@
+"""Cooperative (gevent) deployment support.
+
+Run with `WORKER_CLASS=gevent gunicorn -c gunicorn.conf.py main:app`. Gunicorn monkey-patches the
+standard library in each worker, so sockets become cooperative. That covers SMTP, the
+Supabase/httpx clients and time.sleep. psycopg2 talks to the server from C inside libpq, so it
+needs psycogreen's wait callback as well; `patch_drivers` installs it after fork. With the patch,
+a worker waiting on Postgres, Supabase or SMTP switches to another request instead of blocking.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+def patch_drivers():
+    """Make psycopg2 yield to other greenlets while it waits on the database"""
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        logger.warning("psycogreen or psycopg2 is not installed; Postgres queries will block the whole gevent worker")
+        return False
+    patch_psycopg()
+    return True
@@ -0,0 +1,133 @@
+"""Database connection pool sizing and metrics.
+
+Each gunicorn worker process has its own pool. By default it holds one connection per request thread
+(GUNICORN_THREADS), plus overflow for background tasks (BACKGROUND_WORKERS). DB_MAX_CONNECTIONS
+caps the total across all WEB_CONCURRENCY workers, so the server's connection limit is never exceeded.
+
+Checkouts are not pre-pinged unless DB_POOL_PRE_PING is set. When a query hits a disconnect error,
+SQLAlchemy invalidates that connection and every connection opened before it. The failed request
+gets an error; the next checkout opens a fresh connection. The pool is LIFO, so idle connections
+drain from the bottom and get recycled. Busy ones stay warm.
+"""
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+def _env_int(environ, name, default):
+    value = environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+def _env_bool(environ, name, default):
+    value = environ.get(name)
+    return value.lower() in ['true', 'on', '1'] if value not in (None, '') else default
+
+def pool_sizing(environ):
+    """(pool_size, max_overflow) per worker process from the deployment's worker and thread counts"""
+    workers = _env_int(environ, 'WEB_CONCURRENCY', 1)
+    threads = _env_int(environ, 'GUNICORN_THREADS', 1)
+    pool_size = _env_int(environ, 'DB_POOL_SIZE', threads)
+    max_overflow = _env_int(environ, 'DB_MAX_OVERFLOW', _env_int(environ, 'BACKGROUND_WORKERS', 4))
+    budget = _env_int(environ, 'DB_MAX_CONNECTIONS', 0)
+    if budget:
+        per_worker = max(1, budget // workers)
+        pool_size = min(pool_size, per_worker)
+        max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+    return max(1, pool_size), max_overflow
+
+def engine_options(database_url, environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for the primary and any replica binds"""
+    options = {
+        'pool_recycle': _env_int(environ, 'DB_POOL_RECYCLE', 300),
+        'pool_pre_ping': _env_bool(environ, 'DB_POOL_PRE_PING', False),
+    }
+    if database_url and database_url.startswith('sqlite') and (':memory:' in database_url or database_url.rstrip('/') == 'sqlite:'):
+        return options # In-memory SQLite gets a single static connection; sizing does not apply
+    pool_size, max_overflow = pool_sizing(environ)
+    options.update(
+        poolclass=MeteredQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=_env_int(environ, 'DB_POOL_TIMEOUT', 10),
+        pool_use_lifo=_env_bool(environ, 'DB_POOL_LIFO', True),
+    )
+    return options
+
+
+class PoolMetrics:
+    """Counters for one pool in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.disconnects = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_checkout(self, waited, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def record_disconnect(self):
+        with self._lock:
+            self.disconnects += 1
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        # Includes connect time when the pool has to open a new connection
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_checkout(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.record_checkout(time.perf_counter() - started)
+        return connection
+
+@event.listens_for(Engine, 'handle_error')
+def _count_disconnects(context):
+    # SQLAlchemy invalidates the pool itself on a disconnect; this only keeps count
+    metrics = getattr(context.engine.pool, 'metrics', None) if context.engine else None
+    if context.is_disconnect and metrics:
+        metrics.record_disconnect()
+
+def pool_status(engines):
+    """Snapshot of every engine's pool for the admin system page. Figures are for this worker only."""
+    snapshot = []
+    for key, engine in engines.items():
+        pool = engine.pool
+        metrics = getattr(pool, 'metrics', None)
+        entry = {
+            'name': key or 'primary',
+            'url': engine.url.render_as_string(hide_password=True),
+            'pool_class': type(pool).__name__,
+            'size': pool.size() if hasattr(pool, 'size') else None,
+            'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+            'checked_in': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+            'overflow': pool.overflow() if hasattr(pool, 'overflow') else None,
+            'max_overflow': getattr(pool, '_max_overflow', None),
+        }
+        if metrics:
+            entry.update(
+                checkouts=metrics.checkouts,
+                timeouts=metrics.timeouts,
+                disconnects=metrics.disconnects,
+                wait_avg_ms=1000 * metrics.wait_total / metrics.checkouts if metrics.checkouts else 0.0,
+                wait_max_ms=1000 * metrics.wait_max,
+            )
+        snapshot.append(entry)
+    return snapshot
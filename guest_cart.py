@@ -0,0 +1,56 @@
+"""Carts of visitors who have not logged in.
+
+A guest cart is kept in the signed session cookie as {product id: units}, so browsing and filling a
+cart without an account writes nothing to the database. It is priced like a customer's cart
+(cart_pricing.guest_snapshot) and merged into the customer's cart with one upsert at login
+(cart_store.merge_guest_cart). Its lines are identified by product id where a customer's cart uses
+the cart row id.
+"""
+from flask import session
+from cart_store import MAX_QUANTITY, active_quantities
+
+SESSION_KEY = 'guest_cart'
+MAX_LINES = 50 # Keeps the cookie well under the 4 KB browsers accept
+
+def quantities():
+    """{product id: units} in the guest cart"""
+    return {int(product_id): units for product_id, units in session.get(SESSION_KEY, {}).items()}
+
+def _save(cart):
+    if cart:
+        session[SESSION_KEY] = {str(product_id): units for product_id, units in cart.items()}
+        session.permanent = True # Outlive the browser session, like an account's cart
+    else:
+        session.pop(SESSION_KEY, None)
+
+def add(quantities_to_add):
+    """Add {product id: units}, skipping products that are not for sale (one read, no writes) or do
+    not fit in MAX_LINES. Returns what was added."""
+    cart = quantities()
+    added = {}
+    for product_id, units in active_quantities(quantities_to_add).items():
+        if product_id not in cart and len(cart) >= MAX_LINES:
+            continue
+        cart[product_id] = min(cart.get(product_id, 0) + units, MAX_QUANTITY)
+        added[product_id] = units
+    _save(cart)
+    return added
+
+def set_quantities(updates):
+    """Set {product id: units} for lines already in the cart, capped at MAX_QUANTITY as the login merge
+    would cap them; 0 or less removes the line"""
+    cart = quantities()
+    for product_id, units in updates.items():
+        if product_id not in cart:
+            continue
+        if units > 0:
+            cart[product_id] = min(units, MAX_QUANTITY)
+        else:
+            del cart[product_id]
+    _save(cart)
+
+def take():
+    """Empty the guest cart, returning what was in it"""
+    cart = quantities()
+    session.pop(SESSION_KEY, None)
+    return cart
@@ -0,0 +1,30 @@
+"""Gunicorn settings, read from the environment.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+WORKER_CLASS picks the concurrency model:
+- sync (default): one request per worker at a time.
+- gthread: GUNICORN_THREADS requests per worker.
+- gevent: up to GEVENT_CONNECTIONS requests per worker, interleaved on network I/O. Needs the
+  gevent and psycogreen packages.
+"""
+import os
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', 5000)}")
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('WORKER_CLASS', 'sync')
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+worker_connections = int(os.environ.get('GEVENT_CONNECTIONS', 1000))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+if worker_class == 'gevent':
+    # Hundreds of requests share one worker, but only some hold a DB connection at a time. The rest
+    # wait up to DB_POOL_TIMEOUT for one instead of opening a connection each.
+    os.environ.setdefault('DB_POOL_SIZE', '20')
+    os.environ.setdefault('DB_MAX_OVERFLOW', '10')
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        from cooperative import patch_drivers
+        patch_drivers()
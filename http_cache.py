@@ -0,0 +1,77 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+from sqlalchemy import func
+from app import db
+from models import Product, Category
+
+_catalog_fingerprint = None # (expires_at, value)
+_catalog_lock = threading.Lock()
+
+def _digest(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:16]
+
+def category_fingerprint():
+    count, max_id = db.session.execute(db.select(func.count(Category.id), func.max(Category.id))).one()
+    return _digest(count, max_id)
+
+def catalog_fingerprint():
+    """Changes whenever an active product is added, removed or bumped, or the category set changes.
+
+    The aggregate is memoized for CATALOG_ETAG_TTL seconds so revalidations stay cheap; other
+    workers may therefore keep answering 304 for a page that changed that long ago.
+    """
+    global _catalog_fingerprint
+    now = time.monotonic()
+    cached = _catalog_fingerprint
+    if cached and cached[0] > now:
+        return cached[1]
+    with _catalog_lock:
+        count, newest, versions = db.session.execute(
+            db.select(func.count(Product.id), func.max(Product.created_at), func.coalesce(func.sum(Product.version), 0))
+            .where(Product.is_active == True)
+        ).one()
+        value = _digest(count, newest, versions, category_fingerprint())
+        _catalog_fingerprint = (now + current_app.config['CATALOG_ETAG_TTL'], value)
+    return value
+
+def invalidate_catalog_fingerprint():
+    global _catalog_fingerprint
+    _catalog_fingerprint = None
+
+def _is_personalized():
+    # Logged-in pages show carts, wishlists and role-specific actions; pending flashes are consumed by the render
+    return current_user.is_authenticated or bool(session.get('_flashes'))
+
+def _public_cache_control():
+    config = current_app.config
+    return f"public, max-age={config['PUBLIC_PAGE_MAX_AGE']}, s-maxage={config['PUBLIC_PAGE_S_MAXAGE']}"
+
+def conditional_page(etag_for):
+    """Give anonymous views of a page a weak ETag, 304 handling and a CDN-cacheable Cache-Control.
+
+    `etag_for` receives the view's arguments and returns the page's ETag without rendering it.
+    Personalized responses are marked private and get no validator.
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            if _is_personalized():
+                response = make_response(view(*args, **kwargs))
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+
+            etag = f"{etag_for(*args, **kwargs)}-{current_app.config['RELEASE_VERSION']}"
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = _public_cache_control()
+            response.vary.add('Cookie')
+            return response
+        return decorated_function
+    return decorator
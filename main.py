@@ -1,14 +1,14 @@
 from app import create_app, init_db_and_admin, login_manager
 from models import User
 
+# Workers only build the app. Create tables, categories and the admin user once per deploy with:
+#   flask --app main bootstrap
 app = create_app()
 
-with app.app_context():
-    init_db_and_admin(app)
-
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(user_id)
 
 if __name__ == '__main__':
+    init_db_and_admin(app) # Convenience for the local dev server
     app.run(debug=True)
@@ -21,6 +21,7 @@ class User(UserMixin, db.Model):
     unique_code = db.Column(db.String(50), unique=True, nullable=True)  # For super admin registration
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    cart_version = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Bumped on every cart change; see cart_pricing.py
     
     # Relationships
     products = db.relationship('Product', backref='owner', lazy=True)
@@ -37,12 +38,17 @@ class Category(db.Model):
     name = db.Column(db.String(100), nullable=False, unique=True)
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    product_count = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Active products; see category_counts.py
     
     # Relationships
     products = db.relationship('Product', backref='category', lazy=True)
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        # Top sellers of a category, read as an index range rather than a sort of the category
+        db.Index('ix_products_category_sales_7d', 'category_id', 'sales_7d'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -51,19 +57,21 @@ class Product(db.Model):
     original_price = db.Column(db.Numeric(10, 2), nullable=True) # For discount pricing
     stock = db.Column(db.Integer, nullable=False, default=0)
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
-    super_admin_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False) # Changed to String to store UUID
+    super_admin_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True) # Changed to String to store UUID
     image_url = db.Column(db.String(200), default=None) # Primary image
     brand = db.Column(db.String(100), nullable=True)
     dimensions = db.Column(db.String(200), nullable=True) # e.g., "Large: 35.5x25.4x3.8 cm, Medium: ..."
     ratings = db.Column(db.Numeric(2, 1), default=0.0)
     num_ratings = db.Column(db.Integer, default=0)
-    sales_count = db.Column(db.Integer, default=0) # For "200+ bought in past month"
+    sales_count = db.Column(db.Integer, default=0) # Units sold in the last 30 days, for "200+ bought in past month"; see sales_counters.py
+    sales_7d = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Units sold in the last 7 days
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1') # Bumped on every change, keys cached views
     
     # Relationships
     product_images = db.relationship('ProductImage', backref='product', lazy=True, cascade='all, delete-orphan')
-    order_items = db.relationship('OrderItem', backref='product', lazy=True, cascade='all, delete-orphan')
+    order_items = db.relationship('OrderItem', backref='product', lazy=True) # Never cascaded: products are soft-deleted so order history stays intact
     cart_items = db.relationship('Cart', backref='product', lazy=True, cascade='all, delete-orphan')
     wishlist_items = db.relationship('Wishlist', backref='product', lazy=True, cascade='all, delete-orphan')
 
@@ -78,6 +86,11 @@ class ProductImage(db.Model):
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Keyset pagination of order history, newest first
+        db.Index('ix_orders_customer_created', 'customer_id', 'created_at', 'id'),
+        db.Index('ix_orders_created', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False) # Changed to String to store UUID
@@ -119,8 +132,8 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Numeric(10, 2), nullable=False)  # Price at the time of order
 
@@ -136,6 +149,10 @@ class OrderItem(db.Model):
 
 class Cart(db.Model):
     __tablename__ = 'cart'
+    __table_args__ = (
+        # One line per product, so adding to the cart can upsert; also serves lookups of a user's cart
+        db.UniqueConstraint('user_id', 'product_id', name='uq_cart_user_product'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False) # Changed to String to store UUID
@@ -155,7 +172,7 @@ class Payment(db.Model):
     __tablename__ = 'payments'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
     payment_method = db.Column(db.String(50), nullable=False)
     transaction_id = db.Column(db.String(100))
     payment_status = db.Column(db.String(50), nullable=False, default='pending')
@@ -177,3 +194,120 @@ class Address(db.Model):
     zip_code = db.Column(db.String(20), nullable=False)
     is_default = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Append-only log of order status changes, written by order_workflow.transition. No foreign key, so
+# the log outlives `flask archive-orders`.
+class OrderStatusHistory(db.Model):
+    __tablename__ = 'order_status_history'
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    from_status = db.Column(db.String(50), nullable=False)
+    to_status = db.Column(db.String(50), nullable=False)
+    changed_by = db.Column(db.String(36)) # users.id of the seller or customer who made the change
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Emails written in the same transaction as the change they announce and sent afterwards; see outbox.py
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_unsent', 'sent_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+
+# Orders moved out of the hot tables by `flask archive-orders`; see archive.py
+class OrderArchive(db.Model):
+    __tablename__ = 'orders_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    customer_id = db.Column(db.String(36), nullable=False, index=True)
+    total_amount = db.Column(db.Numeric(10, 2), nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    payment_method = db.Column(db.String(50), nullable=False)
+    payment_status = db.Column(db.String(50), nullable=False)
+    shipping_address = db.Column(db.Text, nullable=False)
+    phone = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime)
+    expected_delivery_date = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, server_default=func.now())
+
+class OrderItemArchive(db.Model):
+    __tablename__ = 'order_items_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Numeric(10, 2), nullable=False)
+
+class PaymentArchive(db.Model):
+    __tablename__ = 'payments_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    payment_method = db.Column(db.String(50), nullable=False)
+    transaction_id = db.Column(db.String(100))
+    payment_status = db.Column(db.String(50), nullable=False)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    created_at = db.Column(db.DateTime)
+
+# Units sold per product per day over the last 30 days; the source of Product.sales_count and sales_7d
+class ProductSalesBucket(db.Model):
+    __tablename__ = 'product_sales_buckets'
+
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+# "Customers also bought": the top K products bought together with product_id, best first (rank 0)
+class ProductRecommendation(db.Model):
+    __tablename__ = 'product_recommendations'
+
+    product_id = db.Column(db.Integer, primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True)
+    recommended_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False) # Cosine similarity of the two products' sets of orders
+
+class RecommendationBuild(db.Model):
+    __tablename__ = 'recommendation_builds'
+
+    id = db.Column(db.Integer, primary_key=True)
+    mode = db.Column(db.String(20), nullable=False) # full, incremental
+    last_order_id = db.Column(db.Integer, nullable=False) # Orders up to this id are reflected
+    products = db.Column(db.Integer, nullable=False, default=0) # Products whose recommendations were rewritten
+    duration = db.Column(db.Float) # Seconds
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Daily totals of archived orders, so analytics add them to the live figures without reading the archive
+class DailySales(db.Model):
+    __tablename__ = 'daily_sales'
+
+    day = db.Column(db.Date, primary_key=True)
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+    orders_total = db.Column(db.Numeric(14, 2), nullable=False, default=0) # Sum of Order.total_amount, by order date
+    paid_revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0) # Sum of paid Payment.amount, by payment date
+
+class DailyProductSales(db.Model):
+    __tablename__ = 'daily_product_sales'
+
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+class DailySellerSales(db.Model):
+    __tablename__ = 'daily_seller_sales'
+
+    day = db.Column(db.Date, primary_key=True)
+    super_admin_id = db.Column(db.String(36), primary_key=True)
+    orders_count = db.Column(db.Integer, nullable=False, default=0) # Distinct orders containing the seller's products
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
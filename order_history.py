@@ -0,0 +1,112 @@
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import func, desc, or_, and_
+from sqlalchemy.orm import joinedload, selectinload
+from app import db
+from cache import SingleFlightCache
+from models import Order, OrderItem, Product
+
+ORDER_STATUSES = ('pending', 'processing', 'shipped', 'delivered', 'cancelled')
+
+# (scope, owner id) -> (expires_at, OrderCounts)
+order_counts_cache = SingleFlightCache(4096)
+
+@dataclass(frozen=True, slots=True)
+class OrderCounts:
+    """Per-status order counts for one customer or seller, possibly up to ORDER_COUNT_TTL seconds old"""
+    by_status: dict = field(default_factory=dict)
+    total_amount: Decimal = Decimal('0')
+
+    @property
+    def count(self):
+        return sum(self.by_status.values())
+
+    def get(self, status):
+        return self.count if not status else self.by_status.get(status, 0)
+
+def seller_order_ids(super_admin_id):
+    """Orders containing at least one of the seller's products, as an IN subquery (products.super_admin_id is indexed)"""
+    return (
+        db.select(OrderItem.order_id)
+        .join(Product, OrderItem.product_id == Product.id)
+        .where(Product.super_admin_id == super_admin_id)
+    )
+
+def _scope_filter(scope, owner_id):
+    if scope == 'customer':
+        return Order.customer_id == owner_id
+    return Order.id.in_(seller_order_ids(owner_id))
+
+def encode_cursor(order):
+    return f"{order.created_at.isoformat()}_{order.id}"
+
+def decode_cursor(value):
+    """(created_at, id) of the last order on the previous page, or None for the first page"""
+    if not value:
+        return None
+    created_at, _, order_id = value.rpartition('_')
+    try:
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError:
+        return None # A mangled link just starts over from the newest order
+
+def order_page(scope, owner_id, status=None, before=None, page_size=None):
+    """One page of orders, newest first, plus the cursor for the next page (None on the last one).
+
+    Pages are keyed on (created_at, id) rather than OFFSET, so page 500 costs the same as page 1.
+    """
+    page_size = page_size or current_app.config['ORDER_PAGE_SIZE']
+    query = Order.query.filter(_scope_filter(scope, owner_id)) \
+                       .options(selectinload(Order.order_items).joinedload(OrderItem.product))
+    if scope == 'seller':
+        query = query.options(joinedload(Order.customer))
+    if status:
+        query = query.filter(Order.status == status)
+    cursor = decode_cursor(before)
+    if cursor:
+        created_at, order_id = cursor
+        # The plain upper bound is redundant, but lets Postgres prune newer orders partitions
+        query = query.filter(Order.created_at <= created_at,
+                             or_(Order.created_at < created_at,
+                                 and_(Order.created_at == created_at, Order.id < order_id)))
+    orders = query.order_by(desc(Order.created_at), desc(Order.id)).limit(page_size + 1).all()
+    next_cursor = encode_cursor(orders[page_size - 1]) if len(orders) > page_size else None
+    return orders[:page_size], next_cursor
+
+def _count_orders(scope, owner_id):
+    rows = db.session.execute(
+        db.select(Order.status, func.count(Order.id), func.coalesce(func.sum(Order.total_amount), 0))
+        .where(_scope_filter(scope, owner_id))
+        .group_by(Order.status)
+    ).all()
+    return OrderCounts(
+        by_status={status: count for status, count, _ in rows},
+        total_amount=sum((Decimal(total) for _, _, total in rows), Decimal('0')),
+    )
+
+def order_counts(scope, owner_id):
+    """Cached per-status counts; one GROUP BY per owner every ORDER_COUNT_TTL seconds at most"""
+    key = (scope, owner_id)
+    cached = order_counts_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    order_counts_cache.delete(key)
+    ttl = current_app.config['ORDER_COUNT_TTL']
+    return order_counts_cache.get_or_build(key, lambda: (time.monotonic() + ttl, _count_orders(scope, owner_id)))[1]
+
+def invalidate_order_counts(order_ids):
+    """Drop cached counts for the customers and sellers on these orders. Call after committing."""
+    order_ids = list(set(order_ids))
+    if not order_ids:
+        return
+    customer_ids = db.session.scalars(db.select(Order.customer_id).where(Order.id.in_(order_ids))).all()
+    seller_ids = db.session.scalars(
+        db.select(Product.super_admin_id).distinct()
+        .join(OrderItem, OrderItem.product_id == Product.id)
+        .where(OrderItem.order_id.in_(order_ids))
+    ).all()
+    owners = {('customer', owner_id) for owner_id in customer_ids} | {('seller', owner_id) for owner_id in seller_ids}
+    order_counts_cache.delete_where(lambda key: key in owners)
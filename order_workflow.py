@@ -0,0 +1,155 @@
+"""Order status changes.
+
+An order moves pending -> processing -> shipped -> delivered and can be cancelled until it is
+delivered (customers can only cancel before it ships). transition() moves any number of orders to a
+status in one transaction:
+
+- one SELECT ... FOR UPDATE picks the requested orders the caller may change (a seller's orders are
+  those containing their products) that are in a state the new status may follow;
+- one UPDATE ... WHERE id IN (...) AND status IN (...) moves them;
+- one multi-row INSERT appends them to order_status_history;
+- cancelling puts the stock back and takes the sales back out of the counters, a statement each for
+  all the orders;
+- each customer gets one email (through the outbox) listing all of their orders that moved.
+
+Orders that could not be moved are reported back rather than failing the whole batch, so a seller
+can tick a page of orders, or ask for every order in a status, and ship them with one request.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Tuple
+from flask import current_app, render_template
+from sqlalchemy import bindparam
+from app import db
+from models import Order, OrderItem, OrderStatusHistory, Product, User
+from order_history import seller_order_ids, invalidate_order_counts
+from sales_counters import record_sales
+from catalog import bump_product_versions
+import outbox
+
+# status -> statuses it may move to
+TRANSITIONS = {
+    'pending': ('processing', 'cancelled'),
+    'processing': ('shipped', 'cancelled'),
+    'shipped': ('delivered', 'cancelled'),
+}
+CUSTOMER_CANCELLABLE = ('pending', 'processing')
+
+@dataclass(frozen=True, slots=True)
+class TransitionResult:
+    status: str
+    changed: Tuple[int, ...] # Order ids moved to status
+    skipped: Tuple[int, ...] # Requested ids left alone: unknown, not the caller's, or not in a state status may follow
+
+def targets(status):
+    """Statuses an order in `status` may move to"""
+    return TRANSITIONS.get(status, ())
+
+def sources(status):
+    """Statuses an order may be in to move to `status`"""
+    return tuple(source for source, allowed in TRANSITIONS.items() if status in allowed)
+
+def transition(status, actor_id, order_ids=None, super_admin_id=None, customer_id=None, from_statuses=None):
+    """Move orders to status; part of the caller's transaction, call after_commit once committed.
+
+    order_ids limits the change to those orders (None: every order in scope, which needs
+    from_statuses). super_admin_id / customer_id scope it to a seller's or a customer's orders and
+    from_statuses to orders in those states. At most ORDER_BULK_LIMIT orders move per call.
+    """
+    allowed = sources(status)
+    if not allowed:
+        raise ValueError(f'No order can move to {status!r}')
+    if from_statuses is not None:
+        allowed = tuple(source for source in allowed if source in from_statuses)
+    if order_ids is None and from_statuses is None:
+        raise ValueError('Pass order_ids or from_statuses')
+    requested = None if order_ids is None else sorted({int(order_id) for order_id in order_ids})
+    if not allowed or requested == []:
+        return TransitionResult(status, (), tuple(requested or ()))
+
+    query = (db.select(Order.id, Order.status, Order.customer_id, Order.created_at, Order.total_amount,
+                       Order.expected_delivery_date)
+             .where(Order.status.in_(allowed))
+             .order_by(Order.id)
+             .limit(current_app.config['ORDER_BULK_LIMIT'])
+             .with_for_update())
+    if requested is not None:
+        query = query.where(Order.id.in_(requested))
+    if super_admin_id is not None:
+        query = query.where(Order.id.in_(seller_order_ids(super_admin_id)))
+    if customer_id is not None:
+        query = query.where(Order.customer_id == customer_id)
+    rows = db.session.execute(query).all()
+    changed = [row.id for row in rows]
+    skipped = tuple(sorted(set(requested or ()) - set(changed)))
+    if not rows:
+        return TransitionResult(status, (), skipped)
+
+    db.session.execute(
+        db.update(Order).where(Order.id.in_(changed), Order.status.in_(allowed)).values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    now = datetime.utcnow()
+    db.session.execute(db.insert(OrderStatusHistory), [
+        {'order_id': row.id, 'from_status': row.status, 'to_status': status, 'changed_by': actor_id, 'created_at': now}
+        for row in rows
+    ])
+    if status == 'cancelled':
+        _restock(rows)
+    _notify(rows, status)
+    return TransitionResult(status, tuple(changed), skipped)
+
+def _restock(rows):
+    """Put the cancelled orders' units back in stock and take them out of the day each was sold"""
+    placed_on = {row.id: row.created_at.date() for row in rows}
+    items = db.session.execute(
+        db.select(OrderItem.order_id, OrderItem.product_id, OrderItem.quantity)
+        .where(OrderItem.order_id.in_(placed_on))
+    ).all()
+    if not items:
+        return
+    restored = defaultdict(int)
+    unsold = defaultdict(lambda: defaultdict(int)) # day -> product id -> negative units
+    for order_id, product_id, quantity in items:
+        restored[product_id] += quantity
+        unsold[placed_on[order_id]][product_id] -= quantity
+    products = Product.__table__
+    db.session.execute(
+        db.update(products).where(products.c.id == bindparam('product_id'))
+        .values(stock=products.c.stock + bindparam('quantity')),
+        [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in restored.items()]
+    )
+    for day, quantities in unsold.items():
+        record_sales(quantities, day=day)
+    bump_product_versions(restored)
+
+def _notify(rows, status):
+    """Queue one email per customer listing their orders that moved to status"""
+    by_customer = defaultdict(list)
+    for row in rows:
+        by_customer[row.customer_id].append(row)
+    customers = db.session.execute(
+        db.select(User.id, User.name, User.email).where(User.id.in_(by_customer))
+    ).all()
+    current_year = datetime.utcnow().year
+    emails = []
+    for customer in customers:
+        orders = by_customer[customer.id]
+        if len(orders) == 1:
+            subject = f"Your MSR Shop Order #{orders[0].id} is {status.title()}"
+        else:
+            subject = f"{len(orders)} of your MSR Shop orders are {status.title()}"
+        emails.append({
+            'recipient': customer.email,
+            'subject': subject,
+            'html': render_template('emails/order_status.html', customer_name=customer.name, status=status,
+                                    orders=orders, current_year=current_year),
+        })
+    outbox.enqueue(emails)
+
+def after_commit(result):
+    """Refresh cached order counts and send the emails of a committed transition"""
+    if result.changed:
+        invalidate_order_counts(result.changed)
+        outbox.deliver_soon()
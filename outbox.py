@@ -0,0 +1,82 @@
+"""Transactional email outbox.
+
+Code that changes something customers should hear about adds the emails to email_outbox in the same
+transaction (enqueue), so a rollback takes the emails with it and a commit cannot lose them. After
+committing, deliver_soon() sends them on the background pool; `flask --app main send-outbox` sends
+whatever is left (run it from cron so mail survives an SMTP outage or a restart).
+
+Sending takes OUTBOX_BATCH_SIZE rows at a time over one SMTP connection. On Postgres the rows are
+claimed with FOR UPDATE SKIP LOCKED, so concurrent senders never send the same email twice. A failed
+email is retried by later runs until it has been tried OUTBOX_MAX_ATTEMPTS times.
+"""
+from datetime import datetime
+import click
+from flask import current_app
+from flask_mail import Message
+from app import db, mail
+from models import EmailOutbox
+import tasks
+
+def enqueue(emails):
+    """Queue [{'recipient', 'subject', 'html'}] for sending. Part of the caller's transaction."""
+    emails = [email for email in emails if email.get('recipient')]
+    if emails:
+        now = datetime.utcnow()
+        db.session.execute(db.insert(EmailOutbox), [{**email, 'attempts': 0, 'created_at': now} for email in emails])
+
+def send_batch(limit):
+    """Send up to `limit` queued emails over one connection and commit. Returns (sent, failed)."""
+    rows = db.session.execute(
+        db.select(EmailOutbox.id, EmailOutbox.recipient, EmailOutbox.subject, EmailOutbox.html)
+        .where(EmailOutbox.sent_at == None, EmailOutbox.attempts < current_app.config['OUTBOX_MAX_ATTEMPTS'])
+        .order_by(EmailOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        db.session.rollback()
+        return 0, 0
+    sent, failed = [], []
+    sender = current_app.config['MAIL_DEFAULT_SENDER']
+    try:
+        with mail.connect() as connection:
+            for row in rows:
+                try:
+                    connection.send(Message(subject=row.subject, recipients=[row.recipient], html=row.html, sender=sender))
+                    sent.append(row.id)
+                except Exception as e:
+                    current_app.logger.error(f"Outbox email {row.id} to {row.recipient} failed: {e}")
+                    failed.append(row.id)
+    except Exception as e: # Could not connect; whatever was not sent is retried later
+        current_app.logger.error(f"Outbox could not reach the mail server: {e}")
+        done = set(sent)
+        failed = [row.id for row in rows if row.id not in done]
+    if sent:
+        db.session.execute(db.update(EmailOutbox).where(EmailOutbox.id.in_(sent)).values(sent_at=datetime.utcnow()))
+    if failed:
+        db.session.execute(db.update(EmailOutbox).where(EmailOutbox.id.in_(failed))
+                           .values(attempts=EmailOutbox.attempts + 1))
+    db.session.commit()
+    return len(sent), len(failed)
+
+def deliver():
+    """Send queued emails batch by batch until none are left or a batch has failures. Returns (sent, failed)."""
+    limit = current_app.config['OUTBOX_BATCH_SIZE']
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = send_batch(limit)
+        total_sent += sent
+        total_failed += failed
+        if failed or sent < limit:
+            return total_sent, total_failed
+
+def deliver_soon():
+    """Send queued emails on the background pool. Call after committing."""
+    tasks.submit(deliver)
+
+def init_app(app):
+    @app.cli.command('send-outbox')
+    def send_outbox_command():
+        """Send queued emails. Run every minute or so as a backstop for the background sender."""
+        sent, failed = deliver()
+        click.echo(f'{sent} emails sent, {failed} failed.')
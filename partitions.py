@@ -0,0 +1,178 @@
+"""Monthly range partitioning of orders and payments on Postgres.
+
+    flask --app main maintain-partitions --convert   # print the SQL that would partition the plain tables
+    flask --app main maintain-partitions --convert --execute   # once: run it
+    flask --app main maintain-partitions             # monthly (cron): create the next months' partitions
+                                                     # and drop the empty ones archive-orders left behind
+
+Both tables are partitioned on created_at, one partition per calendar month, plus a default partition
+that catches rows outside every month (it should stay empty). Queries that bound created_at (the revenue
+chart, keyset pages of order history, archival) only touch the partitions in range, and the newest-first
+lists stop after the most recent partition, so their cost follows recent volume rather than all history.
+
+Postgres requires the partition key in every unique constraint, so the primary keys become
+(id, created_at) and order_items/payments lose their foreign keys to orders: a foreign key must
+reference a unique key, and those tables have no created_at to reference the new one with. The other
+foreign keys of the converted tables (orders.customer_id) are re-created. The conversion locks both
+tables while their rows are copied, so --convert only prints its SQL, listing the foreign keys that
+will be dropped, unless --execute is given as well. It was tested against Postgres 16.
+
+On SQLite and other databases the command does nothing and the tables stay as create_all() made them.
+"""
+from datetime import datetime
+import re
+import click
+from sqlalchemy.schema import AddConstraint, CreateIndex
+from app import db
+from models import Order, Payment
+from archive import months_ago
+
+# Parents first: converting orders drops the foreign keys that point at it
+PARTITIONED_MODELS = (Order, Payment)
+
+def month_start(moment, months=0):
+    """Midnight on the first of the month `months` after (or before, if negative) moment's month"""
+    month_index = moment.year * 12 + moment.month - 1 + months
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+def is_supported():
+    return db.engine.dialect.name == 'postgresql'
+
+def is_partitioned(table):
+    return bool(db.session.scalar(db.text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+    ), {'table': table}))
+
+def monthly_partitions(table):
+    """{month: partition name} for the monthly partitions of table"""
+    names = db.session.scalars(db.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :table AND pg_table_is_visible(p.oid)"
+    ), {'table': table})
+    months = {}
+    for name in names:
+        match = re.fullmatch(rf"{re.escape(table)}_p(\d{{4}})_(\d{{2}})", name)
+        if match:
+            months[datetime(int(match.group(1)), int(match.group(2)), 1)] = name
+    return months
+
+def is_empty(name):
+    return not db.session.scalar(db.text(f'SELECT EXISTS (SELECT 1 FROM "{name}")'))
+
+def _execute(sql):
+    db.session.execute(db.text(sql))
+
+def create_partitions(table, first, last, run=_execute):
+    """Create the monthly partitions of table for first..last (months, inclusive) that do not exist yet"""
+    created = []
+    month = month_start(first)
+    while month <= last:
+        name = partition_name(table, month)
+        if not db.session.scalar(db.text("SELECT to_regclass(:name)"), {'name': name}):
+            run(f'CREATE TABLE "{name}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{month_start(month, 1):%Y-%m-%d}')")
+            created.append(name)
+        month = month_start(month, 1)
+    return created
+
+def referencing_foreign_keys(table):
+    """[(table, constraint name)] of the foreign keys in other tables that point at table"""
+    return db.session.execute(db.text(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+        "WHERE contype = 'f' AND confrelid = to_regclass(:table) AND conrelid <> confrelid ORDER BY 1, 2"
+    ), {'table': table}).all()
+
+def convert(model, months_ahead, run=_execute):
+    """Rebuild model's table as a partitioned table with the same rows, columns, defaults, indexes and
+    foreign keys, passing each statement to run (which executes it by default)"""
+    table = model.__table__
+    old = f"{table.name}_unpartitioned"
+    compile = lambda ddl: str(ddl.compile(dialect=db.engine.dialect))
+    run(f'LOCK TABLE "{table.name}" IN ACCESS EXCLUSIVE MODE')
+    run(f'UPDATE "{table.name}" SET created_at = now() WHERE created_at IS NULL')
+    first = db.session.scalar(db.text(f'SELECT min(created_at) FROM "{table.name}"')) or datetime.utcnow()
+    sequence = db.session.scalar(db.text("SELECT pg_get_serial_sequence(:table, 'id')"), {'table': table.name})
+    dropped = referencing_foreign_keys(table.name)
+
+    run(f'ALTER TABLE "{table.name}" RENAME TO "{old}"')
+    run(f'ALTER INDEX IF EXISTS "{table.name}_pkey" RENAME TO "{old}_pkey"')
+    for index in table.indexes:
+        run(f'DROP INDEX IF EXISTS "{index.name}"')
+    run(f'CREATE TABLE "{table.name}" (LIKE "{old}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        f'PARTITION BY RANGE (created_at)')
+    run(f'ALTER TABLE "{table.name}" ADD PRIMARY KEY (id, created_at)')
+    run(f'CREATE TABLE "{table.name}_default" PARTITION OF "{table.name}" DEFAULT')
+    create_partitions(table.name, first, month_start(datetime.utcnow(), months_ahead), run)
+    run(f'INSERT INTO "{table.name}" SELECT * FROM "{old}"')
+    if sequence:
+        # The id sequence belongs to the old table's column and would be dropped with it
+        run(f'ALTER SEQUENCE {sequence} OWNED BY "{table.name}".id')
+    for referencing_table, name in dropped:
+        run(f'-- drops foreign key {name} on {referencing_table}; it cannot point at a partitioned table\'s (id, created_at)')
+    run(f'DROP TABLE "{old}" CASCADE')
+
+    for index in table.indexes:
+        run(compile(CreateIndex(index)))
+    partitioned = {m.__tablename__ for m in PARTITIONED_MODELS}
+    for constraint in table.foreign_key_constraints:
+        if constraint.referred_table.name not in partitioned:
+            run(compile(AddConstraint(constraint)))
+
+def drop_empty_partitions(table, before):
+    """Drop the empty monthly partitions that end before `before`, typically emptied by archive-orders.
+    Lookups by id alone cannot be pruned and probe every partition, so this keeps them cheap."""
+    dropped = []
+    for month, name in sorted(monthly_partitions(table).items()):
+        if month_start(month, 1) <= before and is_empty(name):
+            db.session.execute(db.text(f'DROP TABLE "{name}"'))
+            dropped.append(name)
+    return dropped
+
+def maintain(months_ahead, drop_before=None, convert_tables=False, execute=False, log=print):
+    for model in PARTITIONED_MODELS:
+        table = model.__tablename__
+        if not is_partitioned(table):
+            if not convert_tables:
+                log(f"{table} is not partitioned; run with --convert to partition it.")
+                continue
+            if not execute:
+                log(f"-- Converting {table} would run:")
+                convert(model, months_ahead, lambda sql: log(sql if sql.startswith('--') else f"{sql.strip()};"))
+                db.session.rollback()
+                log(f"-- Dry run: {table} was not changed. Add --execute to convert it.")
+                continue
+            convert(model, months_ahead, lambda sql: log(sql) if sql.startswith('--') else _execute(sql))
+            db.session.commit()
+            log(f"Converted {table} to monthly partitions.")
+        created = create_partitions(table, datetime.utcnow(), month_start(datetime.utcnow(), months_ahead))
+        db.session.commit()
+        for name in created:
+            log(f"Created partition {name}")
+        if drop_before:
+            for name in drop_empty_partitions(table, drop_before):
+                log(f"Dropped empty partition {name}")
+            db.session.commit()
+        if not is_empty(f"{table}_default"):
+            log(f"Warning: {table}_default holds rows outside every monthly partition; "
+                f"move them into their month's partition.")
+
+def init_app(app):
+    @app.cli.command('maintain-partitions')
+    @click.option('--months-ahead', default=lambda: app.config['PARTITION_MONTHS_AHEAD'], type=int,
+                  help='Create partitions up to this many months after the current one.')
+    @click.option('--convert', 'convert_tables', is_flag=True,
+                  help='Print the SQL that rebuilds orders and payments as partitioned tables if they are not yet.')
+    @click.option('--execute', is_flag=True,
+                  help='With --convert, run that SQL. Locks both tables while rows are copied and drops the foreign keys to orders.')
+    @click.option('--keep-empty', is_flag=True, help='Keep empty partitions older than ARCHIVE_AFTER_MONTHS.')
+    def maintain_partitions_command(months_ahead, convert_tables, execute, keep_empty):
+        """Create upcoming monthly partitions of orders and payments (Postgres only)."""
+        if not is_supported():
+            click.echo(f'Partitioning needs Postgres; nothing to do on {db.engine.dialect.name}.')
+            return
+        drop_before = None if keep_empty else months_ago(app.config['ARCHIVE_AFTER_MONTHS'])
+        maintain(months_ahead, drop_before=drop_before, convert_tables=convert_tables, execute=execute, log=click.echo)
@@ -0,0 +1,51 @@
+import threading
+import time
+
+
+class TokenBucketLimiter:
+    """In-memory token bucket keyed by an arbitrary string (IP, email, ...).
+
+    Each key starts with `capacity` tokens and regains them at `capacity / period`
+    tokens per second. State is per process, so with several gunicorn workers the
+    effective limit is `capacity * workers` - good enough to stop brute force from
+    burning CPU on password hashing without needing a shared store.
+    """
+
+    def __init__(self, capacity, period, max_keys=100000):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / float(period)
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> (tokens, last_refill)
+        self._lock = threading.Lock()
+
+    def consume(self, key, tokens=1):
+        """Take `tokens` from the bucket for `key`. Returns False if there are not enough."""
+        now = time.monotonic()
+        with self._lock:
+            available, last = self._buckets.get(key, (self.capacity, now))
+            available = min(self.capacity, available + (now - last) * self.rate)
+            allowed = available >= tokens
+            if allowed:
+                available -= tokens
+            self._buckets[key] = (available, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return allowed
+
+    def peek(self, key, tokens=1):
+        """Check whether `key` has `tokens` available, without taking them"""
+        now = time.monotonic()
+        with self._lock:
+            available, last = self._buckets.get(key, (self.capacity, now))
+            return min(self.capacity, available + (now - last) * self.rate) >= tokens
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def _prune(self, now):
+        # Drop buckets that have refilled completely; they are equivalent to a missing key
+        full_after = self.capacity / self.rate
+        stale = [key for key, (_, last) in self._buckets.items() if now - last >= full_after]
+        for key in stale:
+            del self._buckets[key]
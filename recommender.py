@@ -0,0 +1,233 @@
+""""Customers also bought" recommendations from order history.
+
+Offline, `flask --app main build-recommendations` reads every (order, product) line of the orders
+that were not cancelled, builds the binary order x product matrix and multiplies it by its own
+transpose to count how often each pair of products was bought together. A pair's score is the cosine
+similarity of the two products' sets of orders, count / sqrt(orders of a * orders of b), so
+bestsellers do not crowd every list. The RECOMMENDATIONS_K best products for each product, bought
+together at least RECOMMENDATION_MIN_SUPPORT times, replace the product_recommendations table.
+
+With numpy and scipy installed the counting is a sparse matrix product; without them a pure Python
+pair count gives the same lists, only more slowly.
+
+`--incremental` only handles the products bought since the previous build: it reloads just the
+orders that contain them and rewrites their lists, which are then exact. Other products keep their
+lists until the next full build, which is meant to run nightly.
+
+Pages read the table by primary key (product_id, rank), so serving costs one indexed range scan.
+"""
+import math
+import time
+from array import array
+from collections import Counter, defaultdict
+import click
+from sqlalchemy import func
+from app import db
+from models import Order, OrderItem, Product, ProductRecommendation, RecommendationBuild
+from catalog import card_query, load_cards
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+WRITE_CHUNK_SIZE = 5000
+TARGET_CHUNK_SIZE = 5000 # Products whose pair counts are held in memory at once
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _top(candidates, k):
+    """[(product id, score)] best first; ties go to the lower id so builds are reproducible"""
+    return sorted(candidates, key=lambda candidate: (-candidate[1], candidate[0]))[:k]
+
+def _neighbours_python(order_ids, product_ids, k, min_support, targets, frequencies):
+    baskets = defaultdict(set)
+    for order_id, product_id in zip(order_ids, product_ids):
+        baskets[order_id].add(product_id)
+    if frequencies is None:
+        frequencies = Counter(product_id for basket in baskets.values() for product_id in basket)
+    targets = set(targets) if targets is not None else None
+    pairs = defaultdict(Counter)
+    for basket in baskets.values():
+        for product_id in basket if targets is None else basket & targets:
+            counts = pairs[product_id]
+            for other_id in basket:
+                if other_id != product_id:
+                    counts[other_id] += 1
+    result = {}
+    for product_id, counts in pairs.items():
+        candidates = [(other_id, count / math.sqrt(frequencies[product_id] * frequencies[other_id]))
+                      for other_id, count in counts.items() if count >= min_support]
+        if candidates:
+            result[product_id] = _top(candidates, k)
+    return result
+
+def _neighbours_numpy(order_ids, product_ids, k, min_support, targets, frequencies):
+    order_ids = np.asarray(order_ids, dtype=np.int64)
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    if not len(order_ids):
+        return {}
+    _, rows = np.unique(order_ids, return_inverse=True)
+    items, columns = np.unique(product_ids, return_inverse=True)
+    baskets = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)),
+                                shape=(rows.max() + 1, len(items)))
+    baskets.data[:] = 1 # A product listed twice in one order still counts once
+    if frequencies is None:
+        counts = np.asarray(baskets.sum(axis=0)).ravel().astype(np.float64)
+    else:
+        counts = np.array([frequencies[product_id] for product_id in items.tolist()], dtype=np.float64)
+    target_columns = np.arange(len(items)) if targets is None else np.flatnonzero(np.isin(items, list(targets)))
+    baskets_by_product = baskets.tocsc()
+
+    result = {}
+    for start in range(0, len(target_columns), TARGET_CHUNK_SIZE):
+        chunk = target_columns[start:start + TARGET_CHUNK_SIZE]
+        together = (baskets_by_product[:, chunk].T.tocsr() @ baskets).tocoo()
+        row, column, count = chunk[together.row], together.col, together.data
+        keep = (row != column) & (count >= min_support)
+        row, column, count = row[keep], column[keep], count[keep]
+        score = count / np.sqrt(counts[row] * counts[column])
+        order = np.lexsort((items[column], -score, row))
+        row, column, score = row[order], column[order], score[order]
+        starts = np.flatnonzero(np.r_[True, row[1:] != row[:-1]])
+        rank = np.arange(len(row)) - np.repeat(starts, np.diff(np.r_[starts, len(row)]))
+        keep = rank < k
+        for product_id, other_id, value in zip(items[row[keep]].tolist(), items[column[keep]].tolist(),
+                                               score[keep].tolist()):
+            result.setdefault(product_id, []).append((other_id, value))
+    return result
+
+def neighbours(order_ids, product_ids, k=10, min_support=2, targets=None, frequencies=None):
+    """{product id: [(recommended product id, score)] best first} from parallel order/product id columns.
+
+    targets limits the products whose lists are computed (default: all of them); frequencies
+    ({product id: orders}) must be given when the lines are not the whole history, since the score
+    needs each product's total number of orders.
+    """
+    if np is not None:
+        return _neighbours_numpy(order_ids, product_ids, k, min_support, targets, frequencies)
+    return _neighbours_python(order_ids, product_ids, k, min_support, targets, frequencies)
+
+def _lines(last_order_id, order_ids=None):
+    """Parallel arrays of the (order id, product id) lines of orders that were not cancelled"""
+    stmt = (db.select(OrderItem.order_id, OrderItem.product_id)
+            .join(Order, OrderItem.order_id == Order.id)
+            .where(Order.status != 'cancelled', Order.id <= last_order_id))
+    if order_ids is not None:
+        stmt = stmt.where(OrderItem.order_id.in_(order_ids))
+    orders, products = array('q'), array('q')
+    for order_id, product_id in db.session.execute(stmt.execution_options(yield_per=50000)):
+        orders.append(order_id)
+        products.append(product_id)
+    return orders, products
+
+def _frequencies(product_ids, last_order_id):
+    frequencies = {}
+    for chunk in _chunks(product_ids, WRITE_CHUNK_SIZE):
+        frequencies.update(db.session.execute(
+            db.select(OrderItem.product_id, func.count(func.distinct(OrderItem.order_id)))
+            .join(Order, OrderItem.order_id == Order.id)
+            .where(Order.status != 'cancelled', Order.id <= last_order_id, OrderItem.product_id.in_(chunk))
+            .group_by(OrderItem.product_id)
+        ).all())
+    return frequencies
+
+def _write(recommendations, replace_ids=None):
+    """Store the lists. replace_ids=None replaces the whole table, otherwise only those products' rows."""
+    table = ProductRecommendation.__table__
+    if replace_ids is None:
+        db.session.execute(db.delete(table))
+    else:
+        for chunk in _chunks(replace_ids, WRITE_CHUNK_SIZE):
+            db.session.execute(db.delete(table).where(table.c.product_id.in_(chunk)))
+    rows = [{'product_id': product_id, 'rank': rank, 'recommended_id': other_id, 'score': score}
+            for product_id, others in recommendations.items() for rank, (other_id, score) in enumerate(others)]
+    for chunk in _chunks(rows, WRITE_CHUNK_SIZE):
+        db.session.execute(db.insert(table), chunk)
+
+def latest_build():
+    return db.session.scalars(db.select(RecommendationBuild).order_by(RecommendationBuild.id.desc()).limit(1)).first()
+
+def build(k=10, min_support=2, incremental=False):
+    """Recompute the recommendations and record the build. Returns the RecommendationBuild.
+    Part of the caller's transaction. An incremental build with no earlier build is a full one."""
+    started = time.perf_counter()
+    last_order_id = db.session.scalar(db.select(func.max(Order.id))) or 0
+    previous = latest_build() if incremental else None
+    if previous is None:
+        orders, products = _lines(last_order_id)
+        recommendations = neighbours(orders, products, k, min_support)
+        _write(recommendations)
+        mode, rewritten = 'full', len(recommendations)
+    else:
+        new_orders = db.select(Order.id).where(Order.id > previous.last_order_id, Order.id <= last_order_id)
+        targets = db.session.scalars(
+            db.select(OrderItem.product_id).where(OrderItem.order_id.in_(new_orders)).distinct()
+        ).all()
+        orders, products = array('q'), array('q')
+        if targets:
+            new_products = db.select(OrderItem.product_id).where(OrderItem.order_id.in_(new_orders))
+            affected_orders = db.select(OrderItem.order_id).where(OrderItem.product_id.in_(new_products))
+            orders, products = _lines(last_order_id, affected_orders)
+        recommendations = neighbours(orders, products, k, min_support, targets=targets,
+                                     frequencies=_frequencies(set(products), last_order_id))
+        _write(recommendations, replace_ids=targets)
+        mode, rewritten = 'incremental', len(targets)
+    record = RecommendationBuild(mode=mode, last_order_id=last_order_id, products=rewritten,
+                                 duration=time.perf_counter() - started)
+    db.session.add(record)
+    return record
+
+def recommended_cards(product_id, limit=8):
+    """ProductCards bought together with product_id, best first, active products only"""
+    return load_cards(
+        card_query().join(ProductRecommendation, ProductRecommendation.recommended_id == Product.id)
+        .where(ProductRecommendation.product_id == product_id, Product.is_active == True)
+        .order_by(ProductRecommendation.rank).limit(limit)
+    )
+
+def cart_recommendations(product_ids, limit=8):
+    """ProductCards bought together with any of product_ids and not among them, best match first"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return []
+    candidates = (db.select(ProductRecommendation.recommended_id, func.max(ProductRecommendation.score).label('score'))
+                  .where(ProductRecommendation.product_id.in_(product_ids),
+                         ProductRecommendation.recommended_id.not_in(product_ids))
+                  .group_by(ProductRecommendation.recommended_id).subquery())
+    return load_cards(
+        card_query().join(candidates, candidates.c.recommended_id == Product.id)
+        .where(Product.is_active == True)
+        .order_by(candidates.c.score.desc(), Product.id).limit(limit)
+    )
+
+def recommendation_fingerprint(product_id):
+    """Changes when product_id's list or any product on it changes"""
+    count, positions, versions = db.session.execute(
+        db.select(func.count(), func.sum(ProductRecommendation.recommended_id * (ProductRecommendation.rank + 1)),
+                  func.sum(Product.version))
+        .select_from(ProductRecommendation)
+        .join(Product, ProductRecommendation.recommended_id == Product.id)
+        .where(ProductRecommendation.product_id == product_id, Product.is_active == True)
+    ).one()
+    return f'{count}-{positions}-{versions}'
+
+def init_app(app):
+    @app.cli.command('build-recommendations')
+    @click.option('--incremental', is_flag=True, help='Only update products bought since the last build.')
+    @click.option('--k', type=int, default=None, help='Recommendations kept per product (default: RECOMMENDATIONS_K).')
+    @click.option('--min-support', type=int, default=None,
+                  help='Orders two products must share (default: RECOMMENDATION_MIN_SUPPORT).')
+    def build_recommendations_command(incremental, k, min_support):
+        """Rebuild "customers also bought" from order history. Run nightly; --incremental in between."""
+        record = build(k=k or app.config['RECOMMENDATIONS_K'],
+                       min_support=min_support or app.config['RECOMMENDATION_MIN_SUPPORT'],
+                       incremental=incremental)
+        db.session.commit()
+        engine = 'numpy/scipy' if np is not None else 'pure Python'
+        click.echo(f'{record.mode.capitalize()} build: {record.products} products updated from orders up to '
+                   f'#{record.last_order_id} in {record.duration:.1f}s ({engine}).')
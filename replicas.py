@@ -0,0 +1,138 @@
+"""Read-replica routing.
+
+Set DATABASE_REPLICA_URLS to a comma-separated list of replica URIs. Views and helpers wrapped in
+`read_replica` then send their SELECTs to a replica; flushes, INSERT/UPDATE/DELETE statements and
+SELECT ... FOR UPDATE always go to the primary.
+
+A request falls back to the primary when:
+- no replicas are configured;
+- the browser recently wrote something (see `stick_to_primary`), so it can read its own writes;
+- every replica is unreachable or lagging more than REPLICA_MAX_LAG seconds.
+
+Locally, point DATABASE_URL and DATABASE_REPLICA_URLS at two SQLite files or at two Postgres
+databases. A database that is not a streaming standby always reports zero lag.
+"""
+import random
+import threading
+import time
+from functools import wraps
+from flask import current_app, session
+from flask_login import current_user
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from dbpool import engine_options
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+# Replay lag in seconds on a Postgres standby; 0 when it has applied everything it received
+_PG_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+_replica_status = {} # bind key -> (checked_at, usable)
+_status_lock = threading.Lock()
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica chosen by `read_replica`, and everything else to the primary"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if (replica is not None and bind is None and not self._flushing
+                and not getattr(clause, 'is_dml', False)
+                and getattr(clause, '_for_update_arg', None) is None):
+            return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def replica_binds(urls, environ):
+    """SQLALCHEMY_BINDS entries for a comma-separated list of replica URIs, with the same pool settings as the primary"""
+    urls = [url.strip() for url in (urls or '').split(',') if url.strip()]
+    return {f'{REPLICA_BIND_PREFIX}{i}': dict(engine_options(url, environ), url=url) for i, url in enumerate(urls)}
+
+def _replica_keys():
+    return [key for key in current_app.config.get('SQLALCHEMY_BINDS', {}) if key.startswith(REPLICA_BIND_PREFIX)]
+
+def _replica_lag(engine):
+    if engine.dialect.name != 'postgresql':
+        return 0.0
+    with engine.connect() as conn:
+        return float(conn.execute(_PG_LAG_SQL).scalar() or 0)
+
+def _is_usable(key):
+    """Whether a replica is reachable and fresh enough, re-probed at most every REPLICA_CHECK_INTERVAL seconds"""
+    from app import db
+    now = time.monotonic()
+    checked_at, usable = _replica_status.get(key, (None, False))
+    if checked_at is not None and now - checked_at < current_app.config['REPLICA_CHECK_INTERVAL']:
+        return usable
+    with _status_lock:
+        checked_at, usable = _replica_status.get(key, (None, False))
+        if checked_at is not None and now - checked_at < current_app.config['REPLICA_CHECK_INTERVAL']:
+            return usable # Another thread probed while we waited
+        try:
+            lag = _replica_lag(db.engines[key])
+            usable = lag <= current_app.config['REPLICA_MAX_LAG']
+            if not usable:
+                current_app.logger.warning(f"Replica {key} is {lag:.1f}s behind; reading from the primary")
+        except Exception as e:
+            current_app.logger.warning(f"Replica {key} is unreachable, reading from the primary: {e}")
+            usable = False
+        _replica_status[key] = (now, usable)
+    return usable
+
+def stick_to_primary():
+    """Read from the primary for the next REPLICA_STICKY_SECONDS so this browser sees what it just wrote"""
+    if _replica_keys():
+        session['_primary_until'] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+
+def choose_replica():
+    """Bind key of a usable replica for this request, or None to stay on the primary"""
+    if session.get('_primary_until', 0) > time.time():
+        return None
+    usable = [key for key in _replica_keys() if _is_usable(key)]
+    return random.choice(usable) if usable else None
+
+def read_replica(f):
+    """Run a read-only view or helper against a replica when one is available"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        from app import db
+        db_session = db.session()
+        if 'replica' in db_session.info: # Already routed by an outer call
+            return f(*args, **kwargs)
+        # Load the user from the primary first so a just-registered account is never missing
+        current_user._get_current_object()
+        db_session.info['replica'] = choose_replica()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            db_session.info.pop('replica', None)
+    return decorated_function
+
+class _RoutedStream:
+    """A streamed body whose reads keep going to the replica the view was routed to"""
+
+    def __init__(self, chunks, db_session, replica):
+        self.chunks, self.db_session, self.replica = chunks, db_session, replica
+
+    def __iter__(self):
+        # read_replica has already unrouted the session when the view returned; the template renders now
+        self.db_session.info['replica'] = self.replica
+        try:
+            yield from self.chunks
+        finally:
+            self.db_session.info.pop('replica', None)
+
+    def close(self):
+        self.db_session.info.pop('replica', None)
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+
+def keep_routing(chunks):
+    """Wrap a streamed response body so lazy loads while it renders use this request's replica, if any"""
+    from app import db
+    db_session = db.session()
+    if db_session.info.get('replica') is None:
+        return chunks
+    return _RoutedStream(chunks, db_session, db_session.info['replica'])
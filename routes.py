@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, session, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, session, make_response, stream_with_context, abort
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from app import db
@@ -6,24 +6,49 @@ from models import User, Product, Category, Order, OrderItem, Cart, Wishlist, Pa
 from utils import admin_required, super_admin_required, generate_unique_code, allowed_file
 import os
 from datetime import datetime, timedelta
-from sqlalchemy import func, desc
+from decimal import Decimal
+from sqlalchemy import func, desc, bindparam
 from app import supabase_client
 import io
-from supabase.lib.client_options import ClientOptions
 import uuid # Import the uuid module
+import tasks
+import catalog_io
+from seller_directory import seller_page, seller_summary
+from sales_counters import record_sales, trending
+from category_counts import adjust_category_counts
+from cart_pricing import cart_snapshot, guest_snapshot, confirmed_snapshot, remember, bump_cart_versions
+from cart_store import MAX_QUANTITY, add_items, active_quantities, move_wishlist_to_cart as move_wishlist_items
+import guest_cart
+import order_workflow
+from recommender import recommended_cards, cart_recommendations, recommendation_fingerprint
+from category_assignments import MODES as CATEGORY_ASSIGNMENT_MODES, resolve_category_ids, assigned_category_ids, apply_assignments, set_categories
 import json # Import the json module
 import csv # Import the csv module
 # import requests # Removed as EmailJS is no longer used for backend
 from flask_mail import Message
 from app import mail # Import the mail instance
+from auth import claim_supabase_session
+from catalog import card_query, load_cards, wishlist_cards, get_product_detail, bump_product_versions, product_version
+from assets import webp_url
+from compression import render_long_page
+from order_history import ORDER_STATUSES, order_page, order_counts, invalidate_order_counts
+from replicas import read_replica, stick_to_primary
+from dbpool import pool_status
+from analytics import order_totals, paid_revenue_by_day, seller_totals, top_products as analytics_top_products
+from http_cache import conditional_page, catalog_fingerprint, category_fingerprint, invalidate_catalog_fingerprint
 
 main_bp = Blueprint('main', __name__)
 
 def get_authenticated_supabase_client(): # Removed use_service_role parameter
     from supabase import create_client
+    from supabase.lib.client_options import ClientOptions
     supabase_url = current_app.config["SUPABASE_URL"]
     supabase_key = current_app.config["SUPABASE_KEY"]
     
+    # Pick up the tokens from a background sign-in started at login, if this worker has one
+    if not session.get('supabase_jwt'):
+        claim_supabase_session(current_user.id)
+
     jwt = session.get('supabase_jwt')
     refresh_token = session.get('supabase_refresh_token')
     current_app.logger.debug(f"Initial Supabase JWT: {jwt[:10] + '...' if jwt else 'None'}, Refresh Token: {refresh_token[:10] + '...' if refresh_token else 'None'}")
@@ -65,19 +90,56 @@ def get_authenticated_supabase_client(): # Removed use_service_role parameter
     return create_client(supabase_url, supabase_key, options=options)
 
 
-@main_bp.route('/')
-def index():
-    # Get featured products (latest 8 products)
-    featured_products = Product.query.filter_by(is_active=True).order_by(desc(Product.created_at)).limit(8).all()
-    categories = Category.query.filter(Category.name != 'Handmade').all()
-    
+def _send_mail(msg):
+    mail.send(msg)
+    current_app.logger.info(f"Flask-Mail email '{msg.subject}' sent to {', '.join(msg.recipients)}")
+
+def _upload_product_images(client, files):
+    """Upload the allowed files to Supabase Storage in parallel.
+
+    Returns (index in files, public URL or None, exception or None) per uploaded file, in order.
+    """
+    bucket_name = current_app.config["SUPABASE_PRODUCTS_BUCKET"]
+
+    def upload(filename, data, content_type):
+        res = client.storage.from_(bucket_name).upload(filename, data, {"content-type": content_type})
+        # Supabase upload response is usually a dictionary on success with 'Key' or 'path', or raises exception on error
+        if isinstance(res, dict) and res.get('error'):
+            raise Exception(res['error'].get('message', 'Unknown Supabase upload error'))
+        return client.storage.from_(bucket_name).get_public_url(filename)
+
+    uploads = []
+    for i, file in enumerate(files):
+        if file and file.filename and allowed_file(file.filename):
+            filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{secure_filename(file.filename)}"
+            # The request reads the bodies; only the network round trips run on the pool
+            uploads.append((i, filename, tasks.executor.submit(upload, filename, file.read(), file.content_type)))
+
+    results = []
+    for i, filename, future in uploads:
+        try:
+            results.append((i, future.result(), None))
+        except Exception as e:
+            current_app.logger.error(f"Supabase upload exception for {filename}: {e}")
+            results.append((i, None, e))
+    return results
+
+def _static_image(relative_path):
+    return {'url': url_for('static', filename=relative_path), 'webp': webp_url(relative_path)}
+
+def _homepage_images():
+    """Slider images and category icons found under static/, listed once per process"""
+    cached = current_app.extensions.get('homepage_images')
+    if cached is not None:
+        return cached
+
     # Get slider images
     slider_folder = os.path.join(current_app.root_path, 'static', 'Slider')
     slider_images = []
     if os.path.exists(slider_folder):
         for filename in os.listdir(slider_folder):
             if filename.lower().endswith( ('.png', '.jpg', '.jpeg', '.gif') ):
-                slider_images.append(url_for('static', filename=f'Slider/{filename}'))
+                slider_images.append(_static_image(f'Slider/{filename}'))
 
     # Get category icon images
     category_icons_folder = os.path.join(current_app.root_path, 'static', 'Cat')
@@ -87,19 +149,42 @@ def index():
             if filename.lower().endswith( ('.png', '.jpg', '.jpeg', '.gif') ):
                 # Assuming image filename matches category name (e.g., "Electronics.png" for "Electronics")
                 category_name_from_file = os.path.splitext(filename)[0].replace(' ', '_').replace('&', 'and') # Normalize for matching
-                category_icon_map[category_name_from_file] = url_for('static', filename=f'Cat/{filename}')
+                category_icon_map[category_name_from_file] = _static_image(f'Cat/{filename}')
+
+    current_app.extensions['homepage_images'] = (slider_images, category_icon_map)
+    return slider_images, category_icon_map
+
+def _catalog_page_etag(**kwargs):
+    return f'catalog-{catalog_fingerprint()}'
+
+def _product_page_etag(product_id):
+    # The page also renders the category menu from base.html and the "customers also bought" cards
+    return (f'product-{product_id}-v{product_version(product_id)}-{category_fingerprint()}'
+            f'-r{recommendation_fingerprint(product_id)}')
+
+@main_bp.route('/')
+@read_replica
+@conditional_page(_catalog_page_etag)
+def index():
+    # Get featured products (latest 8 products)
+    featured_products = load_cards(card_query().where(Product.is_active == True).order_by(desc(Product.created_at)).limit(8))
+    categories = Category.query.filter(Category.name != 'Handmade').all()
+    
+    slider_images, category_icon_map = _homepage_images()
 
     # Attach icon URLs to categories
     categories_with_icons = []
     for category in categories:
         normalized_category_name = category.name.replace(' ', '_').replace('&', 'and')
+        icon = category_icon_map.get(normalized_category_name, {})
         category_dict = {
             'id': category.id,
             'name': category.name,
             'description': category.description,
-            'icon_url': category_icon_map.get(normalized_category_name),
-            'image_url': category_icon_map.get(normalized_category_name),
-            'product_count': 1000 + category.id * 100 # Mock product count
+            'icon_url': icon.get('url'),
+            'image_url': icon.get('url'),
+            'image_webp_url': icon.get('webp'),
+            'product_count': category.product_count # Maintained counter, no per-request aggregation
         }
         categories_with_icons.append(category_dict)
 
@@ -112,10 +197,10 @@ def index():
 @main_bp.route('/admin/dashboard')
 @login_required
 @admin_required
+@read_replica
 def admin_dashboard():
     # Analytics data
-    total_orders = Order.query.count()
-    total_revenue = db.session.query(func.sum(Order.total_amount)).scalar() or 0
+    total_orders, total_revenue = order_totals() # Live orders plus archived rollups
     total_users = User.query.filter_by(role='customer').count()
     total_super_admins = User.query.filter_by(role='super_admin').count()
 
@@ -130,18 +215,15 @@ def admin_dashboard():
     monthly_revenue_values = [item['revenue'] for item in monthly_revenue_data]
     
     # Top selling products
-    top_products = db.session.query(
-        Product.name, func.sum(OrderItem.quantity).label('total_sold')
-    ).join(OrderItem).group_by(Product.id).order_by(desc('total_sold')).limit(5).all()
-    top_products = [{ "name": p, "total_sold": s } for p, s in top_products]
+    top_products = analytics_top_products(5)
 
     # Not Selling Products (sales_count is 0)
     not_selling_products = Product.query.filter_by(sales_count=0, is_active=True).limit(5).all()
 
     # Products by Category for the pie chart
-    category_product_counts = db.session.query(Category.name, func.count(Product.id)) \
-                                   .join(Product) \
-                                   .group_by(Category.name).all()
+    category_product_counts = db.session.query(Category.name, Category.product_count) \
+                                   .filter(Category.product_count > 0) \
+                                   .order_by(Category.name).all()
     category_pie_labels = [data[0] for data in category_product_counts]
     category_pie_values = [data[1] for data in category_product_counts]
 
@@ -168,76 +250,34 @@ def admin_dashboard():
                          recent_orders=recent_orders,
                          time_period=time_period) # Pass time_period to template
 
+@read_replica
 def admin_revenue_data_fetch(time_period='month'):
     today = datetime.now().date()
     revenue_data = []
 
-    if time_period == 'week':
-        for i in range(7): # Last 7 days
-            date = today - timedelta(days=i)
-            day_start = datetime.combine(date, datetime.min.time())
-            day_end = datetime.combine(date, datetime.max.time())
-            
-            revenue = db.session.query(func.sum(Payment.amount)).filter(
-                Payment.payment_status == 'paid',
-                Payment.created_at >= day_start,
-                Payment.created_at <= day_end
-            ).scalar() or 0
-            
-            revenue_data.append({
-                'period': date.strftime('%Y-%m-%d'),
-                'revenue': float(revenue)
-            })
-        revenue_data.reverse() # Show recent days first
-    elif time_period == 'month':
-        for i in range(30): # Last 30 days
-            date = today - timedelta(days=i)
-            day_start = datetime.combine(date, datetime.min.time())
-            day_end = datetime.combine(date, datetime.max.time())
-            
-            revenue = db.session.query(func.sum(Payment.amount)).filter(
-                Payment.payment_status == 'paid',
-                Payment.created_at >= day_start,
-                Payment.created_at <= day_end
-            ).scalar() or 0
-            
+    if time_period in ('week', 'month'):
+        days = 7 if time_period == 'week' else 30 # Last 7 or 30 days
+        start = today - timedelta(days=days - 1)
+        revenue_by_day = paid_revenue_by_day(start, today)
+        for i in range(days):
+            date = start + timedelta(days=i)
             revenue_data.append({
                 'period': date.strftime('%Y-%m-%d'),
-                'revenue': float(revenue)
+                'revenue': float(revenue_by_day.get(date, 0))
             })
-        revenue_data.reverse() # Show recent days first
     elif time_period == 'year':
-        for i in range(12): # Last 12 months
-            # Correct way to get the first day of the month 'i' months ago
-            current_month = today.month
-            current_year = today.year
-            
-            # Calculate target month and year
-            target_month_num = current_month - i
-            target_year_num = current_year
-            while target_month_num <= 0:
-                target_month_num += 12
-                target_year_num -= 1
-            
-            target_month_start = datetime(target_year_num, target_month_num, 1)
-            
-            # Calculate the last day of the target month
-            if target_month_num == 12:
-                target_month_end = datetime(target_year_num + 1, 1, 1) - timedelta(microseconds=1)
-            else:
-                target_month_end = datetime(target_year_num, target_month_num + 1, 1) - timedelta(microseconds=1)
-
-            revenue = db.session.query(func.sum(Payment.amount)).filter(
-                Payment.payment_status == 'paid',
-                Payment.created_at >= target_month_start,
-                Payment.created_at <= target_month_end
-            ).scalar() or 0
-            
+        # Last 12 months, oldest first
+        month_index = today.year * 12 + today.month - 1
+        months = [(index // 12, index % 12 + 1) for index in range(month_index - 11, month_index + 1)]
+        revenue_by_day = paid_revenue_by_day(datetime(months[0][0], months[0][1], 1).date(), today)
+        revenue_by_month = {}
+        for date, revenue in revenue_by_day.items():
+            revenue_by_month[(date.year, date.month)] = revenue_by_month.get((date.year, date.month), 0) + revenue
+        for year, month in months:
             revenue_data.append({
-                'period': target_month_start.strftime('%Y-%m'),
-                'revenue': float(revenue)
+                'period': f"{year:04d}-{month:02d}",
+                'revenue': float(revenue_by_month.get((year, month), 0))
             })
-        revenue_data.reverse() # Show recent months first
 
     return revenue_data
 
@@ -245,6 +285,7 @@ def admin_revenue_data_fetch(time_period='month'):
 @main_bp.route('/admin/revenue')
 @login_required
 @admin_required
+@read_replica
 def admin_revenue():
     time_period = request.args.get('time_period', 'month') # Default to month
     
@@ -262,12 +303,15 @@ def admin_revenue():
 @login_required
 @admin_required
 def admin_super_admins():
-    super_admins = User.query.filter_by(role='super_admin').all()
-    # Eagerly load categories for each super admin to prevent N+1 queries
-    for super_admin in super_admins:
-        super_admin.categories_list = list(super_admin.categories)
+    search = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config['SELLER_PAGE_SIZE']
+    # One query for the page (categories, product counts and revenue included) and one for the total
+    super_admins, total = seller_page(search, page, per_page)
+    pages = max((total + per_page - 1) // per_page, 1)
     categories = Category.query.all() # Fetch all categories
-    return render_template('admin/super_admins.html', super_admins=super_admins, categories=categories)
+    return render_template('admin/super_admins.html', super_admins=super_admins, categories=categories,
+                           search=search, page=page, pages=pages, total=total)
 
 @main_bp.route('/admin/download-revenue-csv')
 @login_required
@@ -296,6 +340,13 @@ def download_revenue_csv():
     response.headers["Content-type"] = "text/csv"
     return response
 
+@main_bp.route('/admin/system')
+@login_required
+@admin_required
+def admin_system():
+    # Connection pool health for the worker that served this request
+    return render_template('admin/system.html', pools=pool_status(db.engines))
+
 @main_bp.route('/admin/create-super-admin', methods=['POST'])
 @login_required
 @admin_required
@@ -327,14 +378,11 @@ def create_super_admin():
         is_active=False  # Will be activated after registration
     )
     
-    # Associate selected categories with the super admin
-    for category_id in selected_category_ids:
-        category = Category.query.get(int(category_id))
-        if category:
-            admin_user.categories.append(category)
-    
     try:
         db.session.add(admin_user)
+        db.session.flush() # The association rows reference the new user
+        # Associate selected categories with the super admin
+        set_categories(admin_user.id, resolve_category_ids(selected_category_ids))
         db.session.commit()
         flash(f'Super Admin created successfully! Unique code: {unique_code}', 'success')
     except Exception as e:
@@ -343,6 +391,38 @@ def create_super_admin():
     
     return redirect(url_for('main.admin_super_admins'))
 
+@main_bp.route('/admin/super-admins/assign-categories', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_assign_categories():
+    if request.method == 'POST':
+        selected_user_ids = request.form.getlist('super_admins')
+        selected_category_ids = request.form.getlist('categories')
+        mode = request.form.get('mode', 'add')
+
+        if not selected_user_ids or mode not in CATEGORY_ASSIGNMENT_MODES or (mode != 'replace' and not selected_category_ids):
+            flash('Please select super admins, categories and an action.', 'error')
+            return redirect(url_for('main.admin_assign_categories'))
+
+        user_ids = db.session.scalars(
+            db.select(User.id).where(User.id.in_(selected_user_ids), User.role == 'super_admin')
+        ).all()
+        try:
+            added, removed = apply_assignments(user_ids, resolve_category_ids(selected_category_ids), mode=mode)
+            db.session.commit()
+            flash(f'Updated {len(user_ids)} super admins: {added} assignments added, {removed} removed.', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Failed to update category assignments: {str(e)}', 'error')
+        return redirect(url_for('main.admin_assign_categories'))
+
+    super_admins = User.query.filter_by(role='super_admin').order_by(User.name).all()
+    categories = Category.query.order_by(Category.name).all()
+    category_names = {category.id: category.name for category in categories}
+    assigned = {user_id: sorted(category_names[category_id] for category_id in category_ids)
+                for user_id, category_ids in assigned_category_ids([user.id for user in super_admins]).items()}
+    return render_template('admin/assign_categories.html', super_admins=super_admins, categories=categories, assigned=assigned)
+
 @main_bp.route('/admin/toggle-super-admin/<string:user_id>')
 @login_required
 @admin_required
@@ -359,8 +439,9 @@ def toggle_super_admin(user_id):
 @login_required
 @admin_required
 def admin_view_super_admin(user_id):
-    super_admin = User.query.get_or_404(user_id)
-    return render_template('admin/view_super_admin.html', super_admin=super_admin)
+    super_admin = User.query.filter_by(id=user_id, role='super_admin').first_or_404()
+    summary = seller_summary(user_id)
+    return render_template('admin/view_super_admin.html', super_admin=super_admin, summary=summary)
 
 @main_bp.route('/admin/super-admin/delete/<string:user_id>', methods=['POST'])
 @login_required
@@ -406,14 +487,9 @@ def admin_edit_super_admin(user_id):
         super_admin.email = email
         super_admin.is_active = is_active
         
-        # Update assigned categories
-        super_admin.categories.clear()
-        for cat_id in selected_category_ids:
-            category = Category.query.get(int(cat_id))
-            if category:
-                super_admin.categories.append(category)
-        
         try:
+            # Update assigned categories, writing only the rows that changed
+            set_categories(super_admin.id, resolve_category_ids(selected_category_ids))
             db.session.commit()
             flash('Super Admin updated successfully!', 'success')
             return redirect(url_for('main.admin_super_admins'))
@@ -421,29 +497,25 @@ def admin_edit_super_admin(user_id):
             db.session.rollback()
             flash(f'Failed to update Super Admin: {str(e)}', 'error')
             
-    return render_template('admin/edit_super_admin.html', super_admin=super_admin, all_categories=all_categories)
+    assigned_ids = assigned_category_ids([super_admin.id])[super_admin.id]
+    return render_template('admin/edit_super_admin.html', super_admin=super_admin, all_categories=all_categories,
+                           assigned_ids=assigned_ids)
 
 # Super Admin Routes
 @main_bp.route('/super-admin/dashboard')
 @login_required
 @super_admin_required
+@read_replica
 def super_admin_dashboard():
     # Get super admin's products and stats
-    products_count = Product.query.filter_by(super_admin_id=current_user.id).count()
-    
-    # Orders for super admin's products
-    orders_count = db.session.query(Order).join(OrderItem).join(Product).filter(
-        Product.super_admin_id == current_user.id
-    ).count()
+    products_count = Product.query.filter_by(super_admin_id=current_user.id, is_active=True).count()
     
-    # Revenue from super admin's products
-    revenue = db.session.query(func.sum(OrderItem.price * OrderItem.quantity)).join(Product).filter(
-        Product.super_admin_id == current_user.id
-    ).scalar() or 0
+    # Orders and revenue for super admin's products, live plus archived rollups
+    orders_count, revenue = seller_totals(current_user.id)
     
     # Low stock products (less than 10)
     low_stock_products = Product.query.filter_by(
-        super_admin_id=current_user.id
+        super_admin_id=current_user.id, is_active=True
     ).filter(Product.stock < 10).all()
     
     # Recent orders for super admin's products
@@ -452,14 +524,14 @@ def super_admin_dashboard():
     ).order_by(desc(Order.created_at)).limit(10).all()
 
     # High Demand Products (e.g., top 5 by sales_count)
-    high_demand_products = Product.query.filter_by(super_admin_id=current_user.id) \
+    high_demand_products = Product.query.filter_by(super_admin_id=current_user.id, is_active=True) \
                                        .order_by(desc(Product.sales_count)) \
                                        .limit(5).all()
 
     # Products by Category for the graph
     category_data = db.session.query(Category.name, func.count(Product.id)) \
                             .join(Product) \
-                            .filter(Product.super_admin_id == current_user.id) \
+                            .filter(Product.super_admin_id == current_user.id, Product.is_active == True) \
                             .group_by(Category.name).all()
 
     category_labels = [data[0] for data in category_data]
@@ -481,7 +553,7 @@ def super_admin_dashboard():
 def super_admin_products():
     sort_category = request.args.get('sort_category') # Get sort_category parameter
 
-    query = Product.query.filter_by(super_admin_id=current_user.id)
+    query = Product.query.filter_by(super_admin_id=current_user.id, is_active=True)
 
     if sort_category:
         # Ensure we are filtering by a valid category assigned to the super admin
@@ -523,7 +595,6 @@ def add_product():
         dimensions = request.form.get('dimensions')
         ratings = request.form.get('ratings')
         num_ratings = request.form.get('num_ratings')
-        sales_count = request.form.get('sales_count')
         
         if not all([name, price, stock, category_id]):
             flash('Please fill in all required fields.', 'error')
@@ -546,58 +617,32 @@ def add_product():
                 brand=brand,
                 dimensions=dimensions,
                 ratings=float(ratings) if ratings else 0.0,
-                num_ratings=int(num_ratings) if num_ratings else 0,
-                sales_count=int(sales_count) if sales_count else 0
+                num_ratings=int(num_ratings) if num_ratings else 0
             )
             
             # Handle multiple image uploads
             files = request.files.getlist('images')
             uploaded_image_urls = []
             if files:
-                for i, file in enumerate(files):
-                    if file and file.filename and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{filename}"
-                        
-                        # Upload to Supabase Storage
-                        try:
-                            bucket_name = current_app.config["SUPABASE_PRODUCTS_BUCKET"]
-                            with io.BytesIO(file.read()) as data:
-                                res = authenticated_supabase_client.storage.from_(bucket_name).upload(filename, data.getvalue(), {"content-type": file.content_type})
-                            
-                            # Supabase upload response is usually a dictionary on success with 'Key' or 'path', or raises exception on error
-                            # Check if res is a dictionary and contains an error key (though client library usually raises exceptions for errors)
-                            if isinstance(res, dict) and res.get('error'):
-                                upload_error = res['error'].get('message', 'Unknown Supabase upload error')
-                                current_app.logger.error(f"Supabase upload error for {filename}: {upload_error}")
-                                raise Exception(upload_error)
-                            
-                            # Get public URL
-                            public_url_response = authenticated_supabase_client.storage.from_(bucket_name).get_public_url(filename)
-                            
-                            image_url = public_url_response
-                            uploaded_image_urls.append(image_url)
-                        except Exception as e:
-                            flash(f'Failed to upload image to Supabase: {str(e)}', 'error')
-                            current_app.logger.error(f"Supabase upload exception: {e}")
-                            # Optionally, skip this image and continue or return early
-                            continue
-
-                        # file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                        # file.save(file_path)
-                        # image_url = f"/static/uploads/{filename}"
-                        
-                        product_image = ProductImage(
-                            image_url=image_url,
-                            is_primary=(i == 0) # Set the first image as primary
-                        )
-                        product.product_images.append(product_image)
+                for i, image_url, error in _upload_product_images(authenticated_supabase_client, files):
+                    if error:
+                        flash(f'Failed to upload image to Supabase: {str(error)}', 'error')
+                        continue
+                    uploaded_image_urls.append(image_url)
+
+                    product_image = ProductImage(
+                        image_url=image_url,
+                        is_primary=(i == 0) # Set the first image as primary
+                    )
+                    product.product_images.append(product_image)
 
                 if uploaded_image_urls:
                     product.image_url = uploaded_image_urls[0] # Set the primary image URL in the Product model
             
             db.session.add(product)
+            adjust_category_counts({product.category_id: 1})
             db.session.commit()
+            invalidate_catalog_fingerprint()
             flash('Product added successfully!', 'success')
             return redirect(url_for('main.super_admin_products'))
             
@@ -607,6 +652,55 @@ def add_product():
     
     return render_template('super_admin/add_product.html', categories=categories)
 
+@main_bp.route('/super-admin/import-products', methods=['GET', 'POST'])
+@login_required
+@super_admin_required
+def import_products():
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV or JSONL file to import.', 'error')
+            return redirect(url_for('main.import_products'))
+        fmt = request.form.get('format') or catalog_io.format_for(upload.filename)
+        if fmt not in catalog_io.FORMATS:
+            flash('Unsupported file format.', 'error')
+            return redirect(url_for('main.import_products'))
+        try:
+            # Rows are read from the upload as they are parsed, and each chunk is committed on its own
+            result = catalog_io.import_products(upload.stream, fmt, current_user.id,
+                                                chunk_size=current_app.config['IMPORT_CHUNK_SIZE'],
+                                                dry_run=bool(request.form.get('dry_run')))
+        except (UnicodeDecodeError, csv.Error) as e:
+            db.session.rollback()
+            flash(f'Could not read the file: {str(e)}', 'error')
+            return redirect(url_for('main.import_products'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Import stopped: {str(e)}. Rows before the failing chunk were saved.', 'error')
+            return redirect(url_for('main.import_products'))
+        if result.dry_run:
+            flash(f'Dry run: {result.imported} of {result.rows} rows are valid. Nothing was saved.', 'info')
+        else:
+            flash(f'Imported {result.imported} of {result.rows} products.', 'success' if not result.failed else 'warning')
+
+    return render_template('super_admin/import_products.html', result=result, columns=catalog_io.COLUMNS,
+                           categories=current_user.categories)
+
+@main_bp.route('/super-admin/export-products')
+@login_required
+@super_admin_required
+def export_products():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in catalog_io.FORMATS:
+        fmt = 'csv'
+    # Streamed a chunk of products at a time, so a 50k-product catalogue is never held in memory
+    chunks = stream_with_context(catalog_io.export_products(current_user.id, fmt,
+                                                            chunk_size=current_app.config['IMPORT_CHUNK_SIZE']))
+    response = current_app.response_class(chunks, mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    response.headers["Content-Disposition"] = f"attachment; filename=products.{fmt}"
+    return response
+
 @main_bp.route('/super-admin/edit-product/<string:product_id>', methods=['GET', 'POST'])
 @login_required
 @super_admin_required
@@ -615,11 +709,12 @@ def edit_product(product_id):
     if not authenticated_supabase_client:
         return redirect(url_for('auth.login')) # Redirect to login if no JWT
 
-    product = Product.query.filter_by(id=product_id, super_admin_id=current_user.id).first_or_404()
+    product = Product.query.filter_by(id=product_id, super_admin_id=current_user.id, is_active=True).first_or_404()
     categories = current_user.categories # Fetch only categories assigned to the current super admin
     
     if request.method == 'POST':
         try:
+            old_prices = (product.price, product.original_price)
             product.name = request.form.get('name')
             product.description = request.form.get('description')
             product.price = float(request.form.get('price'))
@@ -631,55 +726,36 @@ def edit_product(product_id):
                 flash('Selected category is not assigned to you.', 'error')
                 return redirect(url_for('main.edit_product', product_id=product.id))
             
+            if new_category_id != product.category_id:
+                adjust_category_counts({product.category_id: -1, new_category_id: 1})
             product.category_id = new_category_id
             product.original_price = float(request.form.get('original_price')) if request.form.get('original_price') else None
             product.brand = request.form.get('brand')
             product.dimensions = request.form.get('dimensions')
             product.ratings = float(request.form.get('ratings')) if request.form.get('ratings') else 0.0
             product.num_ratings = int(request.form.get('num_ratings')) if request.form.get('num_ratings') else 0
-            product.sales_count = int(request.form.get('sales_count')) if request.form.get('sales_count') else 0
 
             # Handle multiple image uploads for existing product
             files = request.files.getlist('images')
             if files:
-                for i, file in enumerate(files):
-                    if file and file.filename and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{filename}"
-                        
-                        # Upload to Supabase Storage
-                        try:
-                            bucket_name = current_app.config["SUPABASE_PRODUCTS_BUCKET"]
-                            with io.BytesIO(file.read()) as data:
-                                res = authenticated_supabase_client.storage.from_(bucket_name).upload(filename, data.getvalue(), {"content-type": file.content_type})
-                                    
-                            if isinstance(res, dict) and res.get('error'):
-                                upload_error = res['error'].get('message', 'Unknown Supabase upload error during edit')
-                                current_app.logger.error(f"Supabase upload error for {filename} during edit: {upload_error}")
-                                raise Exception(upload_error)
-
-                            # Get public URL
-                            public_url_response = authenticated_supabase_client.storage.from_(bucket_name).get_public_url(filename)
-                            image_url = public_url_response
-                        except Exception as e:
-                            flash(f'Failed to upload image to Supabase: {str(e)}', 'error')
-                            current_app.logger.error(f"Supabase upload exception during edit: {str(e)}")
-                            continue
-
-                        # file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                        # file.save(file_path)
-                        # image_url = f"/static/uploads/{filename}"
-                        
-                        product_image = ProductImage(
-                            product_id=product.id,
-                            image_url=image_url,
-                            is_primary=(len(product.product_images) == 0 and i == 0) # Set as primary if no images exist and it's the first upload
-                        )
-                        db.session.add(product_image)
-                        if len(product.product_images) == 0 and i == 0:
-                            product.image_url = image_url # Update primary image if none existed
-
-            
+                for i, image_url, error in _upload_product_images(authenticated_supabase_client, files):
+                    if error:
+                        flash(f'Failed to upload image to Supabase: {str(error)}', 'error')
+                        continue
+
+                    product_image = ProductImage(
+                        product_id=product.id,
+                        image_url=image_url,
+                        is_primary=(len(product.product_images) == 0 and i == 0) # Set as primary if no images exist and it's the first upload
+                    )
+                    db.session.add(product_image)
+                    if len(product.product_images) == 0 and i == 0:
+                        product.image_url = image_url # Update primary image if none existed
+
+            new_prices = tuple(None if price is None else Decimal(str(price)) for price in (product.price, product.original_price))
+            if new_prices != old_prices:
+                bump_cart_versions(product_id=product.id) # Checkout pages showing the old price must be confirmed again
+            bump_product_versions([product.id])
             db.session.commit()
             flash('Product updated successfully!', 'success')
             return redirect(url_for('main.super_admin_products')) # Redirect to products list after successful update
@@ -693,12 +769,17 @@ def edit_product(product_id):
 @login_required
 @super_admin_required
 def delete_product(product_id):
-    product = Product.query.filter_by(id=product_id, super_admin_id=current_user.id).first_or_404()
+    product = Product.query.filter_by(id=product_id, super_admin_id=current_user.id, is_active=True).first_or_404()
     print(f"Attempting to delete product with ID: {product.id}") # Log product ID
     
     try:
-        db.session.delete(product)
-        db.session.flush() # Added to ensure changes are pushed to the database
+        # Soft delete: order lines keep pointing at the product, so order history and revenue stay intact
+        product.is_active = False
+        adjust_category_counts({product.category_id: -1})
+        bump_cart_versions(product_id=product.id)
+        Cart.query.filter_by(product_id=product.id).delete()
+        Wishlist.query.filter_by(product_id=product.id).delete()
+        bump_product_versions([product.id])
         db.session.commit()
         print(f"Product with ID: {product.id} deleted successfully.") # Log successful deletion
         flash('Product deleted successfully!', 'success')
@@ -712,44 +793,91 @@ def delete_product(product_id):
 @main_bp.route('/super-admin/orders')
 @login_required
 @super_admin_required
+@read_replica
 def super_admin_orders():
-    # Get orders containing super admin's products
-    orders = db.session.query(Order).join(OrderItem).join(Product).filter(
-        Product.super_admin_id == current_user.id
-    ).distinct().order_by(desc(Order.created_at)).all()
+    status = request.args.get('status')
+    if status not in ORDER_STATUSES:
+        status = None
+    orders, next_cursor = order_page('seller', current_user.id, status=status, before=request.args.get('before'))
+    counts = order_counts('seller', current_user.id)
     
-    return render_template('super_admin/orders.html', orders=orders)
+    return render_long_page('super_admin/orders.html', orders=orders, counts=counts, status=status,
+                            statuses=ORDER_STATUSES, transitions=order_workflow.TRANSITIONS, next_cursor=next_cursor)
 
 @main_bp.route('/super-admin/update-order-status/<int:order_id>')
 @login_required
 @super_admin_required
 def update_order_status(order_id):
     status = request.args.get('status')
-    order = Order.query.get_or_404(order_id)
+    if not order_workflow.sources(status):
+        flash('Invalid status.', 'error')
+        return redirect(url_for('main.super_admin_orders'))
     
-    if status in ['processing', 'shipped', 'delivered']:
-        order.status = status
-        db.session.commit()
+    result = order_workflow.transition(status, current_user.id, order_ids=[order_id], super_admin_id=current_user.id)
+    db.session.commit()
+    if result.changed:
+        order_workflow.after_commit(result)
+        stick_to_primary()
         flash('Order status updated successfully!', 'success')
     else:
-        flash('Invalid status.', 'error')
+        flash(f'Order #{order_id} cannot be marked as {status}.', 'error')
     
     return redirect(url_for('main.super_admin_orders'))
 
+@main_bp.route('/super-admin/orders/status', methods=['POST'])
+@login_required
+@super_admin_required
+def bulk_update_order_status():
+    """Move the ticked orders, or every order in from_status, to status in one transaction"""
+    status = request.form.get('status')
+    from_status = request.form.get('from_status')
+    back = redirect(url_for('main.super_admin_orders', status=from_status or None))
+    if not order_workflow.sources(status):
+        flash('Invalid status.', 'error')
+        return back
+    
+    if request.form.get('scope') == 'all':
+        if status not in order_workflow.targets(from_status):
+            flash(f'{from_status.title() if from_status else "These"} orders cannot be marked as {status}.', 'error')
+            return back
+        result = order_workflow.transition(status, current_user.id, super_admin_id=current_user.id,
+                                           from_statuses=[from_status])
+    else:
+        order_ids = request.form.getlist('order_ids', type=int)
+        if not order_ids:
+            flash('Select at least one order.', 'error')
+            return back
+        result = order_workflow.transition(status, current_user.id, order_ids=order_ids[:current_app.config['ORDER_BULK_LIMIT']],
+                                           super_admin_id=current_user.id)
+    db.session.commit()
+    order_workflow.after_commit(result)
+    stick_to_primary()
+    
+    if result.changed:
+        flash(f'{len(result.changed)} order(s) marked as {status}.', 'success')
+    if result.skipped:
+        flash(f'{len(result.skipped)} order(s) could not be marked as {status}: '
+              + ', '.join(f'#{order_id}' for order_id in result.skipped[:20]), 'warning')
+    elif not result.changed:
+        flash('No orders were updated.', 'info')
+    return back
+
 # Customer Routes
 @main_bp.route('/products')
+@read_replica
+@conditional_page(_catalog_page_etag)
 def products():
     category_id = request.args.get('category')
     search = request.args.get('search')
     sort_by = request.args.get('sort_by') # Get the sort_by parameter
     
-    query = Product.query.filter_by(is_active=True)
+    query = card_query().where(Product.is_active == True)
     
     if category_id:
-        query = query.filter_by(category_id=category_id)
+        query = query.where(Product.category_id == category_id)
     
     if search:
-        query = query.filter(Product.name.contains(search))
+        query = query.where(Product.name.contains(search))
         
     # If no category or search is specified, order randomly
     if not category_id and not search:
@@ -765,56 +893,75 @@ def products():
     elif sort_by == 'name_desc':
         query = query.order_by(Product.name.desc())
     
-    products = query.limit(20).all() # Limit the number of products fetched
-    categories = Category.query.all()
+    if sort_by == 'trending' and not search:
+        # Served from the cached top-N list, which reads the (category_id, sales_7d) index
+        trending_ids = trending(int(category_id) if category_id and category_id.isdigit() else None, 20)
+        ranks = {product_id: rank for rank, product_id in enumerate(trending_ids)}
+        products = sorted(load_cards(query.where(Product.id.in_(trending_ids))), key=lambda card: ranks[card.id])
+    else:
+        if sort_by == 'trending':
+            query = query.order_by(desc(Product.sales_7d))
+        products = load_cards(query.limit(20)) # Limit the number of products fetched
 
-    user_wishlist_ids = []
+    user_wishlist_ids = set()
     if current_user.is_authenticated and current_user.role == 'customer':
-        user_wishlist_ids = [item.product_id for item in Wishlist.query.filter_by(user_id=current_user.id).all()]
+        user_wishlist_ids = set(db.session.scalars(db.select(Wishlist.product_id).filter_by(user_id=current_user.id)))
     
     return render_template('customer/products.html', 
                            products=products, 
-                           categories=categories,
                            user_wishlist_ids=user_wishlist_ids)
 
 @main_bp.route('/product/<int:product_id>')
+@read_replica
+@conditional_page(_product_page_etag)
 def product_detail(product_id):
-    product = Product.query.filter_by(id=product_id, is_active=True).first_or_404()
-    return render_template('customer/product_detail.html', product=product)
+    product = get_product_detail(product_id)
+    return render_template('customer/product_detail.html', product=product,
+                           also_bought=recommended_cards(product_id, limit=4))
 
 @main_bp.route('/add-to-cart/<int:product_id>')
-@login_required
 def add_to_cart(product_id):
-    product = Product.query.filter_by(id=product_id, is_active=True).first_or_404()
-    
-    # Check if item already in cart
-    cart_item = Cart.query.filter_by(user_id=current_user.id, product_id=product_id).first()
-    
-    if cart_item:
-        cart_item.quantity += 1
-    else:
-        cart_item = Cart(user_id=current_user.id, product_id=product_id, quantity=1)
-        db.session.add(cart_item)
+    if not current_user.is_authenticated:
+        # Guests' carts live in the session cookie until they log in
+        if not guest_cart.add({product_id: 1}):
+            if not active_quantities({product_id: 1}):
+                abort(404)
+            flash(f'Your cart is full. Log in to add more than {guest_cart.MAX_LINES} products.', 'warning')
+            return redirect(url_for('main.product_detail', product_id=product_id))
+        flash('Product added to cart!', 'success')
+        return redirect(url_for('main.product_detail', product_id=product_id))
+
+    # One upsert: a second click adds to the same line
+    if not add_items(current_user.id, {product_id: 1}):
+        abort(404)
     
     db.session.commit()
     flash('Product added to cart!', 'success')
     return redirect(url_for('main.product_detail', product_id=product_id))
 
 @main_bp.route('/cart')
-@login_required
 def cart():
-    cart_items = Cart.query.filter_by(user_id=current_user.id).all()
-    total = sum(item.product.price * item.quantity for item in cart_items)
-    return render_template('customer/cart.html', cart_items=cart_items, total=total)
+    if current_user.is_authenticated:
+        cart = cart_snapshot(current_user.id)
+    else:
+        cart = guest_snapshot(guest_cart.quantities())
+    also_bought = cart_recommendations(cart.product_ids, limit=4)
+    return render_template('customer/cart.html', cart=cart, also_bought=also_bought)
 
 @main_bp.route('/update-cart/<int:cart_id>')
-@login_required
 def update_cart(cart_id):
     action = request.args.get('action')
+    if not current_user.is_authenticated:
+        # A guest cart's lines are identified by product id
+        quantity = guest_cart.quantities().get(cart_id, 0)
+        quantity = {'increase': quantity + 1, 'decrease': quantity - 1, 'remove': 0}.get(action, quantity)
+        guest_cart.set_quantities({cart_id: quantity})
+        return redirect(url_for('main.cart'))
+
     cart_item = Cart.query.filter_by(id=cart_id, user_id=current_user.id).first_or_404()
     
     if action == 'increase':
-        cart_item.quantity += 1
+        cart_item.quantity = min(cart_item.quantity + 1, MAX_QUANTITY)
     elif action == 'decrease':
         if cart_item.quantity > 1:
             cart_item.quantity -= 1
@@ -822,6 +969,7 @@ def update_cart(cart_id):
             db.session.delete(cart_item)
     elif action == 'remove':
         db.session.delete(cart_item)
+    bump_cart_versions([current_user.id])
     
     db.session.commit()
     return redirect(url_for('main.cart'))
@@ -843,13 +991,14 @@ def add_to_wishlist(product_id):
         db.session.add(wishlist_item)
         db.session.commit()
         flash('Product added to wishlist!', 'success')
+    stick_to_primary() # The products page shows wishlist hearts
     
     return redirect(url_for('main.products')) # Redirect back to the products page
 
 @main_bp.route('/wishlist')
 @login_required
 def wishlist():
-    wishlist_items = Wishlist.query.filter_by(user_id=current_user.id).all()
+    wishlist_items = wishlist_cards(current_user.id)
     return render_template('customer/wishlist.html', wishlist_items=wishlist_items)
 
 @main_bp.route('/remove-from-wishlist/<int:wishlist_id>')
@@ -861,25 +1010,40 @@ def remove_from_wishlist(wishlist_id):
     flash('Product removed from wishlist!', 'success')
     return redirect(url_for('main.wishlist'))
 
+@main_bp.route('/wishlist/move-to-cart', methods=['POST'])
+@login_required
+def move_wishlist_to_cart():
+    moved = move_wishlist_items(current_user.id)
+    db.session.commit()
+    if moved:
+        flash(f'Moved {moved} products from your wishlist to your cart.', 'success')
+        return redirect(url_for('main.cart'))
+    flash('There was nothing in your wishlist to move.', 'info')
+    return redirect(url_for('main.wishlist'))
+
 @main_bp.route('/checkout')
 @login_required
 def checkout():
-    cart_items = Cart.query.filter_by(user_id=current_user.id).all()
+    cart = cart_snapshot(current_user.id)
     
-    if not cart_items:
+    if not cart.lines:
         flash('Your cart is empty!', 'error')
         return redirect(url_for('main.cart'))
     
-    total = sum(item.product.price * item.quantity for item in cart_items)
+    remember(cart) # place_order reuses it if the cart is unchanged
     addresses = Address.query.filter_by(user_id=current_user.id).all()
-    return render_template('customer/checkout.html', cart_items=cart_items, total=total, addresses=addresses)
+    return render_template('customer/checkout.html', cart=cart, addresses=addresses)
 
 @main_bp.route('/place-order', methods=['POST'])
 @login_required
 def place_order():
-    cart_items = Cart.query.filter_by(user_id=current_user.id).all()
+    # The cart as priced on the checkout or payment page, if it has not changed since
+    cart = confirmed_snapshot(current_user, request.form.get('cart_version', type=int))
+    if cart is None:
+        flash('Your cart changed during checkout. Please review it and place your order again.', 'warning')
+        return redirect(url_for('main.checkout'))
     
-    if not cart_items:
+    if not cart.lines:
         flash('Your cart is empty!', 'error')
         return redirect(url_for('main.cart'))
     
@@ -908,7 +1072,7 @@ def place_order():
         flash('Please fill in all required fields.', 'error')
         return redirect(url_for('main.checkout'))
     
-    total = sum(item.product.price * item.quantity for item in cart_items)
+    total = cart.total
     
     # Create order
     order = Order(
@@ -925,18 +1089,22 @@ def place_order():
     db.session.add(order)
     db.session.flush()  # Get order ID
     
-    # Create order items
-    for cart_item in cart_items:
-        order_item = OrderItem(
-            order_id=order.id,
-            product_id=cart_item.product_id,
-            quantity=cart_item.quantity,
-            price=cart_item.product.price
-        )
-        db.session.add(order_item)
-        
-        # Update product stock
-        cart_item.product.stock -= cart_item.quantity
+    # Create order items and update product stock, one statement each for all lines
+    db.session.execute(db.insert(OrderItem), [
+        {'order_id': order.id, 'product_id': line.product_id, 'quantity': line.quantity, 'price': line.price}
+        for line in cart.lines
+    ])
+    products = Product.__table__
+    db.session.execute(
+        db.update(products).where(products.c.id == bindparam('product_id'))
+        .values(stock=products.c.stock - bindparam('quantity')),
+        [{'product_id': line.product_id, 'quantity': line.quantity} for line in cart.lines]
+    )
+    sold = {}
+    for line in cart.lines:
+        sold[line.product_id] = sold.get(line.product_id, 0) + line.quantity
+    record_sales(sold) # Real "bought in past month" and trending counters
+    bump_product_versions(sold)
     
     # Create payment record
     payment = Payment(
@@ -966,8 +1134,11 @@ def place_order():
 
     # Clear cart
     Cart.query.filter_by(user_id=current_user.id).delete()
+    bump_cart_versions([current_user.id])
     
     db.session.commit()
+    invalidate_order_counts([order.id])
+    stick_to_primary() # The redirect to /orders must see the new order
     
     flash('Order placed successfully!', 'success')
     
@@ -975,11 +1146,11 @@ def place_order():
     try:
         # Prepare order items for the email template
         detailed_order_items = []
-        for item in cart_items:
+        for line in cart.lines:
             detailed_order_items.append({
-                'product_name': item.product.name,
-                'quantity': item.quantity,
-                'price': float(item.product.price)
+                'product_name': line.name,
+                'quantity': line.quantity,
+                'price': float(line.price)
             })
 
         # Get current year for the template
@@ -1004,10 +1175,9 @@ def place_order():
             html=html_body, # Send as HTML
             sender=current_app.config['MAIL_DEFAULT_SENDER']
         )
-        mail.send(msg)
-        current_app.logger.info(f"Flask-Mail confirmation email sent to {current_user.email} for order {order.id}")
+        tasks.submit(_send_mail, msg) # The SMTP exchange happens after the redirect is sent
     except Exception as e:
-        current_app.logger.error(f"Error sending Flask-Mail confirmation email: {e}")
+        current_app.logger.error(f"Error preparing Flask-Mail confirmation email: {e}")
 
     return redirect(url_for('main.orders'))
 
@@ -1016,24 +1186,33 @@ def place_order():
 @login_required
 def razorpay_payment():
     """Dummy Razorpay step: show a confirmation page and then forward to place_order with same form data."""
-    # Recompute total from cart to prevent tampering
-    cart_items = Cart.query.filter_by(user_id=current_user.id).all()
-    if not cart_items:
+    # Total from the cart as priced on the checkout page, never from the form, to prevent tampering
+    cart = confirmed_snapshot(current_user, request.form.get('cart_version', type=int))
+    if cart is None:
+        flash('Your cart changed during checkout. Please review it and place your order again.', 'warning')
+        return redirect(url_for('main.checkout'))
+    if not cart.lines:
         flash('Your cart is empty!', 'error')
         return redirect(url_for('main.cart'))
+    remember(cart)
 
-    total = sum(item.product.price * item.quantity for item in cart_items)
-
-    # Keep the original form fields to forward to place_order
+    # Keep the original form fields to forward to place_order, cart_version included
     original_fields = request.form.to_dict(flat=True)
+    original_fields['cart_version'] = cart.version
 
-    return render_template('customer/razorpay.html', total=total, original_fields=original_fields)
+    return render_template('customer/razorpay.html', total=cart.total, original_fields=original_fields)
 
 @main_bp.route('/orders')
 @login_required
+@read_replica
 def orders():
-    user_orders = Order.query.filter_by(customer_id=current_user.id).order_by(desc(Order.created_at)).all()
-    return render_template('customer/orders.html', orders=user_orders)
+    status = request.args.get('status')
+    if status not in ORDER_STATUSES:
+        status = None
+    user_orders, next_cursor = order_page('customer', current_user.id, status=status, before=request.args.get('before'))
+    counts = order_counts('customer', current_user.id)
+    return render_long_page('customer/orders.html', orders=user_orders, counts=counts, status=status,
+                            statuses=ORDER_STATUSES, next_cursor=next_cursor)
 
 @main_bp.route('/profile')
 @login_required
@@ -1071,22 +1250,19 @@ def update_profile():
 @main_bp.route('/cancel-order/<int:order_id>')
 @login_required
 def cancel_order(order_id):
-    order = Order.query.filter_by(id=order_id, customer_id=current_user.id).first_or_404()
-    
-    if order.status not in ['pending', 'processing']:
-        flash('Order cannot be cancelled at this stage.', 'error')
-        return redirect(url_for('main.orders'))
+    if not db.session.scalar(db.select(Order.id).where(Order.id == order_id, Order.customer_id == current_user.id)):
+        abort(404)
     
     try:
-        order.status = 'cancelled'
-        
-        # Restore product stock
-        for item in order.order_items:
-            product = Product.query.get(item.product_id)
-            if product:
-                product.stock += item.quantity
-        
+        result = order_workflow.transition('cancelled', current_user.id, order_ids=[order_id], customer_id=current_user.id,
+                                           from_statuses=order_workflow.CUSTOMER_CANCELLABLE)
+        if not result.changed:
+            db.session.rollback()
+            flash('Order cannot be cancelled at this stage.', 'error')
+            return redirect(url_for('main.orders'))
         db.session.commit()
+        order_workflow.after_commit(result)
+        stick_to_primary()
         flash('Order cancelled successfully!', 'success')
     except Exception as e:
         db.session.rollback()
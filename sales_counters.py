@@ -0,0 +1,111 @@
+"""Real "bought in past month" and trending figures.
+
+Checkout adds each line's quantity to a per-day bucket (product_sales_buckets) and to the product's
+running counters: Product.sales_count (last 30 days) and Product.sales_7d (last 7 days). Once a day
+`flask --app main roll-sales-counters` recomputes the counters from the buckets, which drops the days
+that left each window, and deletes buckets older than 30 days. Cancelling an order takes its
+quantities back out of the bucket of the day it was placed.
+
+Trending lists read the (category_id, sales_7d) index, so a category's top N is an index range scan
+however many products it holds, and are cached for TRENDING_TTL seconds.
+"""
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import bindparam, case, desc, func
+from app import db
+from cache import SingleFlightCache
+from models import Product, ProductSalesBucket
+from archive import accumulate
+from catalog import bump_product_versions
+
+WINDOW_DAYS = {'sales_7d': 7, 'sales_count': 30}
+
+# category id (None for the whole catalogue) -> (expires_at, [product ids])
+trending_cache = SingleFlightCache(1024)
+
+def _today():
+    return datetime.utcnow().date()
+
+def record_sales(quantities, day=None):
+    """Add {product_id: units} sold on day (default today) to the buckets and counters. Negative units
+    take a cancelled sale back out. Part of the caller's transaction."""
+    day = day or _today()
+    quantities = {product_id: units for product_id, units in Counter(quantities).items() if units}
+    if not quantities:
+        return
+    accumulate(ProductSalesBucket, ['day', 'product_id'],
+               [{'day': day, 'product_id': product_id, 'quantity': units} for product_id, units in quantities.items()])
+    age = (_today() - day).days
+    windows = {name: days for name, days in WINDOW_DAYS.items() if age < days}
+    if not windows:
+        return
+    table = Product.__table__
+    db.session.execute(
+        db.update(table).where(table.c.id == bindparam('product_id'))
+        .values({name: case((func.coalesce(table.c[name], 0) + bindparam('units') < 0, 0),
+                            else_=func.coalesce(table.c[name], 0) + bindparam('units'))
+                 for name in windows}),
+        [{'product_id': product_id, 'units': units} for product_id, units in quantities.items()]
+    )
+
+def roll_windows(today=None):
+    """Recompute every product's counters from the buckets and prune old buckets. Returns the number of
+    products whose counters changed."""
+    today = today or _today()
+    first_days = {name: today - timedelta(days=days - 1) for name, days in WINDOW_DAYS.items()}
+    oldest = min(first_days.values())
+    db.session.execute(db.delete(ProductSalesBucket).where(ProductSalesBucket.day < oldest))
+
+    sums = db.select(ProductSalesBucket.product_id, *[
+        func.sum(case((ProductSalesBucket.day >= first_day, ProductSalesBucket.quantity), else_=0)).label(name)
+        for name, first_day in first_days.items()
+    ]).group_by(ProductSalesBucket.product_id)
+    wanted = {row.product_id: row for row in db.session.execute(sums)}
+    current = db.session.execute(
+        db.select(Product.id, *[Product.__table__.c[name] for name in WINDOW_DAYS])
+        .where(db.or_(Product.id.in_(db.select(ProductSalesBucket.product_id)),
+                      *[Product.__table__.c[name] != 0 for name in WINDOW_DAYS]))
+    ).all()
+
+    updates = []
+    for row in current:
+        values = {name: max(int(getattr(wanted[row.id], name) or 0), 0) if row.id in wanted else 0 for name in WINDOW_DAYS}
+        if any((getattr(row, name) or 0) != value for name, value in values.items()):
+            updates.append({'product_id': row.id, **{f'new_{name}': value for name, value in values.items()}})
+    if updates:
+        table = Product.__table__
+        db.session.execute(
+            db.update(table).where(table.c.id == bindparam('product_id'))
+            .values({name: bindparam(f'new_{name}') for name in WINDOW_DAYS}),
+            updates
+        )
+        bump_product_versions([update['product_id'] for update in updates])
+    return len(updates)
+
+def _top_products(category_id, limit):
+    query = db.select(Product.id).where(Product.is_active == True, Product.sales_7d > 0)
+    if category_id is not None:
+        query = query.where(Product.category_id == category_id)
+    return db.session.scalars(query.order_by(desc(Product.sales_7d), Product.id).limit(limit)).all()
+
+def trending(category_id=None, limit=20):
+    """Ids of the best sellers of the last 7 days, best first, at most TRENDING_TTL seconds old"""
+    key = (category_id, limit)
+    cached = trending_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    trending_cache.delete(key)
+    ttl = current_app.config['TRENDING_TTL']
+    return trending_cache.get_or_build(key, lambda: (time.monotonic() + ttl, _top_products(category_id, limit)))[1]
+
+def init_app(app):
+    @app.cli.command('roll-sales-counters')
+    def roll_sales_counters_command():
+        """Move the 7 and 30 day sales windows forward. Run daily."""
+        changed = roll_windows()
+        db.session.commit()
+        trending_cache.clear()
+        click.echo(f'Sales counters updated for {changed} products.')
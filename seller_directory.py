@@ -0,0 +1,76 @@
+"""The admin's list of super admins, with each seller's categories, product count and revenue.
+
+One query returns a whole page: the per-seller figures are correlated subqueries on indexed
+columns (products.super_admin_id, order_items.product_id, the daily_seller_sales key), so they are
+evaluated only for the sellers on the page. A second query counts the matches for pagination.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import func, or_
+from app import db
+from models import User, Product, OrderItem, Category, DailySellerSales, super_admin_categories
+
+# Category names are joined into one column per seller; this never appears in a name
+_SEPARATOR = '\x1f'
+
+@dataclass(frozen=True, slots=True)
+class SellerSummary:
+    id: str
+    name: str
+    email: str
+    unique_code: str
+    is_active: bool
+    created_at: datetime
+    categories: tuple
+    product_count: int
+    revenue: Decimal
+
+def _joined_names(column):
+    if db.engine.dialect.name == 'postgresql':
+        return func.string_agg(column, _SEPARATOR)
+    return func.group_concat(column, _SEPARATOR)
+
+def _summary_query():
+    categories = db.select(_joined_names(Category.name)) \
+        .join(super_admin_categories, super_admin_categories.c.category_id == Category.id) \
+        .where(super_admin_categories.c.user_id == User.id).scalar_subquery()
+    product_count = db.select(func.count(Product.id)) \
+        .where(Product.super_admin_id == User.id, Product.is_active == True).scalar_subquery()
+    live_revenue = db.select(func.sum(OrderItem.price * OrderItem.quantity)) \
+        .join(Product, OrderItem.product_id == Product.id) \
+        .where(Product.super_admin_id == User.id).scalar_subquery()
+    archived_revenue = db.select(func.sum(DailySellerSales.revenue)) \
+        .where(DailySellerSales.super_admin_id == User.id).scalar_subquery()
+    return db.select(User.id, User.name, User.email, User.unique_code, User.is_active, User.created_at,
+                     categories.label('categories'), product_count.label('product_count'),
+                     (func.coalesce(live_revenue, 0) + func.coalesce(archived_revenue, 0)).label('revenue'))
+
+def _summary(row):
+    return SellerSummary(
+        id=row.id, name=row.name, email=row.email, unique_code=row.unique_code, is_active=row.is_active,
+        created_at=row.created_at, categories=tuple(sorted(row.categories.split(_SEPARATOR))) if row.categories else (),
+        product_count=row.product_count or 0, revenue=Decimal(row.revenue or 0),
+    )
+
+def _search_filter(search):
+    escaped = search.strip().lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    pattern = f"%{escaped}%"
+    return or_(func.lower(User.name).like(pattern, escape='\\'), func.lower(User.email).like(pattern, escape='\\'))
+
+def seller_page(search=None, page=1, per_page=50):
+    """(SellerSummary list for one page, total matching sellers), ordered by name"""
+    criteria = [User.role == 'super_admin']
+    if search and search.strip():
+        criteria.append(_search_filter(search))
+    total = db.session.scalar(db.select(func.count(User.id)).where(*criteria))
+    rows = db.session.execute(
+        _summary_query().where(*criteria).order_by(User.name, User.id)
+        .limit(per_page).offset((max(page, 1) - 1) * per_page)
+    ).all()
+    return [_summary(row) for row in rows], total
+
+def seller_summary(user_id):
+    """SellerSummary for one super admin, or None"""
+    row = db.session.execute(_summary_query().where(User.id == user_id, User.role == 'super_admin')).first()
+    return _summary(row) if row else None
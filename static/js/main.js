@@ -11,6 +11,7 @@ function initializeApp() {
     initializeFormValidation();
     initializeImagePreviews();
     initializeQuantityControls();
+    initializeCartApi();
     initializeSearchFeatures();
     initializeNotifications();
     initializeCustomSlider(); // Initialize the custom slider
@@ -120,11 +121,123 @@ function initializeQuantityControls() {
     });
 }
 
-// Update Cart Quantity (if needed for AJAX updates)
+// Update Cart Quantity through the JSON API
 function updateCartQuantity(cartId, quantity) {
-    // For now, this redirects to the backend route
-    // In a future enhancement, this could use AJAX
-    console.log(`Updating cart item ${cartId} to quantity ${quantity}`);
+    queueCartUpdate(parseInt(cartId), parseInt(quantity));
+}
+
+// Cart changes are batched: clicks within CART_BATCH_DELAY ms go to the server as one PATCH /api/cart
+const CART_BATCH_DELAY = 300;
+let pendingCartUpdates = {};
+let cartBatchTimer = null;
+
+function initializeCartApi() {
+    document.querySelectorAll('[data-cart-line] [data-cart-action]').forEach(function(link) {
+        link.addEventListener('click', function(event) {
+            const line = this.closest('[data-cart-line]');
+            const action = this.dataset.cartAction;
+            if (action === 'remove' && !confirm('Remove this item from cart?')) {
+                event.preventDefault();
+                return;
+            }
+            if (!window.fetch) {
+                return; // Fall back to the plain link
+            }
+            event.preventDefault();
+            let quantity = parseInt(line.dataset.quantity);
+            if (action === 'increase') {
+                quantity += 1;
+            } else if (action === 'decrease') {
+                quantity -= 1;
+            } else {
+                quantity = 0;
+            }
+            line.dataset.quantity = quantity;
+            line.querySelector('[data-cart-quantity]').textContent = quantity;
+            queueCartUpdate(parseInt(line.dataset.cartLine), quantity);
+        });
+    });
+}
+
+function queueCartUpdate(cartId, quantity) {
+    pendingCartUpdates[cartId] = quantity;
+    clearTimeout(cartBatchTimer);
+    cartBatchTimer = setTimeout(flushCartUpdates, CART_BATCH_DELAY);
+}
+
+function flushCartUpdates() {
+    const items = Object.keys(pendingCartUpdates).map(function(id) {
+        return {id: parseInt(id), quantity: pendingCartUpdates[id]};
+    });
+    pendingCartUpdates = {};
+    if (!items.length) {
+        return;
+    }
+    fetch('/api/cart', {
+        method: 'PATCH',
+        headers: {'Content-Type': 'application/json'},
+        credentials: 'same-origin',
+        body: JSON.stringify({items: items})
+    })
+    .then(function(response) {
+        if (!response.ok) {
+            throw new Error(`Cart update failed (${response.status})`);
+        }
+        return response.json();
+    })
+    .then(renderCart)
+    .catch(function(err) {
+        console.error(err);
+        window.location.reload(); // Show the server's view of the cart
+    });
+}
+
+function renderCart(cart) {
+    if (!cart.count) {
+        window.location.reload(); // Let the server render the empty cart state
+        return;
+    }
+    const byId = {};
+    cart.items.forEach(function(item) { byId[item.id] = item; });
+    document.querySelectorAll('[data-cart-line]').forEach(function(line) {
+        const item = byId[line.dataset.cartLine];
+        if (!item) {
+            line.remove();
+            return;
+        }
+        line.dataset.quantity = item.quantity;
+        line.querySelector('[data-cart-quantity]').textContent = item.quantity;
+        line.querySelector('[data-cart-line-total]').textContent = formatRupees(item.line_total);
+    });
+    document.querySelectorAll('[data-cart-count]').forEach(function(el) { el.textContent = cart.count; });
+    document.querySelectorAll('[data-cart-total]').forEach(function(el) { el.textContent = formatRupees(cart.total); });
+    document.querySelectorAll('[data-cart-subtotal]').forEach(function(el) { el.textContent = formatRupees(cart.subtotal); });
+    document.querySelectorAll('[data-cart-discount]').forEach(function(el) { el.textContent = '−' + formatRupees(cart.discount); });
+}
+
+// Toggle a wishlist heart through the JSON API, falling back to the page route
+function toggleWishlist(button, fallbackUrl) {
+    if (!window.fetch) {
+        window.location.href = fallbackUrl;
+        return;
+    }
+    fetch(`/api/wishlist/${button.dataset.productId}/toggle`, {method: 'POST', credentials: 'same-origin'})
+    .then(function(response) {
+        if (!response.ok) {
+            throw new Error(`Wishlist update failed (${response.status})`);
+        }
+        return response.json();
+    })
+    .then(function(result) {
+        const icon = button.querySelector('i');
+        icon.classList.toggle('fas', result.wishlisted);
+        icon.classList.toggle('far', !result.wishlisted);
+        icon.classList.toggle('text-danger', result.wishlisted);
+        showToast(result.wishlisted ? 'Product added to wishlist!' : 'Product removed from wishlist!', 'success');
+    })
+    .catch(function() {
+        window.location.href = fallbackUrl;
+    });
 }
 
 // Search Features
@@ -295,6 +408,10 @@ function hideLoading(overlay) {
 }
 
 // Utility Functions
+function formatRupees(amount) {
+    return '₹' + Number(amount).toFixed(2);
+}
+
 function formatCurrency(amount) {
     return new Intl.NumberFormat('en-US', {
         style: 'currency',
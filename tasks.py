@@ -0,0 +1,27 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+# Shared pool for work that should not hold up the request that triggered it.
+# Threads are started lazily on first submit, so this is safe to create before gunicorn forks.
+executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BACKGROUND_WORKERS', 4)),
+    thread_name_prefix='msr-background'
+)
+
+def submit(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) on the background pool inside an application context.
+
+    Must be called from within a request or app context. Returns the Future.
+    """
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                app.logger.error(f"Background task {getattr(fn, '__name__', fn)} failed: {e}")
+                raise
+
+    return executor.submit(run)
@@ -1,6 +1,8 @@
 from functools import wraps
-from flask import flash, redirect, url_for
+from functools import lru_cache
+from flask import flash, redirect, url_for, current_app
 from flask_login import current_user
+from werkzeug.security import generate_password_hash
 import secrets
 import string
 
@@ -30,3 +32,33 @@ def allowed_file(filename):
     """Check if uploaded file has allowed extension"""
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def hash_password(password):
+    """Hash a password with the configured PASSWORD_HASH_METHOD (e.g. 'scrypt' or 'scrypt:16384:8:1')"""
+    return generate_password_hash(password, method=current_app.config['PASSWORD_HASH_METHOD'])
+
+@lru_cache(maxsize=8)
+def _canonical_hash_method(method):
+    # Werkzeug fills in default cost parameters ('scrypt' -> 'scrypt:32768:8:1'),
+    # so hash a throwaway value once to learn the exact prefix stored hashes will carry
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+def _hash_cost(method):
+    """(algorithm, work factor) of a stored hash's method prefix, e.g. 'scrypt:32768:8:1' -> ('scrypt', 262144)"""
+    parts = method.split(':')
+    try:
+        if parts[0] == 'scrypt':
+            n, r, p = (int(part) for part in parts[1:4])
+            return 'scrypt', n * r * p
+        if parts[0] == 'pbkdf2':
+            return f'pbkdf2:{parts[1]}', int(parts[2])
+    except (ValueError, IndexError):
+        pass
+    return method, 0
+
+def password_needs_rehash(password_hash):
+    """Check if a stored hash uses another algorithm than the configured method, or a lower cost.
+    Hashes stronger than the configured cost are left alone."""
+    stored_algorithm, stored_cost = _hash_cost(password_hash.split('$', 1)[0])
+    algorithm, cost = _hash_cost(_canonical_hash_method(current_app.config['PASSWORD_HASH_METHOD']))
+    return stored_algorithm != algorithm or stored_cost < cost